@@ -4,7 +4,7 @@ from typing import Any, List
 from app.core.auth import get_current_user
 from app.schemas.user import User
 from app.schemas.business_context import BusinessContext, ContextExtractionRequest, ContextExtractionResponse
-from app.services.context_extraction_service import extract_business_context
+from app.services.context_extraction_service import extract_business_context, get_extraction_stats
 from app.schemas.onboarding import OnboardingState
 
 router = APIRouter()
@@ -57,6 +57,18 @@ async def extract_context(
     )
 
 
+@router.get("/extraction-stats",
+         summary="Get Extraction Timings",
+         description="Get the timing of context extractions per mode and stage")
+async def get_context_extraction_stats(
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Get the count, average, maximum and last duration of each extraction stage.
+    """
+    return get_extraction_stats()
+
+
 @router.get("/{business_id}", response_model=BusinessContext,
          summary="Get Business Context",
          description="Get stored business context for a specific business")
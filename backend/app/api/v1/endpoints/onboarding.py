@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status, Query
-from typing import Any, List, Dict, Optional
+from typing import Any, List, Dict, Optional, Set
+import asyncio
 import json
 import logging
 from datetime import datetime
@@ -8,8 +9,16 @@ import uuid
 from app.core.auth import get_current_user, verify_supabase_token
 from app.schemas.user import User
 from app.schemas.onboarding import OnboardingMessage, OnboardingState, WebSocketMessage, MessageType
+from app.services.onboarding_state_sync import OnboardingStateTracker
 from app.services.websocket import manager
-from app.services.ai_service import generate_onboarding_response
+from app.services.ai_service import (
+    generate_onboarding_response,
+    stream_onboarding_response,
+    generate_fallback_response,
+    get_onboarding_step_policy,
+    personalize_onboarding_message,
+    create_conversation_history
+)
 from app.core.json import json_dumps
 
 logger = logging.getLogger(__name__)
@@ -22,19 +31,87 @@ onboarding_states: Dict[str, OnboardingState] = {}
 welcome_message_sent: Dict[str, bool] = {}
 
 
+async def send_personalized_message(
+    template: OnboardingMessage,
+    user_message: OnboardingMessage,
+    conversation_history: List[Dict[str, Any]],
+    current_step: int,
+    user_id: str,
+    connection_id: str,
+    state_tracker: Optional[OnboardingStateTracker] = None
+) -> None:
+    """
+    Follow a templated reply with its LLM-personalized version.
+    
+    The personalized message replaces the template in the conversation history
+    and is sent as an assistant_message_patch frame with the template's id (or
+    in a state patch when the connection uses state patches). It is dropped if
+    the user has replied in the meantime.
+    
+    Args:
+        template: The templated message already sent
+        user_message: The message the template answered
+        conversation_history: The conversation history before the user's message
+        current_step: The onboarding step the template was sent for
+        user_id: ID of the user
+        connection_id: The connection to send the patch to
+        state_tracker: The state tracker of a connection using state patches
+    """
+    message = await personalize_onboarding_message(template, user_message, conversation_history, current_step, user_id)
+    if message is None:
+        return
+    
+    history = onboarding_states[user_id].conversationHistory
+    if not history or history[-1].id != template.id:
+        logger.info(f"Dropping personalized message {template.id}: the conversation has moved on")
+        return
+    
+    history[-1] = message
+    if state_tracker is not None:
+        await manager.send_personal_message(state_tracker.patch(onboarding_states[user_id]), connection_id)
+        return
+    
+    await manager.send_personal_message({
+        "type": MessageType.ASSISTANT_MESSAGE_PATCH,
+        "id": message.id,
+        "message": message
+    }, connection_id)
+
+
 @router.websocket("/ws")
 async def onboarding_websocket(
     websocket: WebSocket,
     token: str = Query(...),
-    conversation_id: Optional[str] = Query(None)
+    conversation_id: Optional[str] = Query(None),
+    stream: bool = Query(False),
+    patches: bool = Query(False),
+    state_patches: bool = Query(False)
 ):
     """
     WebSocket endpoint for the onboarding process.
     
+    Replies at each step follow the ONBOARDING_STEP_POLICIES setting (every
+    step uses "llm" unless configured): "llm" steps wait for the model and
+    "template" steps reply at once with the templated step message.
+    "template_then_llm" steps reply with the template followed by a
+    personalized patch on connections with patches enabled, and like "llm"
+    steps on other connections, which could not receive the patch.
+    
     Args:
         websocket: The WebSocket connection
         token: The Supabase JWT token for authentication
         conversation_id: Optional ID of the conversation to join
+        stream: Send AI replies incrementally as assistant_delta frames
+            (id, sequence, content) before the complete message
+        patches: At "template_then_llm" steps, reply with the template and
+            follow it with an assistant_message_patch frame (id, message)
+            carrying the LLM-personalized message (otherwise the step waits
+            for the LLM)
+        state_patches: Use the versioned state protocol: one onboarding_state
+            snapshot (with a version) on connect, then onboarding_state_patch
+            frames with only what changed (see OnboardingStateTracker). The
+            echo, typing indicator, reply and state of a turn are coalesced
+            into these patches; a "resync_state" message requests a new snapshot
     """
     # Development bypass for authentication
     # In production, this would be removed and only proper JWT verification would be used
@@ -59,6 +136,7 @@ async def onboarding_websocket(
     
     # Connect the WebSocket client
     connection_id = await manager.connect(websocket, user_id, conversation_id)
+    state_tracker = OnboardingStateTracker() if state_patches else None
     
     # Check if this is the first connection for this user
     is_first_connection = user_id not in welcome_message_sent or not welcome_message_sent[user_id]
@@ -76,8 +154,9 @@ async def onboarding_websocket(
         # Add welcome message to conversation history
         onboarding_states[user_id].conversationHistory.append(welcome_message)
         
-        # Send welcome message
-        await manager.send_personal_message(welcome_message.dict(), connection_id)
+        # Send welcome message (part of the snapshot with state patches)
+        if state_tracker is None:
+            await manager.send_personal_message(welcome_message, connection_id)
         
         # Mark welcome message as sent for this user
         welcome_message_sent[user_id] = True
@@ -88,10 +167,16 @@ async def onboarding_websocket(
 
     
     # Send onboarding state
-    await manager.send_personal_message({
-        "type": "onboarding_state",
-        "state": onboarding_states[user_id].dict()
-    }, connection_id)
+    if state_tracker is not None:
+        await manager.send_personal_message(state_tracker.snapshot(onboarding_states[user_id]), connection_id)
+    else:
+        await manager.send_personal_message({
+            "type": MessageType.ONBOARDING_STATE,
+            "state": onboarding_states[user_id]
+        }, connection_id)
+    
+    # Personalizations still being generated for this connection
+    personalization_tasks: Set[asyncio.Task] = set()
     
     try:
         while True:
@@ -116,20 +201,52 @@ async def onboarding_websocket(
                     # Add to conversation history
                     onboarding_states[user_id].conversationHistory.append(user_message)
                     
-                    # Send user message back to confirm receipt
-                    await manager.send_personal_message(user_message.dict(), connection_id)
+                    if state_tracker is not None:
+                        # Confirm receipt and show typing in one patch
+                        await manager.send_personal_message(
+                            state_tracker.patch(onboarding_states[user_id], typing=True), connection_id
+                        )
+                    else:
+                        # Send user message back to confirm receipt
+                        await manager.send_personal_message(user_message, connection_id)
+                        
+                        # Send typing indicator
+                        await manager.send_personal_message({
+                            "type": MessageType.TYPING_INDICATOR,
+                            "is_typing": True
+                        }, connection_id)
                     
-                    # Send typing indicator
-                    await manager.send_personal_message({
-                        "type": MessageType.TYPING_INDICATOR,
-                        "is_typing": True
-                    }, connection_id)
+                    current_step = onboarding_states[user_id].currentStep
+                    policy = get_onboarding_step_policy(current_step)
+                    personalize_history = None
                     
-                    # Generate AI response (this would be replaced with actual AI service)
-                    ai_response = await generate_onboarding_response(
-                        user_message, 
-                        onboarding_states[user_id]
-                    )
+                    if policy == "template" or (policy == "template_then_llm" and patches):
+                        # Reply with the templated step message without waiting for the LLM
+                        if policy == "template_then_llm":
+                            personalize_history = create_conversation_history(
+                                onboarding_states[user_id], exclude_message_id=user_message.id
+                            )
+                        ai_response = await generate_fallback_response(user_message, onboarding_states[user_id])
+                    elif stream:
+                        # Forward text as it is generated; the complete message follows with the same id
+                        ai_response = None
+                        async for event in stream_onboarding_response(user_message, onboarding_states[user_id], user_id):
+                            if event["type"] == "delta":
+                                await manager.send_personal_message({
+                                    "type": MessageType.ASSISTANT_DELTA,
+                                    "id": event["id"],
+                                    "sequence": event["sequence"],
+                                    "content": event["content"]
+                                }, connection_id)
+                            else:
+                                ai_response = event["message"]
+                    else:
+                        # Generate AI response (this would be replaced with actual AI service)
+                        ai_response = await generate_onboarding_response(
+                            user_message, 
+                            onboarding_states[user_id],
+                            user_id
+                        )
                     
                     # Add AI response to conversation history
                     onboarding_states[user_id].conversationHistory.append(ai_response)
@@ -145,20 +262,34 @@ async def onboarding_websocket(
                             (onboarding_states[user_id].currentStep / onboarding_states[user_id].totalSteps) * 100
                         )
                     
-                    # Stop typing indicator
-                    await manager.send_personal_message({
-                        "type": MessageType.TYPING_INDICATOR,
-                        "is_typing": False
-                    }, connection_id)
-                    
-                    # Send AI response
-                    await manager.send_personal_message(ai_response.dict(), connection_id)
+                    if state_tracker is not None:
+                        # Reply, step progress and end of typing in one patch
+                        await manager.send_personal_message(
+                            state_tracker.patch(onboarding_states[user_id], typing=False), connection_id
+                        )
+                    else:
+                        # Stop typing indicator
+                        await manager.send_personal_message({
+                            "type": MessageType.TYPING_INDICATOR,
+                            "is_typing": False
+                        }, connection_id)
+                        
+                        # Send AI response
+                        await manager.send_personal_message(ai_response, connection_id)
+                        
+                        # Send updated onboarding state
+                        await manager.send_personal_message({
+                            "type": MessageType.ONBOARDING_STATE,
+                            "state": onboarding_states[user_id]
+                        }, connection_id)
                     
-                    # Send updated onboarding state
-                    await manager.send_personal_message({
-                        "type": "onboarding_state",
-                        "state": onboarding_states[user_id].dict()
-                    }, connection_id)
+                    if personalize_history is not None:
+                        task = asyncio.create_task(send_personalized_message(
+                            ai_response, user_message, personalize_history, current_step, user_id, connection_id,
+                            state_tracker
+                        ))
+                        personalization_tasks.add(task)
+                        task.add_done_callback(personalization_tasks.discard)
                 
                 elif message_type == MessageType.OPTION_SELECTION:
                     option_id = message_data.get("optionId")
@@ -170,11 +301,16 @@ async def onboarding_websocket(
                     onboarding_states[user_id].businessData[option_id] = option_value
                     
                     # Send confirmation
-                    await manager.send_personal_message({
-                        "type": "option_selected",
-                        "optionId": option_id,
-                        "optionValue": option_value
-                    }, connection_id)
+                    if state_tracker is not None:
+                        frame = state_tracker.patch(onboarding_states[user_id])
+                        if frame:
+                            await manager.send_personal_message(frame, connection_id)
+                    else:
+                        await manager.send_personal_message({
+                            "type": "option_selected",
+                            "optionId": option_id,
+                            "optionValue": option_value
+                        }, connection_id)
                 
                 elif message_type == MessageType.FORM_SUBMISSION:
                     form_data = message_data.get("formData", {})
@@ -184,11 +320,12 @@ async def onboarding_websocket(
                     # Update business data with form values
                     onboarding_states[user_id].businessData.update(form_data)
                     
-                    # Send confirmation
-                    await manager.send_personal_message({
-                        "type": "form_submitted",
-                        "formData": form_data
-                    }, connection_id)
+                    # Send confirmation (with state patches, together with the reply below)
+                    if state_tracker is None:
+                        await manager.send_personal_message({
+                            "type": "form_submitted",
+                            "formData": form_data
+                        }, connection_id)
                     
                     # Generate AI response to form submission
                     ai_response = OnboardingMessage(
@@ -202,7 +339,15 @@ async def onboarding_websocket(
                     onboarding_states[user_id].conversationHistory.append(ai_response)
                     
                     # Send AI response
-                    await manager.send_personal_message(ai_response.dict(), connection_id)
+                    if state_tracker is not None:
+                        await manager.send_personal_message(state_tracker.patch(onboarding_states[user_id]), connection_id)
+                    else:
+                        await manager.send_personal_message(ai_response, connection_id)
+                
+                elif message_type == MessageType.RESYNC_STATE:
+                    # The client missed a frame or lost its state
+                    tracker = state_tracker or OnboardingStateTracker()
+                    await manager.send_personal_message(tracker.snapshot(onboarding_states[user_id]), connection_id)
                 
                 elif message_type == MessageType.ACTION_TRIGGER:
                     action_type = message_data.get("actionType")
@@ -243,6 +388,10 @@ async def onboarding_websocket(
         # Handle other exceptions
         logger.error(f"WebSocket error: {str(e)}")
         manager.disconnect(connection_id)
+    
+    finally:
+        for task in list(personalization_tasks):
+            task.cancel()
 
 
 @router.post("/save-state", response_model=OnboardingState)
@@ -1,13 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status, Query
-from typing import Any, List, Dict, Optional
+from fastapi.responses import StreamingResponse
+from typing import Any, List, Dict, Optional, AsyncGenerator
+import asyncio
 import json
 import logging
 from datetime import datetime
 
 from app.core.auth import get_current_user, verify_supabase_token
+from app.core.json import json_dumps
 from app.schemas.user import User
 from app.schemas.workspace import OnboardingData, WorkspaceChat
+from app.schemas.workspace_chat import ChatMessageRequest
+from app.services.business_context_service import list_business_contexts
+from app.services.semantic_cache import semantic_cache
 from app.services.websocket import manager
+from app.services.workspace_chat_service import stream_message
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -41,6 +48,88 @@ async def get_onboarding_data(
         "goals": ["Increase efficiency", "Improve customer satisfaction"]
     }
 
+@router.get("/chat/cache-stats")
+async def get_chat_cache_stats(
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Get hit rate, saved latency and saved tokens of the workspace chat semantic cache.
+    """
+    return semantic_cache.stats()
+
+@router.get("/ws-stats")
+async def get_websocket_stats(
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Get live WebSocket connection counts, send queue depths and dropped messages.
+    """
+    return manager.stats()
+
+@router.post("/chat/messages/stream")
+async def stream_chat_message(
+    request: ChatMessageRequest,
+    current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Send a workspace chat message and stream the response as Server-Sent Events.
+    
+    Emits a "retrieval" event with the context chunks used, "assistant_delta"
+    events with the response text and a final "assistant_done" event with the
+    message id and usage. Closing the connection cancels the generation.
+    """
+    business_contexts = await list_business_contexts(current_user.id)
+    
+    async def event_stream() -> AsyncGenerator[str, None]:
+        events = stream_message(request, current_user.id, business_contexts)
+        try:
+            async for event in events:
+                yield f"event: {event['type']}\ndata: {json_dumps(event)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {str(e)}")
+            yield f"event: error\ndata: {json_dumps({'type': 'error', 'content': 'Failed to generate a response'})}\n\n"
+        finally:
+            # Runs on client disconnect too, closing the upstream completion
+            await events.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def send_streamed_response(request: ChatMessageRequest, user_id: str, connection_id: str) -> None:
+    """
+    Stream a workspace chat response to a WebSocket connection.
+    
+    Sends the same events as the SSE endpoint. When the task is cancelled the
+    upstream completion is closed and a "cancelled" event is sent.
+    
+    Args:
+        request: The message request
+        user_id: ID of the user sending the message
+        connection_id: The connection to send the events to
+    """
+    message_id = None
+    try:
+        business_contexts = await list_business_contexts(user_id)
+        async for event in stream_message(request, user_id, business_contexts):
+            message_id = event["message_id"]
+            await manager.send_personal_message(event, connection_id)
+    
+    except asyncio.CancelledError:
+        logger.info(f"Cancelled chat response {message_id} for connection {connection_id}")
+        await manager.send_personal_message({"type": "cancelled", "message_id": message_id}, connection_id)
+        raise
+    
+    except Exception as e:
+        logger.error(f"Error streaming chat response: {str(e)}")
+        await manager.send_personal_message({
+            "type": "error",
+            "message_id": message_id,
+            "content": "Failed to generate a response"
+        }, connection_id)
+
 @router.websocket("/chat")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -51,6 +140,12 @@ async def websocket_endpoint(
     WebSocket endpoint for real-time chat in the workspace.
     This will be used for the onboarding conversational UI.
     
+    A "stream_message" message (content, optional conversation_id) streams a
+    response as retrieval, assistant_delta and assistant_done events; a
+    "cancel" message aborts the response being streamed. "join_conversation"
+    and "leave_conversation" messages (conversation_id) subscribe the
+    connection to the broadcasts of further conversations.
+    
     Args:
         websocket: The WebSocket connection
         token: The Supabase JWT token for authentication
@@ -78,6 +173,9 @@ async def websocket_endpoint(
     }
     await manager.send_personal_message(welcome_message, connection_id)
     
+    # Response currently being streamed to this connection
+    stream_task: Optional[asyncio.Task] = None
+    
     try:
         while True:
             # Receive and process messages
@@ -140,6 +238,32 @@ async def websocket_endpoint(
                         await manager.broadcast_to_conversation(user_message, conversation_id)
                         await manager.broadcast_to_conversation(ai_response, conversation_id)
                 
+                elif message_type == "stream_message":
+                    # A new message supersedes the response still being streamed
+                    if stream_task and not stream_task.done():
+                        stream_task.cancel()
+                    request = ChatMessageRequest(
+                        content=content,
+                        conversation_id=message_data.get("conversation_id") or conversation_id or connection_id
+                    )
+                    stream_task = asyncio.create_task(send_streamed_response(request, user_id, connection_id))
+                
+                elif message_type == "cancel":
+                    if stream_task and not stream_task.done():
+                        stream_task.cancel()
+                
+                elif message_type in ("join_conversation", "leave_conversation"):
+                    target_id = message_data.get("conversation_id")
+                    if target_id:
+                        if message_type == "join_conversation":
+                            manager.join_conversation(connection_id, target_id)
+                        else:
+                            manager.leave_conversation(connection_id, target_id)
+                        await manager.send_personal_message({
+                            "type": "conversations",
+                            "conversation_ids": sorted(manager.get_conversations(connection_id))
+                        }, connection_id)
+                
             except json.JSONDecodeError:
                 logger.error(f"Invalid JSON received from client: {data[:50]}...")
                 error_message = {
@@ -157,3 +281,8 @@ async def websocket_endpoint(
         # Handle other exceptions
         logger.error(f"WebSocket error: {str(e)}")
         manager.disconnect(connection_id)
+    
+    finally:
+        # Abort the upstream completion if the client went away mid-response
+        if stream_task and not stream_task.done():
+            stream_task.cancel()
@@ -0,0 +1,97 @@
+"""
+In-process caching utilities shared by services.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Size-bounded least-recently-used cache with optional per-entry TTL.
+
+    Entries are evicted when the cache grows beyond ``max_entries`` (oldest
+    access first) or when they are read after their TTL has expired.
+    """
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Map of key to (expires_at, value); expires_at is None when there is no TTL
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Get a value from the cache, refreshing its recency.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            The cached value, or None if missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """
+        Store a value in the cache, evicting the least recently used entries if needed.
+
+        Args:
+            key: The cache key
+            value: The value to store
+            ttl_seconds: Optional TTL overriding the cache default
+        """
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl else None
+
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """Remove a key from the cache if present."""
+        self._entries.pop(key, None)
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """
+        Get the unexpired entries without refreshing their recency.
+
+        Returns:
+            List of (key, value) tuples, least recently used first
+        """
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        return [(key, value) for key, (_, value) in self._entries.items()]
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get size and eviction counters for the cache."""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+        }
@@ -43,6 +43,30 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4")
     
+    # LLM Gateway Configuration (shared by all OpenAI calls; 0 disables a rate limit)
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    LLM_MAX_CONCURRENCY_PER_MODEL: int = int(os.getenv("LLM_MAX_CONCURRENCY_PER_MODEL", "8"))
+    LLM_REQUESTS_PER_MINUTE: float = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+    LLM_TOKENS_PER_MINUTE: float = float(os.getenv("LLM_TOKENS_PER_MINUTE", "80000"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_RETRY_BASE_SECONDS: float = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+    LLM_RETRY_MAX_SECONDS: float = float(os.getenv("LLM_RETRY_MAX_SECONDS", "20"))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+    LLM_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    LLM_CIRCUIT_RECOVERY_SECONDS: float = float(os.getenv("LLM_CIRCUIT_RECOVERY_SECONDS", "30"))
+    
+    # LLM Response Cache Configuration (exact-match reuse of deterministic completions)
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_REDIS_ENABLED: bool = os.getenv("LLM_CACHE_REDIS_ENABLED", "true").lower() == "true"
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+    LLM_CACHE_MAX_ENTRY_BYTES: int = int(os.getenv("LLM_CACHE_MAX_ENTRY_BYTES", "65536"))
+    LLM_CACHE_TTL_SECONDS: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(60 * 60 * 24)))  # 1 day
+    LLM_CACHE_MAX_TEMPERATURE: float = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))  # calls up to this temperature are cached by default
+    
     # Database Configuration
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
     DIRECT_URL: Optional[str] = os.getenv("DIRECT_URL", None)
@@ -55,6 +79,74 @@ class Settings(BaseSettings):
         "REDIS_URL", 
         f"redis://{f':{REDIS_PASSWORD}@' if REDIS_PASSWORD else ''}{REDIS_HOST}:{REDIS_PORT}/0"
     )
+    REDIS_SOCKET_TIMEOUT_SECONDS: float = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", "0.5"))
+    
+    # Embedding Provider Configuration
+    EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "openai")  # openai or local (deterministic hashing, no network)
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    
+    # Embedding Cache Configuration
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_REDIS_ENABLED: bool = os.getenv("EMBEDDING_CACHE_REDIS_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "10000"))
+    EMBEDDING_CACHE_TTL_SECONDS: int = int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(60 * 60 * 24 * 7)))  # 7 days
+    
+    # Embedding Batching Configuration
+    EMBEDDING_BATCHING_ENABLED: bool = os.getenv("EMBEDDING_BATCHING_ENABLED", "true").lower() == "true"
+    EMBEDDING_BATCH_WINDOW_MS: float = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "10"))
+    EMBEDDING_BATCH_MAX_SIZE: int = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "128"))
+    EMBEDDING_BATCH_MAX_TOKENS: int = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+    EMBEDDING_MAX_INPUT_TOKENS: int = int(os.getenv("EMBEDDING_MAX_INPUT_TOKENS", "8191"))
+    EMBEDDING_DIMENSION: int = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+    EMBEDDING_BACKFILL_PAGE_SIZE: int = int(os.getenv("EMBEDDING_BACKFILL_PAGE_SIZE", "1000"))
+    EMBEDDING_BACKFILL_CONCURRENCY: int = int(os.getenv("EMBEDDING_BACKFILL_CONCURRENCY", "4"))
+    # Businesses whose embedded text and chunk IDs are remembered to skip re-embedding unchanged contexts
+    EMBEDDING_CHANGE_TRACKING_MAX_BUSINESSES: int = int(os.getenv("EMBEDDING_CHANGE_TRACKING_MAX_BUSINESSES", "10000"))
+    
+    # Chunking Configuration
+    CHUNK_MAX_TOKENS: int = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+    
+    # Vector Search Configuration (pgvector)
+    VECTOR_INDEX_METHOD: str = os.getenv("VECTOR_INDEX_METHOD", "hnsw")  # hnsw or ivfflat
+    VECTOR_HNSW_M: int = int(os.getenv("VECTOR_HNSW_M", "16"))
+    VECTOR_HNSW_EF_CONSTRUCTION: int = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "64"))
+    VECTOR_IVFFLAT_LISTS: int = int(os.getenv("VECTOR_IVFFLAT_LISTS", "100"))
+    VECTOR_SEARCH_EF_SEARCH: int = int(os.getenv("VECTOR_SEARCH_EF_SEARCH", "40"))
+    VECTOR_SEARCH_PROBES: int = int(os.getenv("VECTOR_SEARCH_PROBES", "10"))
+    VECTOR_INDEX_QUANTIZATION: str = os.getenv("VECTOR_INDEX_QUANTIZATION", "none")  # none or halfvec
+    VECTOR_MEMORY_PRECISION: str = os.getenv("VECTOR_MEMORY_PRECISION", "float32")  # float32, float16 or int8
+    # In-memory retrieval indexes are kept per scope (user); idle and least recently used scopes are dropped
+    INDEX_REGISTRY_MAX_SCOPES: int = int(os.getenv("INDEX_REGISTRY_MAX_SCOPES", "1000"))
+    INDEX_REGISTRY_IDLE_SECONDS: int = int(os.getenv("INDEX_REGISTRY_IDLE_SECONDS", str(60 * 60)))  # 1 hour
+    VECTOR_RESCORE_FACTOR: int = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+    
+    # Semantic Response Cache Configuration (workspace chat)
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_SIMILARITY_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_SIMILARITY_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_MAX_ENTRIES_PER_BUSINESS: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES_PER_BUSINESS", "500"))
+    SEMANTIC_CACHE_TTL_SECONDS: int = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", str(60 * 60 * 24)))  # 1 day
+    
+    # WebSocket Configuration (bounded outbound queue per connection, Redis backplane between workers)
+    WEBSOCKET_SEND_QUEUE_SIZE: int = int(os.getenv("WEBSOCKET_SEND_QUEUE_SIZE", "256"))
+    WEBSOCKET_OVERFLOW_POLICY: str = os.getenv("WEBSOCKET_OVERFLOW_POLICY", "disconnect")  # drop (discard the message) or disconnect (close the slow client)
+    WEBSOCKET_BACKPLANE_ENABLED: bool = os.getenv("WEBSOCKET_BACKPLANE_ENABLED", "false").lower() == "true"  # relay broadcasts between workers through Redis
+    WEBSOCKET_PRESENCE_TTL_SECONDS: int = int(os.getenv("WEBSOCKET_PRESENCE_TTL_SECONDS", "30"))
+    WEBSOCKET_HEARTBEAT_SECONDS: float = float(os.getenv("WEBSOCKET_HEARTBEAT_SECONDS", "10"))
+    
+    # Onboarding Configuration (reply policy per step: llm, template or template_then_llm; unlisted steps use llm)
+    ONBOARDING_STEP_POLICIES: str = os.getenv("ONBOARDING_STEP_POLICIES", "")
+    
+    # Prompt Assembly Configuration (token budgets per call and rolling conversation summaries)
+    ONBOARDING_PROMPT_TOKEN_BUDGET: int = int(os.getenv("ONBOARDING_PROMPT_TOKEN_BUDGET", "3000"))
+    CHAT_PROMPT_TOKEN_BUDGET: int = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "4000"))
+    EXTRACTION_PROMPT_TOKEN_BUDGET: int = int(os.getenv("EXTRACTION_PROMPT_TOKEN_BUDGET", "8000"))
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", "300"))
+    CONVERSATION_SUMMARY_MIN_TURNS: int = int(os.getenv("CONVERSATION_SUMMARY_MIN_TURNS", "4"))
+    CONVERSATION_SUMMARY_MAX_CONVERSATIONS: int = int(os.getenv("CONVERSATION_SUMMARY_MAX_CONVERSATIONS", "1000"))
+    
+    # Context Extraction Configuration
+    CONTEXT_EXTRACTION_MODE: str = os.getenv("CONTEXT_EXTRACTION_MODE", "single")  # single (one call) or dag (profile, then keywords and insights concurrently)
     
     # Celery Configuration
     CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", REDIS_URL)
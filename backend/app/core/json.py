@@ -1,19 +1,70 @@
 """
 JSON utilities for serialization and deserialization.
+
+Uses orjson when it is installed (several times faster, with native
+datetime, UUID, enum and dataclass support) and the standard library
+encoder otherwise. Both backends serialize pydantic models, datetimes,
+UUIDs and sets the same way, so callers can pass models straight in
+instead of converting them to dicts first.
 """
 import json
-from datetime import datetime
+from datetime import date, datetime
+from enum import Enum
 from typing import Any
+from uuid import UUID
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Name of the encoder in use ("orjson" or "json")
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(obj: Any) -> Any:
+    """Convert values the encoders do not handle natively."""
+    if isinstance(obj, BaseModel):
+        # JSON mode matches model_dump_json (e.g. "Z" for UTC datetimes), so
+        # nested and top-level models encode the same
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 
 class CustomJSONEncoder(json.JSONEncoder):
     """
-    Custom JSON encoder that handles datetime objects.
+    Custom JSON encoder that handles datetime objects, UUIDs and pydantic models.
     """
     def default(self, obj: Any) -> Any:
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+        try:
+            return _default(obj)
+        except TypeError:
+            return super().default(obj)
+
+
+def json_dumps_bytes(obj: Any) -> bytes:
+    """
+    Serialize an object to UTF-8 encoded JSON.
+    
+    Args:
+        obj: The object to serialize
+    
+    Returns:
+        JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, cls=CustomJSONEncoder, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
 
 
 def json_dumps(obj: Any) -> str:
@@ -22,8 +73,26 @@ def json_dumps(obj: Any) -> str:
     
     Args:
         obj: The object to serialize
-        
+    
     Returns:
         JSON string representation
     """
-    return json.dumps(obj, cls=CustomJSONEncoder)
+    if isinstance(obj, BaseModel):
+        # Pydantic serializes its own models without building a dict first
+        return obj.model_dump_json()
+    return json_dumps_bytes(obj).decode("utf-8")
+
+
+def json_loads(data: Any) -> Any:
+    """
+    Deserialize a JSON string or bytes.
+    
+    Args:
+        data: The JSON document
+    
+    Returns:
+        The deserialized object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
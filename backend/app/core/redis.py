@@ -0,0 +1,63 @@
+"""
+Shared async Redis client for caches and realtime features.
+"""
+import asyncio
+import logging
+import weakref
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:  # pragma: no cover - redis is listed in requirements.txt
+    aioredis = None
+
+# One client per event loop: Celery tasks run each job in a fresh loop, and
+# redis connections cannot be shared across loops.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = weakref.WeakKeyDictionary()
+
+
+def get_redis_client() -> Optional["aioredis.Redis"]:
+    """
+    Get the async Redis client bound to the running event loop.
+
+    Returns:
+        The Redis client, or None if redis is unavailable or no loop is running
+    """
+    if aioredis is None:
+        return None
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+    client = _clients.get(loop)
+    if client is None:
+        client = aioredis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_redis_client() -> None:
+    """
+    Close the Redis client bound to the running event loop, if any.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    client = _clients.pop(loop, None)
+    if client is not None:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error(f"Error closing Redis client: {e}")
@@ -0,0 +1,92 @@
+"""
+Token counting and token-level splitting for prompts and embedding inputs.
+
+Uses tiktoken when it is installed and its encoding can be loaded; otherwise
+falls back to a word/punctuation approximation that is close enough for
+budgeting and chunking.
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import Any, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Encoding used by text-embedding-ada-002, gpt-3.5-turbo and gpt-4
+DEFAULT_ENCODING = "cl100k_base"
+
+# Fallback tokens: each word or punctuation mark together with its leading whitespace
+_FALLBACK_TOKEN_PATTERN = re.compile(r"\s*(?:\w+|[^\w\s])|\s+")
+
+
+class _FallbackEncoding:
+    """Approximate tokenizer used when tiktoken is unavailable."""
+    name = "fallback"
+    
+    def encode(self, text: str) -> List[str]:
+        return _FALLBACK_TOKEN_PATTERN.findall(text)
+    
+    def decode(self, tokens: Sequence[str]) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=4)
+def get_encoding(name: str = DEFAULT_ENCODING) -> Any:
+    """
+    Get a cached tokenizer encoding.
+    
+    Args:
+        name: The tiktoken encoding name
+    
+    Returns:
+        An object with encode(text) and decode(tokens) methods
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"tiktoken encoding {name} unavailable, using approximate token counts: {str(e)}")
+        return _FallbackEncoding()
+
+
+def encode(text: str) -> List[Any]:
+    """Split text into tokens."""
+    return get_encoding().encode(text)
+
+
+def decode(tokens: Sequence[Any]) -> str:
+    """Join tokens produced by encode() back into text."""
+    return get_encoding().decode(tokens)
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in a text.
+    
+    Args:
+        text: The text to count
+    
+    Returns:
+        Number of tokens
+    """
+    if not text:
+        return 0
+    return len(encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Truncate text to at most max_tokens tokens.
+    
+    Args:
+        text: The text to truncate
+        max_tokens: Maximum number of tokens to keep
+    
+    Returns:
+        The (possibly) truncated text
+    """
+    tokens = encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return decode(tokens[:max_tokens])
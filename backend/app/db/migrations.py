@@ -6,12 +6,22 @@ import subprocess
 import sys
 import os
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional
 
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# pgvector columns whose ANN indexes are managed outside the Prisma schema
+VECTOR_INDEX_TARGETS = [
+    ("KnowledgeItem", "embedding"),
+    ("BusinessContextEmbedding", "vector"),
+]
+
+VECTOR_INDEX_METHODS = ("hnsw", "ivfflat")
+
+VECTOR_INDEX_QUANTIZATIONS = ("none", "halfvec")
+
 def run_prisma_migration(migration_name: str = "initial") -> Tuple[bool, Optional[str]]:
     """
     Run Prisma migration to create and apply database schema changes.
@@ -130,3 +140,109 @@ def reset_database() -> bool:
     except Exception as e:
         logger.error(f"Unexpected error resetting database: {e}")
         return False
+
+
+def vector_index_name(table: str, column: str, method: str, quantization: str = "none") -> str:
+    """
+    Get the name of a pgvector ANN index.
+    
+    Args:
+        table: Table name
+        column: Vector column name
+        method: Index method, "hnsw" or "ivfflat"
+        quantization: "none" or "halfvec"
+        
+    Returns:
+        str: The index name
+    """
+    suffix = "" if quantization == "none" else f"_{quantization}"
+    return f"{table}_{column}_{method}{suffix}_idx"
+
+
+def build_vector_index_statements(
+    method: str = "hnsw",
+    rebuild: bool = False,
+    quantization: str = "none"
+) -> List[str]:
+    """
+    Build the SQL statements that create the pgvector ANN indexes.
+    
+    Args:
+        method: Index method, "hnsw" or "ivfflat"
+        rebuild: Drop and recreate the indexes (e.g. to retrain IVFFlat lists after a bulk load)
+        quantization: "none" to index the full-precision column, or "halfvec" to index a
+            half-precision expression (half the index size; results are rescored exactly)
+        
+    Returns:
+        List[str]: SQL statements to execute in order
+    """
+    if method not in VECTOR_INDEX_METHODS:
+        raise ValueError(f"Unknown vector index method: {method}")
+    if quantization not in VECTOR_INDEX_QUANTIZATIONS:
+        raise ValueError(f"Unknown vector index quantization: {quantization}")
+    
+    statements = ["CREATE EXTENSION IF NOT EXISTS vector"]
+    
+    for table, column in VECTOR_INDEX_TARGETS:
+        index_name = vector_index_name(table, column, method, quantization)
+        
+        # Only one ANN index per column: drop the other variants when switching
+        for other_method in VECTOR_INDEX_METHODS:
+            for other_quantization in VECTOR_INDEX_QUANTIZATIONS:
+                other_name = vector_index_name(table, column, other_method, other_quantization)
+                if other_name != index_name or rebuild:
+                    statements.append(f'DROP INDEX IF EXISTS "{other_name}"')
+        
+        if method == "hnsw":
+            options = f"m = {int(settings.VECTOR_HNSW_M)}, ef_construction = {int(settings.VECTOR_HNSW_EF_CONSTRUCTION)}"
+        else:
+            options = f"lists = {int(settings.VECTOR_IVFFLAT_LISTS)}"
+        
+        if quantization == "halfvec":
+            indexed = f'(("{column}")::halfvec({int(settings.EMBEDDING_DIMENSION)})) halfvec_cosine_ops'
+        else:
+            indexed = f'"{column}" vector_cosine_ops'
+        
+        statements.append(
+            f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" '
+            f'USING {method} ({indexed}) WITH ({options})'
+        )
+    
+    return statements
+
+
+async def apply_vector_index_migration(
+    method: Optional[str] = None,
+    rebuild: bool = False,
+    quantization: Optional[str] = None
+) -> bool:
+    """
+    Create or switch the pgvector ANN indexes for the embedding columns.
+    
+    The statements are idempotent, so this can run on every deploy.
+    
+    Args:
+        method: Index method, "hnsw" or "ivfflat" (defaults to VECTOR_INDEX_METHOD)
+        rebuild: Drop and recreate the indexes
+        quantization: "none" or "halfvec" (defaults to VECTOR_INDEX_QUANTIZATION)
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    from app.db.client import get_prisma_client
+    
+    method = method or settings.VECTOR_INDEX_METHOD
+    quantization = quantization or settings.VECTOR_INDEX_QUANTIZATION
+    logger.info(f"Applying vector index migration ({method}, quantization: {quantization})...")
+    
+    try:
+        statements = build_vector_index_statements(method, rebuild, quantization)
+        db = await get_prisma_client()
+        for statement in statements:
+            await db.execute_raw(statement)
+        
+        logger.info("Vector index migration applied successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to apply vector index migration: {e}")
+        return False
@@ -0,0 +1,473 @@
+"""
+pgvector similarity search and embedding storage.
+
+Vector columns are declared as Unsupported("vector(1536)") in the Prisma
+schema, so they are read and written through raw SQL. Every stored vector
+records the embedding model version and dimension it was generated with, so
+vectors from another model can be found and re-embedded.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+from prisma import Prisma
+
+from app.core.config import settings
+from app.schemas.business_context import BusinessContextChunk
+
+logger = logging.getLogger(__name__)
+
+# Rows per multi-row INSERT/UPDATE statement (keeps bind parameters well under Postgres' limit)
+WRITE_BATCH_SIZE = 100
+
+
+def to_vector_literal(embedding: Sequence[float]) -> str:
+    """
+    Format an embedding as a pgvector text literal.
+    
+    Args:
+        embedding: The embedding vector
+    
+    Returns:
+        The vector literal, e.g. "[0.1,0.2,0.3]"
+    """
+    return "[" + ",".join(repr(float(value)) for value in embedding) + "]"
+
+
+async def _set_search_params(
+    db: Prisma,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None
+) -> None:
+    """
+    Apply per-query index tuning for the current transaction.
+    
+    Args:
+        db: Prisma client or transaction
+        ef_search: HNSW candidate list size (higher is more accurate and slower)
+        probes: Number of IVFFlat lists to scan (higher is more accurate and slower)
+    """
+    # SET does not accept bind parameters, so values are validated as ints
+    ef_search = ef_search if ef_search is not None else settings.VECTOR_SEARCH_EF_SEARCH
+    probes = probes if probes is not None else settings.VECTOR_SEARCH_PROBES
+    await db.execute_raw(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+    await db.execute_raw(f"SET LOCAL ivfflat.probes = {int(probes)}")
+
+
+def _candidate_order(column: str) -> str:
+    """
+    Distance expression used to pick ANN candidates, matching the configured index.
+    
+    With VECTOR_INDEX_QUANTIZATION=halfvec the index is built on a half-precision
+    expression, so candidates must be ordered by that same expression to use it.
+    """
+    if settings.VECTOR_INDEX_QUANTIZATION == "halfvec":
+        halfvec = f"halfvec({int(settings.EMBEDDING_DIMENSION)})"
+        return f"({column})::{halfvec} <=> $1::{halfvec}"
+    return f"{column} <=> $1::vector"
+
+
+def _candidate_limit(limit: int) -> int:
+    """Number of ANN candidates to fetch before exact rescoring."""
+    if settings.VECTOR_INDEX_QUANTIZATION == "halfvec":
+        return limit * settings.VECTOR_RESCORE_FACTOR
+    return limit
+
+
+async def search_knowledge_items(
+    db: Prisma,
+    query_embedding: Sequence[float],
+    business_id: Optional[str] = None,
+    limit: int = 5,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Find the knowledge items nearest to a query embedding by cosine distance.
+    
+    Candidates come from the ANN index (quantized if configured) and are
+    re-ranked by exact distance on the full-precision column.
+    
+    Args:
+        db: Prisma client
+        query_embedding: The query embedding vector
+        business_id: Optional business ID to restrict the search to
+        limit: Maximum number of results to return
+        ef_search: Optional HNSW ef_search override for this query
+        probes: Optional IVFFlat probes override for this query
+    
+    Returns:
+        List of knowledge item dictionaries with a similarity score (0-1, higher is more similar)
+    """
+    business_filter = 'AND "businessId" = $4' if business_id else ""
+    params: List[Any] = [to_vector_literal(query_embedding), limit, _candidate_limit(limit)]
+    if business_id:
+        params.append(business_id)
+    
+    async with db.tx() as tx:
+        await _set_search_params(tx, ef_search, probes)
+        return await tx.query_raw(
+            f"""
+            SELECT id, title, content, source, "businessId",
+                   1 - (embedding <=> $1::vector) AS similarity
+            FROM (
+                SELECT id, title, content, source, "businessId", embedding
+                FROM "KnowledgeItem"
+                WHERE embedding IS NOT NULL {business_filter}
+                ORDER BY {_candidate_order("embedding")}
+                LIMIT $3
+            ) candidates
+            ORDER BY embedding <=> $1::vector
+            LIMIT $2
+            """,
+            *params
+        )
+
+
+async def search_business_context_chunks(
+    db: Prisma,
+    query_embedding: Sequence[float],
+    business_id: str,
+    limit: int = 5,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Find a business's context chunks nearest to a query embedding by cosine distance.
+    
+    Candidates come from the ANN index (quantized if configured) and are
+    re-ranked by exact distance on the full-precision column.
+    
+    Args:
+        db: Prisma client
+        query_embedding: The query embedding vector
+        business_id: ID of the business to search within
+        limit: Maximum number of results to return
+        ef_search: Optional HNSW ef_search override for this query
+        probes: Optional IVFFlat probes override for this query
+    
+    Returns:
+        List of chunk dictionaries with a similarity score (0-1, higher is more similar)
+    """
+    async with db.tx() as tx:
+        await _set_search_params(tx, ef_search, probes)
+        return await tx.query_raw(
+            f"""
+            SELECT id, "chunkText", "sourceField", "businessId",
+                   1 - (vector <=> $1::vector) AS similarity
+            FROM (
+                SELECT c.id, c."chunkText", c."sourceField", c."businessId", e.vector
+                FROM "BusinessContextEmbedding" e
+                JOIN "BusinessContextChunk" c ON c.id = e."chunkId"
+                WHERE c."businessId" = $4
+                ORDER BY {_candidate_order("e.vector")}
+                LIMIT $3
+            ) candidates
+            ORDER BY vector <=> $1::vector
+            LIMIT $2
+            """,
+            to_vector_literal(query_embedding),
+            limit,
+            _candidate_limit(limit),
+            business_id
+        )
+
+
+async def update_knowledge_item_embedding(
+    db: Prisma,
+    knowledge_item_id: str,
+    embedding: Sequence[float],
+    model: Optional[str] = None
+) -> bool:
+    """
+    Store the embedding for a knowledge item.
+    
+    Args:
+        db: Prisma client
+        knowledge_item_id: ID of the knowledge item
+        embedding: The embedding vector
+        model: Version of the embedding model that generated the vector
+    
+    Returns:
+        True if a row was updated, False otherwise
+    """
+    count = await db.execute_raw(
+        """
+        UPDATE "KnowledgeItem"
+        SET embedding = $1::vector, "embeddingModel" = $3, "embeddingDimension" = vector_dims($1::vector), "updatedAt" = NOW()
+        WHERE id = $2
+        """,
+        to_vector_literal(embedding),
+        knowledge_item_id,
+        model
+    )
+    return count > 0
+
+
+async def bulk_update_knowledge_item_embeddings(
+    db: Prisma,
+    rows: Sequence[Tuple[str, Sequence[float]]],
+    model: Optional[str] = None
+) -> int:
+    """
+    Store the embeddings of many knowledge items with multi-row UPDATE statements.
+    
+    Args:
+        db: Prisma client or transaction
+        rows: (knowledge_item_id, embedding) pairs
+        model: Version of the embedding model that generated the vectors
+    
+    Returns:
+        Number of rows updated
+    """
+    updated = 0
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        batch = rows[start:start + WRITE_BATCH_SIZE]
+        values = []
+        params: List[Any] = [model]
+        for i, (knowledge_item_id, embedding) in enumerate(batch):
+            values.append(f"(${2 * i + 2}, ${2 * i + 3}::vector)")
+            params.extend([knowledge_item_id, to_vector_literal(embedding)])
+        
+        updated += await db.execute_raw(
+            f"""
+            UPDATE "KnowledgeItem" AS k
+            SET embedding = v.embedding, "embeddingModel" = $1, "embeddingDimension" = vector_dims(v.embedding),
+                "updatedAt" = NOW()
+            FROM (VALUES {", ".join(values)}) AS v(id, embedding)
+            WHERE k.id = v.id
+            """,
+            *params
+        )
+    return updated
+
+
+async def fetch_knowledge_items_for_embedding(
+    db: Prisma,
+    after_id: Optional[str],
+    limit: int,
+    only_missing: bool = True,
+    business_id: Optional[str] = None,
+    model: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Page through knowledge items in ID order (keyset pagination) for (re-)embedding.
+    
+    Args:
+        db: Prisma client
+        after_id: Return rows with an ID greater than this (None for the first page)
+        limit: Maximum number of rows to return
+        only_missing: Only return rows without an embedding
+        business_id: Optional business ID to restrict the rows to
+        model: With only_missing, also return rows embedded with a different model version
+    
+    Returns:
+        List of {"id", "text"} dictionaries
+    """
+    conditions = ["id > $1"]
+    params: List[Any] = [after_id or "", limit]
+    if only_missing and model:
+        params.append(model)
+        conditions.append(f'(embedding IS NULL OR "embeddingModel" IS DISTINCT FROM ${len(params)})')
+    elif only_missing:
+        conditions.append("embedding IS NULL")
+    if business_id:
+        params.append(business_id)
+        conditions.append(f'"businessId" = ${len(params)}')
+    
+    return await db.query_raw(
+        f"""
+        SELECT id, content AS text
+        FROM "KnowledgeItem"
+        WHERE {" AND ".join(conditions)}
+        ORDER BY id
+        LIMIT $2
+        """,
+        *params
+    )
+
+
+async def fetch_business_context_chunks_for_embedding(
+    db: Prisma,
+    after_id: Optional[str],
+    limit: int,
+    only_missing: bool = True,
+    business_id: Optional[str] = None,
+    model: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Page through business context chunks in ID order (keyset pagination) for (re-)embedding.
+    
+    Args:
+        db: Prisma client
+        after_id: Return rows with an ID greater than this (None for the first page)
+        limit: Maximum number of rows to return
+        only_missing: Only return chunks without an embedding
+        business_id: Optional business ID to restrict the rows to
+        model: With only_missing, also return chunks embedded with a different model version
+    
+    Returns:
+        List of {"id", "text"} dictionaries
+    """
+    conditions = ["c.id > $1"]
+    params: List[Any] = [after_id or "", limit]
+    if only_missing and model:
+        params.append(model)
+        conditions.append(f'(e.id IS NULL OR e.model IS DISTINCT FROM ${len(params)})')
+    elif only_missing:
+        conditions.append("e.id IS NULL")
+    if business_id:
+        params.append(business_id)
+        conditions.append(f'c."businessId" = ${len(params)}')
+    
+    return await db.query_raw(
+        f"""
+        SELECT c.id, c."chunkText" AS text
+        FROM "BusinessContextChunk" c
+        LEFT JOIN "BusinessContextEmbedding" e ON e."chunkId" = c.id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY c.id
+        LIMIT $2
+        """,
+        *params
+    )
+
+
+async def upsert_business_context_embeddings(
+    db: Prisma,
+    rows: Sequence[Tuple[str, Sequence[float]]],
+    model: Optional[str] = None
+) -> int:
+    """
+    Insert or replace the embeddings for business context chunks.
+    
+    Args:
+        db: Prisma client or transaction
+        rows: (chunk_id, embedding) pairs
+        model: Version of the embedding model that generated the vectors
+    
+    Returns:
+        Number of rows written
+    """
+    written = 0
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        batch = rows[start:start + WRITE_BATCH_SIZE]
+        values = []
+        params: List[Any] = [model]
+        for i, (chunk_id, embedding) in enumerate(batch):
+            values.append(
+                f"(${3 * i + 2}, ${3 * i + 3}::vector, $1, vector_dims(${3 * i + 3}::vector), ${3 * i + 4}, NOW())"
+            )
+            params.extend([str(uuid4()), to_vector_literal(embedding), chunk_id])
+        
+        written += await db.execute_raw(
+            f"""
+            INSERT INTO "BusinessContextEmbedding" (id, vector, model, dimension, "chunkId", "updatedAt")
+            VALUES {", ".join(values)}
+            ON CONFLICT ("chunkId") DO UPDATE SET
+                vector = EXCLUDED.vector, model = EXCLUDED.model, dimension = EXCLUDED.dimension, "updatedAt" = NOW()
+            """,
+            *params
+        )
+    return written
+
+
+async def _create_business_context_chunks(
+    db: Prisma,
+    business_id: str,
+    chunks: Sequence[BusinessContextChunk],
+    embeddings: Sequence[Optional[Sequence[float]]],
+    model: Optional[str] = None
+) -> None:
+    """
+    Insert chunks and the embeddings of those that have one.
+    
+    Args:
+        db: Prisma client or transaction
+        business_id: ID of the business
+        chunks: The chunks to insert
+        embeddings: Embeddings aligned with chunks (None entries are stored without a vector)
+        model: Version of the embedding model that generated the vectors
+    """
+    if not chunks:
+        return
+    
+    await db.businesscontextchunk.create_many(
+        data=[
+            {
+                "id": chunk.id,
+                "businessId": business_id,
+                "chunkText": chunk.chunk_text,
+                "sourceField": chunk.source_field,
+                "chunkIndex": chunk.chunk_index,
+                "tokenCount": chunk.token_count,
+            }
+            for chunk in chunks
+        ]
+    )
+    await upsert_business_context_embeddings(
+        db,
+        [(chunk.id, embedding) for chunk, embedding in zip(chunks, embeddings) if embedding],
+        model=model
+    )
+
+
+async def replace_business_context_chunks(
+    db: Prisma,
+    business_id: str,
+    chunks: Sequence[BusinessContextChunk],
+    embeddings: Sequence[Optional[Sequence[float]]],
+    model: Optional[str] = None
+) -> int:
+    """
+    Replace all stored chunks of a business with new chunks and their embeddings.
+    
+    Args:
+        db: Prisma client
+        business_id: ID of the business
+        chunks: The new chunks
+        embeddings: Embeddings aligned with chunks (None entries are stored without a vector)
+        model: Version of the embedding model that generated the vectors
+    
+    Returns:
+        Number of chunks stored
+    """
+    async with db.tx() as tx:
+        # Embeddings are removed with their chunks (ON DELETE CASCADE)
+        await tx.businesscontextchunk.delete_many(where={"businessId": business_id})
+        await _create_business_context_chunks(tx, business_id, chunks, embeddings, model)
+    
+    return len(chunks)
+
+
+async def apply_business_context_chunk_changes(
+    db: Prisma,
+    business_id: str,
+    added_chunks: Sequence[BusinessContextChunk],
+    embeddings: Sequence[Optional[Sequence[float]]],
+    removed_chunk_ids: Sequence[str],
+    model: Optional[str] = None
+) -> int:
+    """
+    Store new chunks of a business and delete the ones that no longer exist,
+    leaving unchanged chunks and their embeddings in place.
+    
+    Args:
+        db: Prisma client
+        business_id: ID of the business
+        added_chunks: Chunks to insert
+        embeddings: Embeddings aligned with added_chunks (None entries are stored without a vector)
+        removed_chunk_ids: IDs of chunks to delete
+        model: Version of the embedding model that generated the vectors
+    
+    Returns:
+        Number of chunks inserted or deleted
+    """
+    async with db.tx() as tx:
+        if removed_chunk_ids:
+            await tx.businesscontextchunk.delete_many(
+                where={"businessId": business_id, "id": {"in": list(removed_chunk_ids)}}
+            )
+        await _create_business_context_chunks(tx, business_id, added_chunks, embeddings, model)
+    
+    return len(added_chunks) + len(removed_chunk_ids)
@@ -78,6 +78,8 @@ class BusinessContextChunkBase(BaseModel):
     business_id: str
     chunk_text: str
     source_field: Optional[str] = None
+    chunk_index: int = 0
+    token_count: Optional[int] = None
 
 
 class BusinessContextChunkCreate(BusinessContextChunkBase):
@@ -89,6 +91,8 @@ class BusinessContextChunkUpdate(BaseModel):
     """BusinessContextChunk model for updates."""
     chunk_text: Optional[str] = None
     source_field: Optional[str] = None
+    chunk_index: Optional[int] = None
+    token_count: Optional[int] = None
 
 
 class BusinessContextChunkInDB(BusinessContextChunkBase):
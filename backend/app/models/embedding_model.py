@@ -9,6 +9,8 @@ from pydantic import BaseModel, Field
 class BusinessContextEmbeddingBase(BaseModel):
     """Base BusinessContextEmbedding model with common fields."""
     vector: List[float] = Field(..., description="OpenAI embedding vector with 1536 dimensions")
+    model: Optional[str] = Field(None, description="Embedding model version that generated the vector")
+    dimension: Optional[int] = Field(None, description="Number of dimensions of the vector")
 
 
 class BusinessContextEmbeddingCreate(BusinessContextEmbeddingBase):
@@ -19,6 +21,8 @@ class BusinessContextEmbeddingCreate(BusinessContextEmbeddingBase):
 class BusinessContextEmbeddingUpdate(BaseModel):
     """BusinessContextEmbedding model for updates."""
     vector: Optional[List[float]] = None
+    model: Optional[str] = None
+    dimension: Optional[int] = None
 
 
 class BusinessContextEmbeddingInDB(BusinessContextEmbeddingBase):
@@ -1,6 +1,7 @@
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
+from uuid import uuid4
 
 
 class BusinessProfile(BaseModel):
@@ -31,6 +32,16 @@ class BusinessContext(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class BusinessContextChunk(BaseModel):
+    """Token-bounded piece of business context text, embedded and retrieved on its own."""
+    id: str = Field(default_factory=lambda: str(uuid4()))
+    business_id: str = Field(..., description="Business ID")
+    source_field: str = Field(..., description="Context field the text came from (e.g. profile.description)")
+    chunk_index: int = Field(0, description="Position of the chunk within its source field")
+    chunk_text: str = Field(..., description="Chunk text")
+    token_count: int = Field(0, description="Number of tokens in the chunk text")
+
+
 class ContextExtractionRequest(BaseModel):
     """Request for extracting business context from onboarding data."""
     business_id: str
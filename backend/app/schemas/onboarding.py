@@ -7,6 +7,11 @@ from enum import Enum
 class MessageType(str, Enum):
     USER_MESSAGE = "user_message"
     ASSISTANT_MESSAGE = "assistant_message"
+    ASSISTANT_DELTA = "assistant_delta"
+    ASSISTANT_MESSAGE_PATCH = "assistant_message_patch"
+    ONBOARDING_STATE = "onboarding_state"
+    ONBOARDING_STATE_PATCH = "onboarding_state_patch"
+    RESYNC_STATE = "resync_state"
     SYSTEM_MESSAGE = "system_message"
     TYPING_INDICATOR = "typing_indicator"
     OPTION_SELECTION = "option_selection"
@@ -3,7 +3,7 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 from uuid import UUID, uuid4
 
-from app.schemas.business_context import BusinessContext
+from app.schemas.business_context import BusinessContext, BusinessContextChunk
 
 
 class ChatMessage(BaseModel):
@@ -31,6 +31,7 @@ class ChatMessage(BaseModel):
 class ChatContext(BaseModel):
     """Schema for context associated with a chat message."""
     business_context: Optional[BusinessContext] = Field(None, description="Business context")
+    context_chunks: List[BusinessContextChunk] = Field(default_factory=list, description="Business context chunks used for the response")
     knowledge_items: List[Dict[str, Any]] = Field(default_factory=list, description="Knowledge items")
     related_messages: List[str] = Field(default_factory=list, description="IDs of related messages")
     
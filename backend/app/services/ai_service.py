@@ -2,23 +2,70 @@ import logging
 import asyncio
 import uuid
 import json
+import re
+from contextlib import aclosing
 from datetime import datetime
 from typing import Dict, Any, List, Optional, AsyncGenerator
 
-import openai
-from openai import AsyncOpenAI
-
 from app.core.config import settings
 from app.schemas.onboarding import OnboardingMessage, OnboardingState, MessageOption, FormInput, RichContent, ActionCard
+from app.core.tokenizer import count_tokens
+from app.services.llm_gateway import llm_gateway
+from app.services.prompt_assembly import assemble_messages
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+# How a reply is produced at an onboarding step:
+# - "llm": wait for the LLM
+# - "template": send the templated step message without calling the LLM
+# - "template_then_llm": send the templated message at once and follow it
+#   with an LLM-personalized version (see personalize_onboarding_message)
+ONBOARDING_STEP_POLICIES = ("llm", "template", "template_then_llm")
+
+
+def parse_onboarding_step_policies(value: str) -> Dict[int, str]:
+    """
+    Parse a per-step policy setting such as "1:llm,2:template_then_llm".
+    
+    Args:
+        value: Comma-separated step:policy pairs
+    
+    Returns:
+        Dictionary of step number to policy (invalid pairs are skipped)
+    """
+    policies = {}
+    for pair in value.split(","):
+        if not pair.strip():
+            continue
+        step, _, policy = pair.partition(":")
+        policy = policy.strip()
+        if not step.strip().isdigit() or policy not in ONBOARDING_STEP_POLICIES:
+            logger.warning(f"Ignoring invalid onboarding step policy: {pair.strip()}")
+            continue
+        policies[int(step)] = policy
+    return policies
+
+
+_step_policies = parse_onboarding_step_policies(settings.ONBOARDING_STEP_POLICIES)
+
+
+def get_onboarding_step_policy(current_step: int) -> str:
+    """
+    Get the reply policy of an onboarding step (steps not configured use "llm").
+    
+    Args:
+        current_step: The current onboarding step
+    
+    Returns:
+        One of ONBOARDING_STEP_POLICIES
+    """
+    return _step_policies.get(current_step, "llm")
+
 
 async def generate_onboarding_response(
     user_message: OnboardingMessage, 
-    onboarding_state: OnboardingState
+    onboarding_state: OnboardingState,
+    conversation_id: Optional[str] = None
 ) -> OnboardingMessage:
     """
     Generate an AI response for the onboarding process using OpenAI.
@@ -26,6 +73,7 @@ async def generate_onboarding_response(
     Args:
         user_message: The user's message
         onboarding_state: The current onboarding state
+        conversation_id: ID used to keep the rolling summary of older turns
     
     Returns:
         An AI response message
@@ -35,15 +83,20 @@ async def generate_onboarding_response(
         logger.warning("OpenAI API key not set. Using fallback responses.")
         return await generate_fallback_response(user_message, onboarding_state)
     
+    # Skip the provider entirely while it is degraded
+    if not llm_gateway.is_available():
+        logger.warning("LLM provider degraded (circuit breaker open). Using fallback responses.")
+        return await generate_fallback_response(user_message, onboarding_state)
+    
     try:
         # Get current step
         current_step = onboarding_state.currentStep
         
         # Create conversation history for context
-        conversation_history = create_conversation_history(onboarding_state)
+        conversation_history = create_conversation_history(onboarding_state, exclude_message_id=user_message.id)
         
         # Generate response using OpenAI
-        response = await generate_ai_response(user_message, conversation_history, current_step)
+        response = await generate_ai_response(user_message, conversation_history, current_step, conversation_id)
         return response
         
     except Exception as e:
@@ -55,7 +108,8 @@ async def generate_onboarding_response(
 async def generate_ai_response(
     user_message: OnboardingMessage,
     conversation_history: List[Dict[str, Any]],
-    current_step: int
+    current_step: int,
+    conversation_id: Optional[str] = None
 ) -> OnboardingMessage:
     """
     Generate a response using OpenAI API.
@@ -64,29 +118,14 @@ async def generate_ai_response(
         user_message: The user's message
         conversation_history: The conversation history
         current_step: The current onboarding step
+        conversation_id: ID used to keep the rolling summary of older turns
     
     Returns:
         An AI-generated response message
     """
-    # Create system prompt based on current step
-    system_prompt = get_system_prompt(current_step)
-    
-    # Define the expected response format based on the current step
-    function_definitions = get_function_definitions(current_step)
-    
-    messages = [
-        {"role": "system", "content": system_prompt},
-        *conversation_history,
-        {"role": "user", "content": user_message.content if user_message.content else "[User selected an option or submitted a form]"}
-    ]
-    
-    # Call OpenAI API
-    response = await openai_client.chat.completions.create(
-        model=settings.OPENAI_MODEL,
-        messages=messages,
-        functions=function_definitions if function_definitions else None,
-        function_call="auto" if function_definitions else None,
-        temperature=0.7,
+    # Call OpenAI API through the shared gateway (pooled, rate-limited, retried)
+    response = await llm_gateway.chat_completion(
+        **create_onboarding_request(user_message, conversation_history, current_step, conversation_id)
     )
     
     # Process the response
@@ -111,19 +150,361 @@ async def generate_ai_response(
         )
 
 
-def create_conversation_history(onboarding_state: OnboardingState) -> List[Dict[str, Any]]:
+async def personalize_onboarding_message(
+    template: OnboardingMessage,
+    user_message: OnboardingMessage,
+    conversation_history: List[Dict[str, Any]],
+    current_step: int,
+    conversation_id: Optional[str] = None
+) -> Optional[OnboardingMessage]:
+    """
+    Generate an LLM-personalized version of a templated onboarding message.
+    
+    Used by the "template_then_llm" policy after the template has been sent.
+    When the LLM returns the same kind of message it replaces the template;
+    otherwise only the text of the template is replaced. The result keeps the
+    template's id so the client can update the message in place.
+    
+    Args:
+        template: The templated message already sent
+        user_message: The user's message
+        conversation_history: The conversation history before the user's message
+        current_step: The onboarding step the template was sent for
+        conversation_id: ID used to keep the rolling summary of older turns
+    
+    Returns:
+        The personalized message, or None if the LLM is unavailable, fails or
+        adds nothing to the template
+    """
+    if not settings.OPENAI_API_KEY or not llm_gateway.is_available():
+        return None
+    
+    try:
+        personalized = await generate_ai_response(user_message, conversation_history, current_step, conversation_id)
+    except Exception as e:
+        logger.warning(f"Error personalizing onboarding message, keeping the template: {str(e)}")
+        return None
+    
+    if personalized.messageType == template.messageType:
+        message = personalized.model_copy(update={"id": template.id, "timestamp": template.timestamp})
+    elif personalized.content:
+        message = template.model_copy(update={"content": personalized.content})
+    else:
+        return None
+    
+    if message.model_dump() == template.model_dump():
+        return None
+    return message
+
+
+def create_onboarding_request(
+    user_message: OnboardingMessage,
+    conversation_history: List[Dict[str, Any]],
+    current_step: int,
+    conversation_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Create the chat completion parameters for an onboarding reply.
+    
+    The prompt is kept within ONBOARDING_PROMPT_TOKEN_BUDGET: the newest turns
+    are sent verbatim and older ones through the conversation's rolling summary.
+    
+    Args:
+        user_message: The user's message
+        conversation_history: The conversation history
+        current_step: The current onboarding step
+        conversation_id: ID used to keep the rolling summary of older turns
+    
+    Returns:
+        Keyword arguments for the chat completion call
+    """
+    # Create system prompt based on current step
+    system_prompt = get_system_prompt(current_step)
+    
+    # Define the expected response format based on the current step
+    function_definitions = get_function_definitions(current_step)
+    
+    messages = assemble_messages(
+        system_prompt,
+        conversation_history,
+        settings.ONBOARDING_PROMPT_TOKEN_BUDGET,
+        user_message={"role": "user", "content": user_message.content if user_message.content else "[User selected an option or submitted a form]"},
+        conversation_id=conversation_id,
+        # Each user has a single onboarding conversation, identified by the user ID
+        user_id=conversation_id,
+        reserved_tokens=count_tokens(json.dumps(function_definitions)) if function_definitions else 0
+    )
+    
+    return {
+        "messages": messages,
+        "functions": function_definitions if function_definitions else None,
+        "function_call": "auto" if function_definitions else None,
+        "temperature": 0.7,
+    }
+
+
+async def stream_onboarding_response(
+    user_message: OnboardingMessage,
+    onboarding_state: OnboardingState,
+    conversation_id: Optional[str] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Stream an AI response for the onboarding process.
+    
+    Text is yielded as it is generated so the client can render it before the
+    reply is complete. The last event always carries the complete structured
+    message, with the same id as the deltas; if generation fails part way
+    it is a fallback response that replaces the partial text.
+    
+    Args:
+        user_message: The user's message
+        onboarding_state: The current onboarding state
+        conversation_id: ID used to keep the rolling summary of older turns
+    
+    Yields:
+        {"type": "delta", "id", "sequence", "content"} events with new text,
+        then one {"type": "message", "message"} event with the OnboardingMessage
+    """
+    message_id = str(uuid.uuid4())
+    
+    if not settings.OPENAI_API_KEY or not llm_gateway.is_available():
+        logger.warning("OpenAI API not available. Using fallback responses.")
+    else:
+        try:
+            conversation_history = create_conversation_history(onboarding_state, exclude_message_id=user_message.id)
+            async with aclosing(stream_ai_response(
+                user_message, conversation_history, onboarding_state.currentStep, message_id, conversation_id
+            )) as events:
+                async for event in events:
+                    yield event
+            return
+        
+        except Exception as e:
+            logger.error(f"Error streaming AI response: {str(e)}")
+    
+    fallback = await generate_fallback_response(user_message, onboarding_state)
+    fallback.id = message_id
+    yield {"type": "message", "message": fallback}
+
+
+async def stream_ai_response(
+    user_message: OnboardingMessage,
+    conversation_history: List[Dict[str, Any]],
+    current_step: int,
+    message_id: str,
+    conversation_id: Optional[str] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Stream a response using the OpenAI streaming API.
+    
+    Plain replies are forwarded delta by delta. For function calls the
+    arguments are assembled as they arrive, the user-facing "message"
+    argument is forwarded as soon as it can be decoded, and the structured
+    message is built once the arguments are complete.
+    
+    Args:
+        user_message: The user's message
+        conversation_history: The conversation history
+        current_step: The current onboarding step
+        message_id: ID of the message being generated
+        conversation_id: ID used to keep the rolling summary of older turns
+    
+    Yields:
+        Delta events followed by one message event (see stream_onboarding_response)
+    """
+    content_parts = []
+    function_name = ""
+    arguments = ""
+    streamed_message = ""
+    sequence = 0
+    
+    async with aclosing(llm_gateway.chat_completion_stream(
+        **create_onboarding_request(user_message, conversation_history, current_step, conversation_id)
+    )) as chunks:
+        async for chunk in chunks:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            text = delta.content or ""
+            
+            if text:
+                content_parts.append(text)
+            
+            if delta.function_call:
+                function_name += delta.function_call.name or ""
+                if delta.function_call.arguments:
+                    arguments += delta.function_call.arguments
+                    visible_message = extract_partial_json_string(arguments, "message")
+                    if len(visible_message) > len(streamed_message):
+                        text = visible_message[len(streamed_message):]
+                        streamed_message = visible_message
+            
+            if text:
+                yield {"type": "delta", "id": message_id, "sequence": sequence, "content": text}
+                sequence += 1
+    
+    if function_name:
+        message = create_message_from_function_call(function_name, json.loads(arguments or "{}"), message_id)
+    else:
+        message = OnboardingMessage(
+            id=message_id,
+            content="".join(content_parts),
+            sender="assistant",
+            timestamp=datetime.utcnow(),
+            messageType="text"
+        )
+    yield {"type": "message", "message": message}
+
+
+def extract_partial_json_string(partial_json: str, field: str) -> str:
+    """
+    Decode the received part of a string field from incomplete JSON.
+    
+    Args:
+        partial_json: JSON text that may be cut off anywhere
+        field: Name of the string field
+    
+    Returns:
+        The decoded prefix of the field's value ("" if the field has not started)
+    """
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), partial_json)
+    if not match:
+        return ""
+    
+    raw = partial_json[match.end():]
+    end = len(raw)
+    i = 0
+    while i < len(raw):
+        if raw[i] == "\\":
+            # Stop before an escape sequence that has not fully arrived
+            length = 6 if raw[i + 1:i + 2] == "u" else 2
+            if i + length > len(raw):
+                end = i
+                break
+            i += length
+        elif raw[i] == '"':
+            end = i
+            break
+        else:
+            i += 1
+    
+    try:
+        value = json.loads('"' + raw[:end] + '"')
+    except ValueError:
+        return ""
+    
+    # Hold back the first half of a surrogate pair until the second half arrives
+    if value and "\ud800" <= value[-1] <= "\udbff":
+        value = value[:-1]
+    return value
+
+
+async def generate_chat_completion(
+    messages: List[Dict[str, Any]],
+    system_prompt: Optional[str] = None,
+    temperature: float = 0.7
+) -> Dict[str, Any]:
+    """
+    Generate a plain text chat completion using OpenAI API.
+    
+    Args:
+        messages: The conversation messages (role/content dictionaries)
+        system_prompt: Optional system prompt prepended to the messages
+        temperature: Sampling temperature
+    
+    Returns:
+        Dictionary with the response "content" and token "usage"
+        (prompt_tokens, completion_tokens, total_tokens)
+    """
+    if system_prompt:
+        messages = [{"role": "system", "content": system_prompt}, *messages]
+    
+    response = await llm_gateway.chat_completion(
+        messages=messages,
+        temperature=temperature,
+    )
+    
+    usage = response.usage
+    return {
+        "content": response.choices[0].message.content or "",
+        "usage": {
+            "prompt_tokens": usage.prompt_tokens if usage else 0,
+            "completion_tokens": usage.completion_tokens if usage else 0,
+            "total_tokens": usage.total_tokens if usage else 0,
+        },
+    }
+
+
+async def stream_chat_completion(
+    messages: List[Dict[str, Any]],
+    system_prompt: Optional[str] = None,
+    temperature: float = 0.7
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Stream a plain text chat completion using OpenAI API.
+    
+    Closing the generator early closes the upstream request.
+    
+    Args:
+        messages: The conversation messages (role/content dictionaries)
+        system_prompt: Optional system prompt prepended to the messages
+        temperature: Sampling temperature
+    
+    Yields:
+        {"type": "delta", "content"} events with new text, then one
+        {"type": "done", "content", "usage"} event with the full response
+    """
+    if system_prompt:
+        messages = [{"role": "system", "content": system_prompt}, *messages]
+    
+    content_parts = []
+    usage = None
+    async with aclosing(llm_gateway.chat_completion_stream(
+        messages=messages,
+        temperature=temperature,
+        stream_options={"include_usage": True},
+    )) as chunks:
+        async for chunk in chunks:
+            # The last chunk has no choices, only the usage of the whole completion
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                content_parts.append(chunk.choices[0].delta.content)
+                yield {"type": "delta", "content": chunk.choices[0].delta.content}
+    
+    yield {
+        "type": "done",
+        "content": "".join(content_parts),
+        "usage": {
+            "prompt_tokens": usage.prompt_tokens if usage else 0,
+            "completion_tokens": usage.completion_tokens if usage else 0,
+            "total_tokens": usage.total_tokens if usage else 0,
+        },
+    }
+
+
+def create_conversation_history(
+    onboarding_state: OnboardingState,
+    exclude_message_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
     """
     Create a conversation history from the onboarding state for context.
     
+    The whole history is returned; prompts fit it into their token budget
+    (see assemble_messages).
+    
     Args:
         onboarding_state: The current onboarding state
+        exclude_message_id: ID of a message to leave out (e.g. the message being answered)
     
     Returns:
         A list of message dictionaries for the OpenAI API
     """
     history = []
     
-    for message in onboarding_state.messages:
+    for message in onboarding_state.conversationHistory:
+        if message.id == exclude_message_id:
+            continue
         if message.sender == "user":
             if message.messageType == "text":
                 history.append({"role": "user", "content": message.content})
@@ -144,8 +525,7 @@ def create_conversation_history(onboarding_state: OnboardingState) -> List[Dict[
                 form_text = message.content + "\nForm with fields: " + ", ".join([input.label for input in message.formInputs])
                 history.append({"role": "assistant", "content": form_text})
     
-    # Limit history to last 10 messages to avoid token limits
-    return history[-10:]
+    return history
 
 
 def get_system_prompt(current_step: int) -> str:
@@ -311,18 +691,23 @@ def get_function_definitions(current_step: int) -> List[Dict[str, Any]]:
     return functions.get(current_step, [])
 
 
-def create_message_from_function_call(function_name: str, args: Dict[str, Any]) -> OnboardingMessage:
+def create_message_from_function_call(
+    function_name: str,
+    args: Dict[str, Any],
+    message_id: Optional[str] = None
+) -> OnboardingMessage:
     """
     Create an appropriate message based on the function call from OpenAI.
     
     Args:
         function_name: The name of the function called
         args: The arguments passed to the function
+        message_id: Optional ID for the message (e.g. the ID its streamed text was sent with)
     
     Returns:
         An OnboardingMessage with the appropriate type and content
     """
-    message_id = str(uuid.uuid4())
+    message_id = message_id or str(uuid.uuid4())
     timestamp = datetime.utcnow()
     
     if function_name == "provide_business_type_options":
@@ -1,12 +1,82 @@
+import hashlib
 import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+from app.core.cache import LRUCache
+from app.core.config import settings
 from app.schemas.business_context import BusinessContext, BusinessProfile
+from app.services.chunking_service import (
+    business_context_fields,
+    forget_business_context_chunks,
+    index_business_context_chunks
+)
+from app.services.embedding_service import build_business_context_text
 from app.services.embedding_tasks import async_generate_business_context_embedding
+from app.services.keyword_index import keyword_indexes
+from app.services.semantic_cache import semantic_cache
+from app.services.vector_index import context_indexes
 
 logger = logging.getLogger(__name__)
 
+# Hash of the embedded text per business, used to skip re-embedding when an
+# update touched no field that goes into the embedding (a forgotten business
+# is simply re-embedded, mostly from the embedding cache)
+_embedded_text_hashes = LRUCache(max_entries=settings.EMBEDDING_CHANGE_TRACKING_MAX_BUSINESSES)
+
+
+def embedded_text_hash(context: BusinessContext) -> str:
+    """
+    Hash the text that is embedded for a business context.
+    
+    Args:
+        context: The business context
+    
+    Returns:
+        Hex digest of the embedded text
+    """
+    text = build_business_context_text(context.model_dump())
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def refresh_business_context_indexes(context: BusinessContext) -> bool:
+    """
+    Update the retrieval indexes of a business context after it changed.
+    
+    The keyword index is always updated and cached chat responses are dropped;
+    the context and its chunks are only re-embedded if their embedded text changed.
+    
+    Args:
+        context: The business context
+    
+    Returns:
+        True if the context embedding is up to date, False if generating it failed
+    """
+    business_id = context.business_id
+    version = context.updated_at.isoformat()
+    text_hash = embedded_text_hash(context)
+    
+    keyword_indexes.refresh(business_id, business_context_fields(context), version=version)
+    semantic_cache.invalidate(business_id)
+    
+    up_to_date = True
+    if _embedded_text_hashes.get(business_id) == text_hash:
+        logger.info(f"Embedded fields unchanged, skipping re-embedding for business context: {business_id}")
+        context_indexes.retag(business_id, version)
+    else:
+        embedding = await async_generate_business_context_embedding(context)
+        if embedding:
+            logger.info(f"Generated embedding for business context: {business_id}")
+            _embedded_text_hashes.set(business_id, text_hash)
+            context_indexes.refresh(business_id, embedding, version=version)
+        else:
+            logger.warning(f"Failed to generate embedding for business context: {business_id}")
+            up_to_date = False
+    
+    # Only chunks whose text changed are re-embedded
+    await index_business_context_chunks(context)
+    return up_to_date
+
 
 async def store_business_context(context: BusinessContext) -> bool:
     """
@@ -23,14 +93,9 @@ async def store_business_context(context: BusinessContext) -> bool:
         # For now, we'll just log that we would store it
         logger.info(f"Storing business context for business ID: {context.business_id}")
         
-        # Generate embedding for the context for future similarity search
-        # This would be stored alongside the context in a real implementation
-        embedding = await async_generate_business_context_embedding(context)
-        
-        if embedding:
-            logger.info(f"Generated embedding for business context: {context.business_id}")
-        else:
-            logger.warning(f"Failed to generate embedding for business context: {context.business_id}")
+        # Generate embeddings for the context and its chunks for future similarity search
+        # These would be stored alongside the context in a real implementation
+        await refresh_business_context_indexes(context)
         
         return True
     except Exception as e:
@@ -111,13 +176,8 @@ async def update_business_context(
         # Update the timestamp
         existing_context.updated_at = datetime.utcnow()
         
-        # Generate a new embedding if the context has changed significantly
-        embedding = await async_generate_business_context_embedding(existing_context)
-        
-        if embedding:
-            logger.info(f"Generated new embedding for updated business context: {business_id}")
-        else:
-            logger.warning(f"Failed to generate new embedding for updated business context: {business_id}")
+        # Update retrieval indexes (re-embedding only if embedded fields have changed)
+        await refresh_business_context_indexes(existing_context)
         
         return existing_context
     except Exception as e:
@@ -139,6 +199,14 @@ async def delete_business_context(business_id: str) -> bool:
         # In a real implementation, we would delete the context from the database
         # For now, we'll just log that we would delete it
         logger.info(f"Deleting business context for business ID: {business_id}")
+        
+        # Drop the context from any in-memory retrieval indexes and change tracking
+        context_indexes.discard(business_id)
+        keyword_indexes.discard(business_id)
+        semantic_cache.invalidate(business_id)
+        _embedded_text_hashes.delete(business_id)
+        forget_business_context_chunks(business_id)
+        
         return True
     except Exception as e:
         logger.error(f"Error deleting business context: {str(e)}")
@@ -202,13 +270,8 @@ async def enrich_business_context(
         
         # In a real implementation, we would save the updated context to the database
         
-        # Generate a new embedding
-        embedding = await async_generate_business_context_embedding(existing_context)
-        
-        if embedding:
-            logger.info(f"Generated new embedding for enriched business context: {business_id}")
-        else:
-            logger.warning(f"Failed to generate new embedding for enriched business context: {business_id}")
+        # Update retrieval indexes (re-embedding only if the enrichment changed embedded fields)
+        await refresh_business_context_indexes(existing_context)
         
         return existing_context
     except Exception as e:
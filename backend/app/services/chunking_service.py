@@ -0,0 +1,239 @@
+import logging
+from typing import List, Any, Optional, Tuple
+from uuid import NAMESPACE_URL, uuid5
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.tokenizer import encode, decode
+from app.schemas.business_context import BusinessContext, BusinessContextChunk
+from app.services.embedding_service import EMBEDDING_MODEL, generate_embeddings_batch
+
+logger = logging.getLogger(__name__)
+
+# IDs of the chunks stored per business; chunk IDs are derived from chunk text,
+# so comparing ID sets tells which chunks changed since they were embedded (the
+# chunks of a forgotten business are replaced as a whole on its next update)
+_indexed_chunk_ids = LRUCache(max_entries=settings.EMBEDDING_CHANGE_TRACKING_MAX_BUSINESSES)
+
+
+def chunk_text(
+    text: str,
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None
+) -> List[str]:
+    """
+    Split a text into overlapping windows of at most max_tokens tokens.
+    
+    Args:
+        text: The text to split
+        max_tokens: Maximum tokens per chunk (defaults to CHUNK_MAX_TOKENS)
+        overlap_tokens: Tokens shared by consecutive chunks (defaults to CHUNK_OVERLAP_TOKENS)
+    
+    Returns:
+        List of chunk texts (empty for blank text)
+    """
+    max_tokens = max_tokens or settings.CHUNK_MAX_TOKENS
+    overlap_tokens = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    if overlap_tokens >= max_tokens:
+        raise ValueError(f"Chunk overlap ({overlap_tokens}) must be smaller than chunk size ({max_tokens})")
+    
+    if not text or not text.strip():
+        return []
+    
+    tokens = encode(text)
+    if len(tokens) <= max_tokens:
+        return [text.strip()]
+    
+    chunks = []
+    step = max_tokens - overlap_tokens
+    for start in range(0, len(tokens), step):
+        chunk = decode(tokens[start:start + max_tokens]).strip()
+        if chunk:
+            chunks.append(chunk)
+        if start + max_tokens >= len(tokens):
+            break
+    return chunks
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return "; ".join(f"{key}: {_format_value(item)}" for key, item in value.items())
+    return str(value)
+
+
+def business_context_fields(context: BusinessContext) -> List[Tuple[str, str]]:
+    """
+    Collect the text of a business context by source field.
+    
+    Short profile attributes are grouped into one "profile" text; long-form
+    fields keep their own source so retrieved chunks can be traced back.
+    
+    Args:
+        context: The business context
+    
+    Returns:
+        List of (source_field, text) tuples
+    """
+    profile = context.profile
+    fields = []
+    
+    header = []
+    if profile.name:
+        header.append(f"Business name: {profile.name}")
+    if profile.type:
+        header.append(f"Business type: {profile.type}")
+    if profile.target_audience:
+        header.append(f"Target audience: {profile.target_audience}")
+    if profile.employees:
+        header.append(f"Employees: {profile.employees}")
+    if profile.year_founded:
+        header.append(f"Founded: {profile.year_founded}")
+    if header:
+        fields.append(("profile", "\n".join(header)))
+    
+    labelled_fields = [
+        ("description", "Description"),
+        ("products_services", "Products/Services"),
+        ("key_challenges", "Key challenges"),
+        ("goals", "Goals"),
+        ("unique_selling_points", "Unique selling points"),
+        ("competitors", "Competitors"),
+    ]
+    for field, label in labelled_fields:
+        value = getattr(profile, field)
+        if value:
+            fields.append((f"profile.{field}", f"{label}: {_format_value(value)}"))
+    
+    if context.keywords:
+        fields.append(("keywords", f"Keywords: {', '.join(context.keywords)}"))
+    
+    for key, value in context.insights.items():
+        if value:
+            fields.append((f"insights.{key}", f"{key}: {_format_value(value)}"))
+    
+    if context.recommendations:
+        fields.append(("recommendations", "Recommendations: " + "; ".join(context.recommendations)))
+    
+    return fields
+
+
+def chunk_business_context(
+    context: BusinessContext,
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None
+) -> List[BusinessContextChunk]:
+    """
+    Split a business context into token-bounded chunks with source provenance.
+    
+    Chunk IDs are derived from the business, source field, position and text,
+    so unchanged chunks keep their ID across re-chunking.
+    
+    Args:
+        context: The business context to split
+        max_tokens: Maximum tokens per chunk (defaults to CHUNK_MAX_TOKENS)
+        overlap_tokens: Tokens shared by consecutive chunks (defaults to CHUNK_OVERLAP_TOKENS)
+    
+    Returns:
+        List of business context chunks
+    """
+    chunks = []
+    for source_field, text in business_context_fields(context):
+        for chunk_index, piece in enumerate(chunk_text(text, max_tokens, overlap_tokens)):
+            chunks.append(BusinessContextChunk(
+                id=str(uuid5(NAMESPACE_URL, f"{context.business_id}/{source_field}/{chunk_index}/{piece}")),
+                business_id=context.business_id,
+                source_field=source_field,
+                chunk_index=chunk_index,
+                chunk_text=piece,
+                token_count=len(encode(piece))
+            ))
+    return chunks
+
+
+async def embed_chunks(chunks: List[BusinessContextChunk]) -> List[Optional[List[float]]]:
+    """
+    Generate embeddings for chunks in batched requests.
+    
+    Args:
+        chunks: The chunks to embed
+    
+    Returns:
+        List of embedding vectors aligned with chunks (None for failed generations)
+    """
+    if not chunks:
+        return []
+    return await generate_embeddings_batch([chunk.chunk_text for chunk in chunks])
+
+
+async def index_business_context_chunks(context: BusinessContext) -> List[BusinessContextChunk]:
+    """
+    Chunk and embed a business context and store the result in the database.
+    
+    Chunk IDs change with their text, so only chunks that were not indexed
+    before are embedded and inserted, chunks that disappeared are deleted, and
+    nothing is embedded or written when no chunk text changed.
+    
+    Args:
+        context: The business context to index
+    
+    Returns:
+        The chunks of the context (also returned when storing them fails)
+    """
+    business_id = context.business_id
+    chunks = chunk_business_context(context)
+    current_ids = {chunk.id for chunk in chunks}
+    previous_ids = _indexed_chunk_ids.get(business_id)
+    
+    if previous_ids == current_ids:
+        logger.info(f"Chunks unchanged, skipping re-embedding for business context: {business_id}")
+        return chunks
+    
+    added = [chunk for chunk in chunks if previous_ids is None or chunk.id not in previous_ids]
+    removed = sorted(previous_ids - current_ids) if previous_ids is not None else []
+    embeddings = await embed_chunks(added)
+    
+    # Chunks whose embedding failed are not stored, so they are retried next time
+    embedded = [(chunk, embedding) for chunk, embedding in zip(added, embeddings) if embedding]
+    failed = {chunk.id for chunk in added} - {chunk.id for chunk, _ in embedded}
+    if failed:
+        logger.warning(f"Failed to embed {len(failed)} of {len(added)} chunks for business context: {business_id}")
+    stored_chunks = [chunk for chunk, _ in embedded]
+    stored_embeddings = [embedding for _, embedding in embedded]
+    
+    try:
+        # Imported here so chunking works without a generated Prisma client
+        from app.db.client import get_prisma_client
+        from app.db.vector_store import apply_business_context_chunk_changes, replace_business_context_chunks
+        
+        db = await get_prisma_client()
+        if previous_ids is None:
+            # Nothing is known about the stored chunks yet, so replace them all
+            await replace_business_context_chunks(
+                db, business_id, stored_chunks, stored_embeddings, model=EMBEDDING_MODEL
+            )
+        else:
+            await apply_business_context_chunk_changes(
+                db, business_id, stored_chunks, stored_embeddings, removed, model=EMBEDDING_MODEL
+            )
+        logger.info(
+            f"Stored chunks for business context {business_id}: "
+            f"{len(stored_chunks)} embedded, {len(removed)} removed, {len(chunks) - len(added)} unchanged"
+        )
+    except Exception as e:
+        logger.error(f"Error storing business context chunks: {str(e)}")
+        return chunks
+    
+    _indexed_chunk_ids.set(business_id, current_ids - failed)
+    return chunks
+
+
+def forget_business_context_chunks(business_id: str) -> None:
+    """
+    Drop what is known about a business's indexed chunks (e.g. after deleting its context).
+    
+    Args:
+        business_id: ID of the business
+    """
+    _indexed_chunk_ids.delete(business_id)
@@ -1,52 +1,175 @@
 import logging
 import json
 import asyncio
-from typing import Dict, Any, List, Optional
-
-import openai
-from openai import AsyncOpenAI
+import time
+from typing import Dict, Any, List, Optional, Awaitable
 
 from app.core.config import settings
 from app.schemas.business_context import BusinessProfile, BusinessContext
 from app.schemas.onboarding import OnboardingState, OnboardingMessage
+from app.services.llm_gateway import llm_gateway
+from app.services.prompt_assembly import count_message_tokens, select_history
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+# Extraction modes: one combined function call, or the per-stage calls with
+# the stages that only depend on the profile run concurrently
+EXTRACTION_MODES = ("single", "dag")
+
+# Business profile fields extracted from the conversation
+PROFILE_PROPERTIES = {
+    "name": {
+        "type": "string",
+        "description": "Business name"
+    },
+    "type": {
+        "type": "string",
+        "description": "Business type/industry"
+    },
+    "description": {
+        "type": "string",
+        "description": "Business description"
+    },
+    "employees": {
+        "type": "integer",
+        "description": "Number of employees"
+    },
+    "year_founded": {
+        "type": "integer",
+        "description": "Year the business was founded"
+    },
+    "target_audience": {
+        "type": "string",
+        "description": "Target audience (B2B, B2C, Both)"
+    },
+    "products_services": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "Products or services offered"
+    },
+    "key_challenges": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "Key business challenges"
+    },
+    "goals": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "Business goals"
+    },
+    "unique_selling_points": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "Unique selling points"
+    },
+    "competitors": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "Known competitors"
+    }
+}
+
+# Insight categories generated for the business
+INSIGHT_PROPERTIES = {
+    "market_positioning": {
+        "type": "string",
+        "description": "Insight about market positioning"
+    },
+    "growth_opportunities": {
+        "type": "string",
+        "description": "Insight about growth opportunities"
+    },
+    "potential_challenges": {
+        "type": "string",
+        "description": "Insight about potential challenges"
+    },
+    "competitive_advantage": {
+        "type": "string",
+        "description": "Insight about competitive advantage"
+    },
+    "customer_needs": {
+        "type": "string",
+        "description": "Insight about customer needs"
+    }
+}
+
+# Timing counters per extraction mode and stage (see get_extraction_stats)
+_stage_stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+
 
 
-async def extract_business_context(business_id: str, onboarding_state: OnboardingState) -> BusinessContext:
+async def extract_business_context(
+    business_id: str,
+    onboarding_state: OnboardingState,
+    mode: Optional[str] = None,
+    use_cache: bool = True
+) -> BusinessContext:
     """
     Extract structured business context from onboarding conversations.
     
+    In "single" mode the profile, keywords, insights and recommendations come
+    from one function call, so the conversation is sent once. In "dag" mode
+    each is extracted by its own call: the profile first, then keywords and
+    insights concurrently, then recommendations from the insights.
+    
     Args:
         business_id: The business ID
         onboarding_state: The onboarding state containing conversation history
+        mode: Extraction mode, "single" or "dag" (defaults to CONTEXT_EXTRACTION_MODE)
+        use_cache: Reuse the results of identical earlier extraction calls, so
+            re-extracting an unchanged onboarding state costs no tokens
     
     Returns:
         Structured business context
     """
+    mode = mode or settings.CONTEXT_EXTRACTION_MODE
+    if mode not in EXTRACTION_MODES:
+        logger.warning(f"Unknown context extraction mode: {mode}. Using single mode.")
+        mode = "single"
+    
     # Check if OpenAI API key is configured
     if not settings.OPENAI_API_KEY:
         logger.warning("OpenAI API key not set. Using basic context extraction.")
         return await extract_basic_context(business_id, onboarding_state)
     
+    # Skip the provider entirely while it is degraded
+    if not llm_gateway.is_available():
+        logger.warning("LLM provider degraded (circuit breaker open). Using basic context extraction.")
+        return await extract_basic_context(business_id, onboarding_state)
+    
     try:
         # Create conversation history for context
         conversation_history = _prepare_conversation_for_extraction(onboarding_state)
         
-        # Extract business profile using OpenAI
-        profile = await extract_business_profile(conversation_history)
-        
-        # Extract keywords
-        keywords = await extract_keywords(conversation_history, profile)
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
         
-        # Generate insights
-        insights = await generate_business_insights(conversation_history, profile)
+        if mode == "single":
+            # Extract everything in one round-trip
+            extracted = await _timed("extract", timings, extract_full_context(conversation_history, cache=use_cache))
+            profile = extracted["profile"]
+            keywords = extracted["keywords"]
+            insights = extracted["insights"]
+            recommendations = extracted["recommendations"]
+        else:
+            # Extract business profile using OpenAI
+            profile = await _timed("profile", timings, extract_business_profile(conversation_history, cache=use_cache))
+            
+            # Keywords and insights only depend on the profile
+            keywords, insights = await asyncio.gather(
+                _timed("keywords", timings, extract_keywords(conversation_history, profile, cache=use_cache)),
+                _timed("insights", timings, generate_business_insights(conversation_history, profile, cache=use_cache))
+            )
+            
+            # Generate recommendations
+            recommendations = await _timed("recommendations", timings, generate_recommendations(profile, insights, cache=use_cache))
         
-        # Generate recommendations
-        recommendations = await generate_recommendations(profile, insights)
+        timings["total"] = (time.perf_counter() - started) * 1000
+        _record_timings(mode, timings)
+        logger.info(
+            f"Extracted business context for {business_id} in {mode} mode: "
+            + ", ".join(f"{stage} {elapsed_ms:.0f}ms" for stage, elapsed_ms in timings.items())
+        )
         
         # Create and return the business context
         return BusinessContext(
@@ -63,6 +186,47 @@ async def extract_business_context(business_id: str, onboarding_state: Onboardin
         return await extract_basic_context(business_id, onboarding_state)
 
 
+async def _timed(stage: str, timings: Dict[str, float], awaitable: Awaitable[Any]) -> Any:
+    """Await an extraction stage and record its duration in milliseconds."""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = (time.perf_counter() - started) * 1000
+
+
+def _record_timings(mode: str, timings: Dict[str, float]) -> None:
+    """Add the stage durations of one extraction to the timing counters."""
+    mode_stats = _stage_stats.setdefault(mode, {})
+    for stage, elapsed_ms in timings.items():
+        stats = mode_stats.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["last_ms"] = elapsed_ms
+
+
+def get_extraction_stats() -> Dict[str, Any]:
+    """
+    Get the timing of context extractions per mode and stage.
+    
+    Returns:
+        Dictionary of mode -> stage -> count, avg_ms, max_ms and last_ms
+    """
+    return {
+        mode: {
+            stage: {
+                "count": stats["count"],
+                "avg_ms": round(stats["total_ms"] / stats["count"], 1),
+                "max_ms": round(stats["max_ms"], 1),
+                "last_ms": round(stats["last_ms"], 1),
+            }
+            for stage, stats in mode_stats.items()
+        }
+        for mode, mode_stats in _stage_stats.items()
+    }
+
+
 async def extract_basic_context(business_id: str, onboarding_state: OnboardingState) -> BusinessContext:
     """
     Extract basic business context from onboarding state without using AI.
@@ -118,12 +282,16 @@ def _prepare_conversation_for_extraction(onboarding_state: OnboardingState) -> L
     """
     Prepare conversation history for context extraction.
     
+    The business data is always included; the conversation is fitted into
+    EXTRACTION_PROMPT_TOKEN_BUDGET, keeping its newest turns.
+    
     Args:
         onboarding_state: The onboarding state
     
     Returns:
         A list of message dictionaries suitable for context extraction
     """
+    context_messages = []
     history = []
     
     # Add business data as a system message for context
@@ -131,7 +299,7 @@ def _prepare_conversation_for_extraction(onboarding_state: OnboardingState) -> L
         business_data_str = "Business data collected during onboarding:\n"
         for key, value in onboarding_state.businessData.items():
             business_data_str += f"- {key}: {value}\n"
-        history.append({"role": "system", "content": business_data_str})
+        context_messages.append({"role": "system", "content": business_data_str})
     
     # Add conversation history
     for message in onboarding_state.conversationHistory:
@@ -155,81 +323,110 @@ def _prepare_conversation_for_extraction(onboarding_state: OnboardingState) -> L
                 form_text = message.content + "\nForm with fields: " + ", ".join([input.label for input in message.formInputs])
                 history.append({"role": "assistant", "content": form_text})
     
-    return history
+    history_budget = settings.EXTRACTION_PROMPT_TOKEN_BUDGET - sum(count_message_tokens(message) for message in context_messages)
+    return context_messages + select_history(history, history_budget)
 
 
-async def extract_business_profile(conversation_history: List[Dict[str, Any]]) -> BusinessProfile:
+async def extract_full_context(conversation_history: List[Dict[str, Any]], cache: bool = True) -> Dict[str, Any]:
     """
-    Extract business profile information from conversation history using OpenAI.
+    Extract the profile, keywords, insights and recommendations in one call using OpenAI.
     
     Args:
         conversation_history: The conversation history
+        cache: Reuse the result of an identical earlier extraction (False to bypass the LLM cache)
     
     Returns:
-        A structured business profile
+        Dictionary with the "profile" (BusinessProfile), "keywords", "insights"
+        and "recommendations"
     """
     system_prompt = """
-    You are an AI assistant that extracts structured business profile information from conversations.
-    Extract as much relevant information as possible about the business from the conversation.
-    Focus on factual information only, do not make assumptions.
+    You are an AI assistant that builds a structured business context from onboarding conversations.
+    Extract the business profile using factual information from the conversation only, do not make assumptions.
+    Extract 5-10 keywords that best represent the business: industry-specific terms, business categories and distinctive features.
+    Generate 3-5 actionable insights about market positioning, growth opportunities and potential challenges.
+    Generate 3-5 clear, specific and actionable recommendations based on the profile and insights.
     """
     
     function_definition = {
-        "name": "extract_business_profile",
-        "description": "Extract business profile information from conversation",
+        "name": "extract_business_context",
+        "description": "Extract business profile, keywords, insights and recommendations from conversation",
         "parameters": {
             "type": "object",
             "properties": {
-                "name": {
-                    "type": "string",
-                    "description": "Business name"
-                },
-                "type": {
-                    "type": "string",
-                    "description": "Business type/industry"
-                },
-                "description": {
-                    "type": "string",
-                    "description": "Business description"
-                },
-                "employees": {
-                    "type": "integer",
-                    "description": "Number of employees"
+                "profile": {
+                    "type": "object",
+                    "properties": PROFILE_PROPERTIES,
+                    "description": "Business profile information"
                 },
-                "year_founded": {
-                    "type": "integer",
-                    "description": "Year the business was founded"
-                },
-                "target_audience": {
-                    "type": "string",
-                    "description": "Target audience (B2B, B2C, Both)"
-                },
-                "products_services": {
-                    "type": "array",
-                    "items": {"type": "string"},
-                    "description": "Products or services offered"
-                },
-                "key_challenges": {
-                    "type": "array",
-                    "items": {"type": "string"},
-                    "description": "Key business challenges"
-                },
-                "goals": {
+                "keywords": {
                     "type": "array",
                     "items": {"type": "string"},
-                    "description": "Business goals"
+                    "description": "List of business keywords"
                 },
-                "unique_selling_points": {
-                    "type": "array",
-                    "items": {"type": "string"},
-                    "description": "Unique selling points"
+                "insights": {
+                    "type": "object",
+                    "properties": INSIGHT_PROPERTIES,
+                    "description": "Business insights"
                 },
-                "competitors": {
+                "recommendations": {
                     "type": "array",
                     "items": {"type": "string"},
-                    "description": "Known competitors"
+                    "description": "List of business recommendations"
                 }
             },
+            "required": ["profile", "keywords", "insights", "recommendations"]
+        }
+    }
+    
+    messages = [
+        {"role": "system", "content": system_prompt},
+        *conversation_history
+    ]
+    
+    # Call OpenAI API through the shared gateway (pooled, rate-limited, retried)
+    response = await llm_gateway.chat_completion(
+        messages=messages,
+        functions=[function_definition],
+        function_call={"name": "extract_business_context"},
+        cache=cache,
+        temperature=0.2,  # Low temperature for factual extraction
+    )
+    
+    # Process the response
+    ai_message = response.choices[0].message
+    function_args = json.loads(ai_message.function_call.arguments) if ai_message.function_call else {}
+    
+    return {
+        "profile": BusinessProfile(**(function_args.get("profile") or {})),
+        "keywords": function_args.get("keywords") or [],
+        "insights": {k: v for k, v in (function_args.get("insights") or {}).items() if v},
+        "recommendations": function_args.get("recommendations") or [],
+    }
+
+
+async def extract_business_profile(conversation_history: List[Dict[str, Any]], cache: bool = True) -> BusinessProfile:
+    """
+    Extract business profile information from conversation history using OpenAI.
+    
+    Args:
+        conversation_history: The conversation history
+        cache: Reuse the result of an identical earlier extraction (False to bypass the LLM cache)
+    
+    Returns:
+        A structured business profile
+    """
+    system_prompt = """
+    You are an AI assistant that extracts structured business profile information from conversations.
+    Extract as much relevant information as possible about the business from the conversation.
+    Focus on factual information only, do not make assumptions.
+    """
+    
+    function_definition = {
+        "name": "extract_business_profile",
+        "description": "Extract business profile information from conversation",
+        "parameters": {
+            "type": "object",
+            "properties": PROFILE_PROPERTIES,
             "required": []
         }
     }
@@ -239,12 +436,12 @@ async def extract_business_profile(conversation_history: List[Dict[str, Any]]) -
         *conversation_history
     ]
     
-    # Call OpenAI API
-    response = await openai_client.chat.completions.create(
-        model=settings.OPENAI_MODEL,
+    # Call OpenAI API through the shared gateway (pooled, rate-limited, retried)
+    response = await llm_gateway.chat_completion(
         messages=messages,
         functions=[function_definition],
         function_call={"name": "extract_business_profile"},
+        cache=cache,
         temperature=0.1,  # Low temperature for more factual extraction
     )
     
@@ -262,7 +459,8 @@ async def extract_business_profile(conversation_history: List[Dict[str, Any]]) -
 
 async def extract_keywords(
     conversation_history: List[Dict[str, Any]], 
-    profile: BusinessProfile
+    profile: BusinessProfile,
+    cache: bool = True
 ) -> List[str]:
     """
     Extract relevant keywords from conversation history and business profile.
@@ -270,6 +468,7 @@ async def extract_keywords(
     Args:
         conversation_history: The conversation history
         profile: The business profile
+        cache: Reuse the result of an identical earlier extraction (False to bypass the LLM cache)
     
     Returns:
         A list of keywords
@@ -310,12 +509,12 @@ async def extract_keywords(
         }
     }
     
-    # Call OpenAI API
-    response = await openai_client.chat.completions.create(
-        model=settings.OPENAI_MODEL,
+    # Call OpenAI API through the shared gateway (pooled, rate-limited, retried)
+    response = await llm_gateway.chat_completion(
         messages=messages,
         functions=[function_definition],
         function_call={"name": "extract_keywords"},
+        cache=cache,
         temperature=0.3,
     )
     
@@ -333,7 +532,8 @@ async def extract_keywords(
 
 async def generate_business_insights(
     conversation_history: List[Dict[str, Any]],
-    profile: BusinessProfile
+    profile: BusinessProfile,
+    cache: bool = True
 ) -> Dict[str, Any]:
     """
     Generate business insights based on conversation history and profile.
@@ -341,6 +541,7 @@ async def generate_business_insights(
     Args:
         conversation_history: The conversation history
         profile: The business profile
+        cache: Reuse the result of an identical earlier extraction (False to bypass the LLM cache)
     
     Returns:
         A dictionary of business insights
@@ -370,38 +571,17 @@ async def generate_business_insights(
         "description": "Generate business insights",
         "parameters": {
             "type": "object",
-            "properties": {
-                "market_positioning": {
-                    "type": "string",
-                    "description": "Insight about market positioning"
-                },
-                "growth_opportunities": {
-                    "type": "string",
-                    "description": "Insight about growth opportunities"
-                },
-                "potential_challenges": {
-                    "type": "string",
-                    "description": "Insight about potential challenges"
-                },
-                "competitive_advantage": {
-                    "type": "string",
-                    "description": "Insight about competitive advantage"
-                },
-                "customer_needs": {
-                    "type": "string",
-                    "description": "Insight about customer needs"
-                }
-            },
+            "properties": INSIGHT_PROPERTIES,
             "required": []
         }
     }
     
-    # Call OpenAI API
-    response = await openai_client.chat.completions.create(
-        model=settings.OPENAI_MODEL,
+    # Call OpenAI API through the shared gateway (pooled, rate-limited, retried)
+    response = await llm_gateway.chat_completion(
         messages=messages,
         functions=[function_definition],
         function_call={"name": "generate_business_insights"},
+        cache=cache,
         temperature=0.5,
     )
     
@@ -419,7 +599,8 @@ async def generate_business_insights(
 
 async def generate_recommendations(
     profile: BusinessProfile,
-    insights: Dict[str, Any]
+    insights: Dict[str, Any],
+    cache: bool = True
 ) -> List[str]:
     """
     Generate business recommendations based on profile and insights.
@@ -427,6 +608,7 @@ async def generate_recommendations(
     Args:
         profile: The business profile
         insights: The business insights
+        cache: Reuse the result of an identical earlier extraction (False to bypass the LLM cache)
     
     Returns:
         A list of business recommendations
@@ -471,12 +653,12 @@ async def generate_recommendations(
         }
     }
     
-    # Call OpenAI API
-    response = await openai_client.chat.completions.create(
-        model=settings.OPENAI_MODEL,
+    # Call OpenAI API through the shared gateway (pooled, rate-limited, retried)
+    response = await llm_gateway.chat_completion(
         messages=messages,
         functions=[function_definition],
         function_call={"name": "generate_recommendations"},
+        cache=cache,
         temperature=0.5,
     )
     
@@ -1,19 +1,81 @@
 import logging
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple, Union
-import json
 
-from app.services.embedding_service import calculate_similarity, generate_embedding
-from app.schemas.business_context import BusinessContext
+from app.services.embedding_service import (
+    build_business_context_text,
+    generate_embedding,
+    generate_embeddings_batch
+)
+from app.services.chunking_service import business_context_fields
+from app.services.keyword_index import STOP_WORDS, KeywordIndex, keyword_indexes, tokenize
+from app.services.vector_index import VectorIndex, chunk_indexes, context_indexes, top_k_by_score
+from app.schemas.business_context import BusinessContext, BusinessContextChunk
 
 logger = logging.getLogger(__name__)
 
+# Score fusion modes supported by hybrid retrieval
+HYBRID_FUSION_MODES = ("weighted", "rrf")
+
+# Rank constant for reciprocal-rank fusion (larger values flatten the rank contribution)
+RRF_K = 60
+
+# Candidates taken from each ranking per requested result before reciprocal-rank fusion
+RRF_CANDIDATES_PER_RESULT = 10
+
+
+def _context_version(context: BusinessContext) -> str:
+    """Version marker used to detect contexts that changed since they were indexed."""
+    return context.updated_at.isoformat()
+
+
+async def sync_context_index(index: VectorIndex, contexts: List[BusinessContext]) -> None:
+    """
+    Bring a vector index in line with a list of business contexts.
+    
+    Contexts that are new or changed since they were indexed are embedded in one
+    batch (served from the embedding cache when unchanged); indexed contexts that
+    are no longer in the list are removed.
+    
+    Args:
+        index: The vector index to update
+        contexts: The business contexts the index should contain
+    """
+    current_ids = {context.business_id for context in contexts}
+    for item_id in [item_id for item_id in index.ids if item_id not in current_ids]:
+        index.remove(item_id)
+    
+    stale = [
+        context for context in contexts
+        if context.business_id not in index or index.version(context.business_id) != _context_version(context)
+    ]
+    if not stale:
+        return
+    
+    # Use pre-computed embeddings where available and batch-generate the rest
+    embeddings = [getattr(context, "embedding", None) for context in stale]
+    missing = [i for i, embedding in enumerate(embeddings) if not embedding]
+    if missing:
+        generated = await generate_embeddings_batch([
+            build_business_context_text(stale[i].model_dump()) for i in missing
+        ])
+        for i, embedding in zip(missing, generated):
+            embeddings[i] = embedding
+    
+    for context, embedding in zip(stale, embeddings):
+        if not embedding:
+            logger.warning(f"Failed to generate embedding for context {context.business_id}")
+            index.remove(context.business_id)
+            continue
+        index.add(context.business_id, embedding, version=_context_version(context))
+
 
 async def retrieve_similar_contexts(
     query: str,
     contexts: List[BusinessContext],
     top_k: int = 3,
-    similarity_threshold: float = 0.7
+    similarity_threshold: float = 0.7,
+    scope: Optional[str] = None
 ) -> List[Tuple[BusinessContext, float]]:
     """
     Retrieve business contexts similar to the query text.
@@ -23,6 +85,8 @@ async def retrieve_similar_contexts(
         contexts: List of business contexts to search within
         top_k: Number of top results to return
         similarity_threshold: Minimum similarity score (0-1) to include in results
+        scope: Optional index scope (e.g. the user ID) whose vector index is reused
+            across calls and updated incrementally; a throwaway index is used if omitted
     
     Returns:
         List of (business_context, similarity_score) tuples, sorted by similarity
@@ -34,72 +98,144 @@ async def retrieve_similar_contexts(
         logger.error("Failed to generate embedding for query")
         return []
     
-    # Calculate similarity scores for each context
-    results = []
+    index = context_indexes.get(scope) if scope else VectorIndex()
+    await sync_context_index(index, contexts)
     
-    for context in contexts:
-        # Convert context to a dictionary for embedding generation
-        context_dict = context.model_dump()
-        
-        # Generate embedding for the context (or use pre-computed embedding if available)
-        if hasattr(context, "embedding") and context.embedding:
-            context_embedding = context.embedding
-        else:
-            context_embedding = await generate_embedding(json.dumps(context_dict))
-        
-        if not context_embedding:
-            logger.warning(f"Failed to generate embedding for context {context.business_id}")
+    # Score every context with one matrix-vector product and take the top_k
+    contexts_by_id = {context.business_id: context for context in contexts}
+    
+    async def fetch_embeddings(item_ids: List[str]) -> List[Optional[List[float]]]:
+        # Served from the embedding cache; only evicted vectors are generated again
+        return await generate_embeddings_batch([
+            build_business_context_text(contexts_by_id[item_id].model_dump()) for item_id in item_ids
+        ])
+    
+    results = await context_indexes.search(index, query_embedding, top_k, similarity_threshold, fetch_embeddings)
+    return [(contexts_by_id[item_id], similarity) for item_id, similarity in results]
+
+
+async def sync_chunk_index(index: VectorIndex, chunks: List[BusinessContextChunk]) -> None:
+    """
+    Bring a vector index in line with a list of context chunks.
+    
+    Chunk IDs change whenever chunk text changes, so only chunks missing from the
+    index are embedded (in one batch); indexed chunks that are no longer in the
+    list are removed.
+    
+    Args:
+        index: The vector index to update
+        chunks: The chunks the index should contain
+    """
+    current_ids = {chunk.id for chunk in chunks}
+    for item_id in [item_id for item_id in index.ids if item_id not in current_ids]:
+        index.remove(item_id)
+    
+    missing = [chunk for chunk in chunks if chunk.id not in index]
+    if not missing:
+        return
+    
+    embeddings = await generate_embeddings_batch([chunk.chunk_text for chunk in missing])
+    for chunk, embedding in zip(missing, embeddings):
+        if not embedding:
+            logger.warning(f"Failed to generate embedding for chunk {chunk.id} ({chunk.source_field})")
             continue
-        
-        # Calculate similarity score
-        similarity = calculate_similarity(query_embedding, context_embedding)
-        
-        # Add to results if above threshold
-        if similarity >= similarity_threshold:
-            results.append((context, similarity))
+        index.add(chunk.id, embedding)
+
+
+async def retrieve_similar_chunks(
+    query: str,
+    chunks: List[BusinessContextChunk],
+    top_k: int = 5,
+    similarity_threshold: float = 0.7,
+    scope: Optional[str] = None
+) -> List[Tuple[BusinessContextChunk, float]]:
+    """
+    Retrieve the business context chunks most similar to the query text.
+    
+    Args:
+        query: The query text to find similar chunks for
+        chunks: List of chunks to search within
+        top_k: Number of top results to return
+        similarity_threshold: Minimum similarity score (0-1) to include in results
+        scope: Optional index scope (e.g. the user ID) whose vector index is reused
+            across calls and updated incrementally; a throwaway index is used if omitted
+    
+    Returns:
+        List of (chunk, similarity_score) tuples, sorted by similarity
+    """
+    query_embedding = await generate_embedding(query)
+    
+    if not query_embedding:
+        logger.error("Failed to generate embedding for query")
+        return []
+    
+    index = chunk_indexes.get(scope) if scope else VectorIndex()
+    await sync_chunk_index(index, chunks)
+    
+    chunks_by_id = {chunk.id: chunk for chunk in chunks}
+    
+    async def fetch_embeddings(item_ids: List[str]) -> List[Optional[List[float]]]:
+        # Served from the embedding cache; only evicted vectors are generated again
+        return await generate_embeddings_batch([chunks_by_id[item_id].chunk_text for item_id in item_ids])
+    
+    results = await chunk_indexes.search(index, query_embedding, top_k, similarity_threshold, fetch_embeddings)
+    return [(chunks_by_id[item_id], similarity) for item_id, similarity in results]
+
+
+def sync_keyword_index(index: KeywordIndex, contexts: List[BusinessContext]) -> None:
+    """
+    Bring a keyword index in line with a list of business contexts.
+    
+    Args:
+        index: The keyword index to update
+        contexts: The business contexts the index should contain
+    """
+    current_ids = {context.business_id for context in contexts}
+    for doc_id in [doc_id for doc_id in index.ids if doc_id not in current_ids]:
+        index.remove(doc_id)
     
-    # Sort by similarity score (descending) and take top_k
-    results.sort(key=lambda x: x[1], reverse=True)
-    return results[:top_k]
+    for context in contexts:
+        version = _context_version(context)
+        if context.business_id not in index or index.version(context.business_id) != version:
+            index.add(context.business_id, business_context_fields(context), version=version)
 
 
 async def retrieve_context_by_keywords(
     keywords: List[str],
     contexts: List[BusinessContext],
     top_k: int = 3,
-    match_threshold: int = 1
-) -> List[Tuple[BusinessContext, int]]:
+    match_threshold: int = 1,
+    scope: Optional[str] = None
+) -> List[Tuple[BusinessContext, float]]:
     """
-    Retrieve business contexts by matching keywords.
+    Retrieve business contexts by matching keywords, ranked with BM25.
+    
+    Keywords are matched against the context keywords, profile fields and
+    insights through an inverted index.
     
     Args:
         keywords: List of keywords to match
         contexts: List of business contexts to search within
         top_k: Number of top results to return
-        match_threshold: Minimum number of keyword matches to include in results
+        match_threshold: Minimum number of distinct keyword terms a context must contain
+        scope: Optional index scope (e.g. the user ID) whose keyword index is reused
+            across calls and updated incrementally; a throwaway index is used if omitted
     
     Returns:
-        List of (business_context, match_count) tuples, sorted by match count
+        List of (business_context, bm25_score) tuples, sorted by score
     """
-    # Convert keywords to lowercase for case-insensitive matching
-    lowercase_keywords = [k.lower() for k in keywords]
-    
-    results = []
+    terms = [term for keyword in keywords for term in tokenize(keyword)]
+    if not terms:
+        return []
     
-    for context in contexts:
-        # Get context keywords and convert to lowercase
-        context_keywords = [k.lower() for k in context.keywords]
-        
-        # Count matching keywords
-        match_count = sum(1 for k in lowercase_keywords if k in context_keywords)
-        
-        # Add to results if above threshold
-        if match_count >= match_threshold:
-            results.append((context, match_count))
+    index = keyword_indexes.get(scope) if scope else KeywordIndex()
+    sync_keyword_index(index, contexts)
     
-    # Sort by match count (descending) and take top_k
-    results.sort(key=lambda x: x[1], reverse=True)
-    return results[:top_k]
+    contexts_by_id = {context.business_id: context for context in contexts}
+    return [
+        (contexts_by_id[doc_id], score)
+        for doc_id, score in index.search(terms, top_k, match_threshold)
+    ]
 
 
 async def retrieve_similar_contexts_hybrid(
@@ -108,11 +244,20 @@ async def retrieve_similar_contexts_hybrid(
     contexts: List[BusinessContext],
     top_k: int = 3,
     vector_weight: float = 0.7,
-    keyword_weight: float = 0.3
+    keyword_weight: float = 0.3,
+    fusion: str = "weighted",
+    scope: Optional[str] = None
 ) -> List[Tuple[BusinessContext, float]]:
     """
     Retrieve business contexts using a hybrid approach combining vector similarity and keyword matching.
     
+    The query is embedded once and both signals are scored in a single pass
+    over the candidate set, then fused:
+    
+    - "weighted": weighted sum of cosine similarity and BM25 scaled to the best match
+    - "rrf": weighted reciprocal-rank fusion of the top candidates of each ranking
+      (robust when the two score scales are not comparable)
+    
     Args:
         query: The query text to find similar contexts for
         keywords: List of keywords to match
@@ -120,41 +265,78 @@ async def retrieve_similar_contexts_hybrid(
         top_k: Number of top results to return
         vector_weight: Weight for vector similarity scores (0-1)
         keyword_weight: Weight for keyword matching scores (0-1)
+        fusion: Fusion mode, "weighted" or "rrf"
+        scope: Optional index scope (e.g. the user ID) whose indexes are reused
+            across calls and updated incrementally; throwaway indexes are used if omitted
     
     Returns:
         List of (business_context, combined_score) tuples, sorted by combined score
     """
+    if fusion not in HYBRID_FUSION_MODES:
+        raise ValueError(f"Unknown fusion mode: {fusion}")
+    if not contexts or top_k <= 0:
+        return []
+    
     # Ensure weights sum to 1
     total_weight = vector_weight + keyword_weight
     if total_weight != 1.0:
         vector_weight = vector_weight / total_weight
         keyword_weight = keyword_weight / total_weight
     
-    # Get vector similarity results
-    vector_results = await retrieve_similar_contexts(query, contexts, top_k=len(contexts))
-    
-    # Get keyword matching results
-    keyword_results = await retrieve_context_by_keywords(keywords, contexts, top_k=len(contexts))
+    # Vector scores for every indexed context from one matrix-vector product
+    query_embedding = await generate_embedding(query)
+    vector_index = context_indexes.get(scope) if scope else VectorIndex()
+    if query_embedding:
+        await sync_context_index(vector_index, contexts)
+        ids = list(vector_index.ids)
+        vector_scores = vector_index.scores(query_embedding).astype(np.float32)
+    else:
+        logger.warning("Failed to generate embedding for query, using keyword scores only")
+        ids = []
+        vector_scores = np.zeros(0, dtype=np.float32)
     
-    # Create dictionaries for easy lookup
-    vector_scores = {context.business_id: score for context, score in vector_results}
-    keyword_scores = {context.business_id: score / max(len(keywords), 1) for context, score in keyword_results}
+    # BM25 scores for the contexts that contain any keyword term
+    keyword_index = keyword_indexes.get(scope) if scope else KeywordIndex()
+    sync_keyword_index(keyword_index, contexts)
+    terms = [term for keyword in keywords for term in tokenize(keyword)]
+    keyword_matches = keyword_index.scores(terms) if terms else {}
     
-    # Combine scores
-    combined_results = []
+    # Align keyword scores with the vector scores; contexts without a vector
+    # (e.g. a failed embedding) can still be found by keywords
+    extra_positions = {
+        doc_id: len(ids) + i
+        for i, doc_id in enumerate(
+            doc_id for doc_id in keyword_matches
+            if not query_embedding or vector_index.position(doc_id) is None
+        )
+    }
+    ids.extend(extra_positions)
+    vector_scores = np.append(vector_scores, np.zeros(len(extra_positions), dtype=np.float32))
+    keyword_scores = np.zeros(len(ids), dtype=np.float32)
+    for doc_id, score in keyword_matches.items():
+        position = extra_positions.get(doc_id)
+        keyword_scores[vector_index.position(doc_id) if position is None else position] = score
     
-    for context in contexts:
-        vector_score = vector_scores.get(context.business_id, 0.0)
-        keyword_score = keyword_scores.get(context.business_id, 0.0)
-        
-        # Calculate combined score
-        combined_score = (vector_score * vector_weight) + (keyword_score * keyword_weight)
-        
-        combined_results.append((context, combined_score))
+    if fusion == "weighted":
+        # BM25 scores are unbounded, so scale them to 0-1 relative to the best match
+        top_keyword_score = float(keyword_scores.max()) if len(keyword_scores) else 0.0
+        if top_keyword_score > 0:
+            keyword_scores /= top_keyword_score
+        combined = vector_weight * vector_scores + keyword_weight * keyword_scores
+        results = top_k_by_score(ids, combined, top_k)
+    else:
+        depth = top_k * RRF_CANDIDATES_PER_RESULT
+        combined = np.zeros(len(ids), dtype=np.float32)
+        positions = range(len(ids))
+        if query_embedding:
+            for rank, (position, _) in enumerate(top_k_by_score(positions, vector_scores, depth)):
+                combined[position] += vector_weight / (RRF_K + rank + 1)
+        for rank, (position, _) in enumerate(top_k_by_score(positions, keyword_scores, depth, min_score=1e-9)):
+            combined[position] += keyword_weight / (RRF_K + rank + 1)
+        results = top_k_by_score(ids, combined, top_k, min_score=1e-9)
     
-    # Sort by combined score (descending) and take top_k
-    combined_results.sort(key=lambda x: x[1], reverse=True)
-    return combined_results[:top_k]
+    contexts_by_id = {context.business_id: context for context in contexts}
+    return [(contexts_by_id[item_id], score) for item_id, score in results]
 
 
 async def extract_keywords_from_query(query: str, max_keywords: int = 5) -> List[str]:
@@ -173,20 +355,6 @@ async def extract_keywords_from_query(query: str, max_keywords: int = 5) -> List
     # In a production system, you would use a more sophisticated approach,
     # such as TF-IDF, TextRank, or a pre-trained keyword extraction model.
     
-    # Define a simple list of stop words
-    stop_words = {
-        "a", "an", "the", "and", "or", "but", "if", "because", "as", "what",
-        "when", "where", "how", "who", "which", "this", "that", "these", "those",
-        "is", "are", "was", "were", "be", "been", "being", "have", "has", "had",
-        "do", "does", "did", "can", "could", "will", "would", "should", "shall",
-        "may", "might", "must", "to", "for", "with", "about", "against", "between",
-        "into", "through", "during", "before", "after", "above", "below", "from",
-        "up", "down", "in", "out", "on", "off", "over", "under", "again", "further",
-        "then", "once", "here", "there", "all", "any", "both", "each", "few", "more",
-        "most", "other", "some", "such", "no", "nor", "not", "only", "own", "same",
-        "so", "than", "too", "very", "just", "now"
-    }
-    
     # Tokenize the query
     words = query.lower().split()
     
@@ -197,7 +365,7 @@ async def extract_keywords_from_query(query: str, max_keywords: int = 5) -> List
         word = ''.join(c for c in word if c.isalnum())
         
         # Skip stop words and short words
-        if word and word not in stop_words and len(word) > 2:
+        if word and word not in STOP_WORDS and len(word) > 2:
             filtered_words.append(word)
     
     # Count word frequencies
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
+
+from app.core.config import settings
+from app.core.tokenizer import count_tokens
+from app.services.embedding_service import EMBEDDING_MODEL, fit_to_input_limit, generate_embeddings_batch
+
+logger = logging.getLogger(__name__)
+
+# Tables that can be backfilled
+BACKFILL_TARGETS = ("knowledge_items", "context_chunks")
+
+
+def _target_functions(target: str) -> Tuple[Callable[..., Awaitable[List[Dict[str, Any]]]], Callable[..., Awaitable[int]]]:
+    """
+    Get the page reader and bulk writer for a backfill target.
+    
+    Args:
+        target: One of BACKFILL_TARGETS
+    
+    Returns:
+        Tuple of (fetch_page, write_embeddings) database functions
+    """
+    # Imported here so the engine can be loaded without a generated Prisma client
+    from app.db import vector_store
+    
+    if target == "knowledge_items":
+        return vector_store.fetch_knowledge_items_for_embedding, vector_store.bulk_update_knowledge_item_embeddings
+    if target == "context_chunks":
+        return vector_store.fetch_business_context_chunks_for_embedding, vector_store.upsert_business_context_embeddings
+    raise ValueError(f"Unknown backfill target: {target}")
+
+
+def batch_by_tokens(
+    items: List[Tuple[str, str, int]],
+    max_batch_size: int,
+    max_batch_tokens: int
+) -> List[List[Tuple[str, str, int]]]:
+    """
+    Group texts into request batches bounded by input count and total tokens.
+    
+    Args:
+        items: (row_id, text, token_count) tuples
+        max_batch_size: Maximum number of texts per batch
+        max_batch_tokens: Maximum total tokens per batch
+    
+    Returns:
+        List of batches, in input order
+    """
+    batches = []
+    batch: List[Tuple[str, str, int]] = []
+    batch_tokens = 0
+    for item in items:
+        tokens = item[2]
+        if batch and (len(batch) >= max_batch_size or batch_tokens + tokens > max_batch_tokens):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class BackfillCheckpoint:
+    """
+    Progress of backfill runs, persisted as a JSON file so a run can resume
+    from the last fully written page.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else None
+    
+    def _read(self) -> Dict[str, Any]:
+        if not self.path or not self.path.exists():
+            return {}
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable backfill checkpoint {self.path}: {str(e)}")
+            return {}
+    
+    def load(self, key: str) -> Dict[str, Any]:
+        """Get the saved state of a run, or an empty dict."""
+        return self._read().get(key, {})
+    
+    def save(self, key: str, state: Dict[str, Any]) -> None:
+        """Save the state of a run (written atomically)."""
+        if not self.path:
+            return
+        data = self._read()
+        data[key] = state
+        temp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        temp_path.write_text(json.dumps(data, indent=2))
+        os.replace(temp_path, self.path)
+
+
+async def run_embedding_backfill(
+    db: Any,
+    target: str,
+    only_missing: bool = True,
+    business_id: Optional[str] = None,
+    page_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    checkpoint_path: Optional[str] = None,
+    restart: bool = False,
+    max_rows: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Generate and store embeddings for every row of a table, page by page.
+    
+    Rows are read in ID order with keyset pagination, grouped into requests up
+    to the provider's batch limits, embedded with a bounded number of
+    concurrent requests and written back in bulk. The last written ID is
+    checkpointed after every page, so an interrupted run resumes where it
+    stopped. Rows whose embedding fails are skipped and can be picked up by
+    a later run with only_missing=True.
+    
+    Args:
+        db: Prisma client
+        target: "knowledge_items" or "context_chunks"
+        only_missing: Only embed rows without an embedding or embedded with another model version
+            (False re-embeds everything)
+        business_id: Optional business ID to restrict the backfill to
+        page_size: Rows read per page (defaults to EMBEDDING_BACKFILL_PAGE_SIZE)
+        concurrency: Maximum concurrent embedding requests (defaults to EMBEDDING_BACKFILL_CONCURRENCY)
+        checkpoint_path: Optional JSON file used to save and resume progress
+        restart: Ignore any saved progress and start from the first row
+        max_rows: Optional maximum number of rows to process in this run
+    
+    Returns:
+        Dictionary of run statistics, including rows_per_second and tokens_per_second
+    """
+    fetch_page, write_embeddings = _target_functions(target)
+    page_size = page_size or settings.EMBEDDING_BACKFILL_PAGE_SIZE
+    semaphore = asyncio.Semaphore(concurrency or settings.EMBEDDING_BACKFILL_CONCURRENCY)
+    
+    checkpoint = BackfillCheckpoint(checkpoint_path)
+    key = f"{target}:{business_id or '*'}:{'missing' if only_missing else 'all'}"
+    saved = {} if restart else checkpoint.load(key)
+    resume = bool(saved) and not saved.get("completed")
+    last_id = saved.get("last_id") if resume else None
+    if resume:
+        logger.info(f"Resuming {target} backfill after ID {last_id}")
+    
+    stats = {
+        "target": target,
+        "rows": 0,
+        "embedded": 0,
+        "failed": 0,
+        "tokens": 0,
+        "pages": 0,
+    }
+    started = time.perf_counter()
+    
+    async def embed_batch(batch: List[Tuple[str, str, int]]) -> List[Tuple[str, Optional[List[float]]]]:
+        async with semaphore:
+            embeddings = await generate_embeddings_batch([text for _, text, _ in batch])
+        return [(row_id, embedding) for (row_id, _, _), embedding in zip(batch, embeddings)]
+    
+    completed = False
+    while max_rows is None or stats["rows"] < max_rows:
+        limit = page_size if max_rows is None else min(page_size, max_rows - stats["rows"])
+        rows = await fetch_page(
+            db, last_id, limit, only_missing=only_missing, business_id=business_id, model=EMBEDDING_MODEL
+        )
+        if not rows:
+            completed = True
+            break
+        
+        items = []
+        for row in rows:
+            text = fit_to_input_limit(row["text"] or "")
+            if text.strip():
+                items.append((row["id"], text, count_tokens(text)))
+        
+        batches = batch_by_tokens(items, settings.EMBEDDING_BATCH_MAX_SIZE, settings.EMBEDDING_BATCH_MAX_TOKENS)
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        embedded = [(row_id, embedding) for batch in results for row_id, embedding in batch if embedding]
+        
+        if embedded:
+            await write_embeddings(db, embedded, model=EMBEDDING_MODEL)
+        
+        last_id = rows[-1]["id"]
+        stats["pages"] += 1
+        stats["rows"] += len(rows)
+        stats["embedded"] += len(embedded)
+        stats["failed"] += len(items) - len(embedded)
+        stats["tokens"] += sum(tokens for _, _, tokens in items)
+        checkpoint.save(key, {"last_id": last_id, "completed": False, "rows": stats["rows"]})
+        
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Backfill {target}: {stats['rows']} rows, {stats['embedded']} embedded, {stats['failed']} failed "
+            f"({stats['rows'] / elapsed:.1f} rows/s, {stats['tokens'] / elapsed:.0f} tokens/s)"
+        )
+        
+        if len(rows) < limit:
+            completed = True
+            break
+    
+    if completed:
+        checkpoint.save(key, {"last_id": last_id, "completed": True, "rows": stats["rows"]})
+    
+    elapsed = time.perf_counter() - started
+    stats.update({
+        "last_id": last_id,
+        "completed": completed,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(stats["rows"] / elapsed, 2) if elapsed else 0.0,
+        "tokens_per_second": round(stats["tokens"] / elapsed, 2) if elapsed else 0.0,
+    })
+    return stats
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
+
+from app.core.tokenizer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+BatchFunction = Callable[[List[str]], Awaitable[List[Optional[List[float]]]]]
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into batched API calls.
+
+    Callers await submit(); texts submitted within the batching window (or until
+    the batch reaches max_batch_size texts or max_batch_tokens tokens) are sent
+    together through batch_fn, and each caller receives its own vector.
+    """
+    def __init__(
+        self,
+        batch_fn: BatchFunction,
+        window_ms: float = 10,
+        max_batch_size: int = 128,
+        max_batch_tokens: int = 100000
+    ):
+        self.batch_fn = batch_fn
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.batches_sent = 0
+        self.texts_submitted = 0
+        self.texts_sent = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        # Celery tasks run each job in a new event loop; pending state from a
+        # previous loop can never be flushed, so start over on a loop change
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._pending = []
+            self._pending_tokens = 0
+            self._timer = None
+            self._tasks = set()
+        return loop
+
+    async def submit(self, text: str) -> Optional[List[float]]:
+        """
+        Submit a text for embedding as part of the next batch.
+
+        Args:
+            text: The text to generate an embedding for
+
+        Returns:
+            The embedding vector, or None if the batch request failed
+        """
+        loop = self._bind_loop()
+        # Same (cached) count that fit_to_input_limit used on the text
+        tokens = count_tokens(text)
+
+        # Flush first if this text would push the batch over the token cap
+        if self._pending and self._pending_tokens + tokens > self.max_batch_tokens:
+            self.flush()
+
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self._pending_tokens += tokens
+        self.texts_submitted += 1
+
+        if len(self._pending) >= self.max_batch_size or self._pending_tokens >= self.max_batch_tokens:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self.flush)
+
+        return await future
+
+    def flush(self) -> None:
+        """
+        Send all pending texts immediately as one batch.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = []
+        self._pending_tokens = 0
+
+        task = self._loop.create_task(self._run_batch(batch))
+        # Keep a reference so the task is not garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Identical texts in the same window share one input slot
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batches_sent += 1
+        self.texts_sent += len(texts)
+
+        try:
+            embeddings = await self.batch_fn(texts)
+        except Exception as e:
+            logger.error(f"Error generating batched embeddings: {str(e)}")
+            embeddings = [None] * len(texts)
+
+        results = dict(zip(texts, embeddings))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(results.get(text))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get batching counters.
+
+        Returns:
+            Dictionary of batcher statistics
+        """
+        return {
+            "batches_sent": self.batches_sent,
+            "texts_submitted": self.texts_submitted,
+            "texts_sent": self.texts_sent,
+            "pending": len(self._pending),
+            "average_batch_size": self.texts_sent / self.batches_sent if self.batches_sent else 0.0,
+        }
@@ -0,0 +1,231 @@
+import hashlib
+import logging
+import time
+import unicodedata
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.redis import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds to skip the Redis tier after it fails, so an unreachable Redis
+# does not add a connect timeout to every embedding call
+REDIS_RETRY_AFTER_SECONDS = 30.0
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text before hashing so trivially different inputs share a cache entry.
+
+    Args:
+        text: The text to normalize
+
+    Returns:
+        Unicode NFC-normalized text with collapsed whitespace
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_cache_key(model: str, text: str) -> str:
+    """
+    Build the content-addressed cache key for an embedding.
+
+    Args:
+        model: The embedding model name
+        text: The embedded text
+
+    Returns:
+        A cache key derived from the SHA-256 of (model, normalized text)
+    """
+    digest = hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+    return f"emb:{model}:{digest}"
+
+
+def pack_vector(embedding: Sequence[float]) -> bytes:
+    """Pack an embedding vector into compact float32 bytes."""
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def unpack_vector(data: bytes) -> List[float]:
+    """Unpack float32 bytes produced by pack_vector into a list of floats."""
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-process LRU in front of Redis.
+
+    Vectors are stored as float32 bytes in both tiers (~6 KB for a 1536-dim
+    vector instead of ~50 KB as a Python list). Redis errors never fail the
+    caller; the Redis tier is skipped for a short while after an error.
+    """
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: Optional[int] = None,
+        use_redis: bool = True,
+        enabled: bool = True
+    ):
+        self.enabled = enabled
+        self.use_redis = use_redis
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.redis_errors = 0
+        self._redis_disabled_until = 0.0
+
+    def _redis(self):
+        if not self.use_redis or time.monotonic() < self._redis_disabled_until:
+            return None
+        return get_redis_client()
+
+    def _redis_failed(self, e: Exception) -> None:
+        self.redis_errors += 1
+        self._redis_disabled_until = time.monotonic() + REDIS_RETRY_AFTER_SECONDS
+        logger.warning(f"Embedding cache Redis tier unavailable, using local tier only: {str(e)}")
+
+    async def get(self, model: str, text: str) -> Optional[List[float]]:
+        """
+        Look up a cached embedding.
+
+        Args:
+            model: The embedding model name
+            text: The embedded text
+
+        Returns:
+            The cached embedding vector, or None on a miss
+        """
+        return (await self.get_many(model, [text]))[0]
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached embeddings for several texts, checking Redis once for all local misses.
+
+        Args:
+            model: The embedding model name
+            texts: The embedded texts
+
+        Returns:
+            A list aligned with texts containing cached vectors or None for misses
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        if not self.enabled:
+            self.misses += len(texts)
+            return results
+
+        keys = [make_cache_key(model, text) for text in texts]
+        missing = []
+        for i, key in enumerate(keys):
+            data = self.local.get(key)
+            if data is not None:
+                self.local_hits += 1
+                results[i] = unpack_vector(data)
+            else:
+                missing.append(i)
+
+        redis = self._redis() if missing else None
+        if redis is not None:
+            try:
+                values = await redis.mget([keys[i] for i in missing])
+                still_missing = []
+                for i, data in zip(missing, values):
+                    if data is None:
+                        still_missing.append(i)
+                        continue
+                    self.redis_hits += 1
+                    self.local.set(keys[i], data)
+                    results[i] = unpack_vector(data)
+                missing = still_missing
+            except Exception as e:
+                self._redis_failed(e)
+
+        self.misses += len(missing)
+        return results
+
+    async def set(self, model: str, text: str, embedding: Sequence[float]) -> None:
+        """
+        Store an embedding in both cache tiers.
+
+        Args:
+            model: The embedding model name
+            text: The embedded text
+            embedding: The embedding vector
+        """
+        await self.set_many(model, [text], [embedding])
+
+    async def set_many(
+        self,
+        model: str,
+        texts: List[str],
+        embeddings: List[Optional[Sequence[float]]]
+    ) -> None:
+        """
+        Store several embeddings, writing them to Redis in a single pipeline.
+
+        Args:
+            model: The embedding model name
+            texts: The embedded texts
+            embeddings: Embedding vectors aligned with texts; None entries are skipped
+        """
+        if not self.enabled:
+            return
+
+        entries = {}
+        for text, embedding in zip(texts, embeddings):
+            if embedding is None:
+                continue
+            key = make_cache_key(model, text)
+            data = pack_vector(embedding)
+            self.local.set(key, data)
+            entries[key] = data
+        self.writes += len(entries)
+
+        redis = self._redis() if entries else None
+        if redis is not None:
+            try:
+                pipe = redis.pipeline(transaction=False)
+                for key, data in entries.items():
+                    pipe.set(key, data, ex=self.ttl_seconds)
+                await pipe.execute()
+            except Exception as e:
+                self._redis_failed(e)
+
+    def clear(self) -> None:
+        """Clear the local tier (Redis entries expire through their TTL)."""
+        self.local.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters for the cache.
+
+        Returns:
+            Dictionary of cache statistics
+        """
+        hits = self.local_hits + self.redis_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "redis_errors": self.redis_errors,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            **{f"local_{k}": v for k, v in self.local.stats().items()},
+        }
+
+
+# Create a global embedding cache instance
+embedding_cache = EmbeddingCache(
+    max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+    use_redis=settings.EMBEDDING_CACHE_REDIS_ENABLED,
+    enabled=settings.EMBEDDING_CACHE_ENABLED
+)
@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.llm_gateway import LLMGateway, llm_gateway
+
+logger = logging.getLogger(__name__)
+
+# Embedding backends that can be selected with the EMBEDDING_PROVIDER setting
+EMBEDDING_PROVIDERS = ("openai", "local")
+
+# Output dimension of OpenAI embedding models (text-embedding-3 models can be shortened)
+OPENAI_MODEL_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class EmbeddingProvider(ABC):
+    """
+    Interface of an embedding backend.
+    
+    A provider turns a list of texts into vectors of a fixed dimension. Its
+    model_version identifies the vector space: vectors with different model
+    versions must never be compared, cached under the same key or stored
+    side by side without re-embedding.
+    """
+    name = "base"
+    
+    def __init__(self, model: str, dimension: int, native_dimension: Optional[int] = None):
+        self.model = model
+        self.dimension = dimension
+        self.native_dimension = native_dimension
+    
+    @property
+    def model_version(self) -> str:
+        """Model identifier recorded with cached and stored vectors."""
+        if self.dimension == self.native_dimension:
+            return self.model
+        return f"{self.model}@{self.dimension}"
+    
+    def is_configured(self) -> bool:
+        """Check that the provider has what it needs (e.g. credentials) to embed texts."""
+        return True
+    
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for a batch of texts in one request.
+        
+        Args:
+            texts: The texts to embed
+        
+        Returns:
+            List of embedding vectors aligned with texts
+        """
+    
+    def describe(self) -> Dict[str, Any]:
+        """Get the provider name, model version and dimension."""
+        return {
+            "provider": self.name,
+            "model": self.model,
+            "model_version": self.model_version,
+            "dimension": self.dimension,
+        }
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """
+    Embeddings from the OpenAI embeddings API, called through the LLM gateway.
+    """
+    name = "openai"
+    
+    def __init__(self, model: str = "text-embedding-ada-002", dimension: Optional[int] = None, gateway: Optional[LLMGateway] = None):
+        native_dimension = OPENAI_MODEL_DIMENSIONS.get(model)
+        dimension = dimension or native_dimension or settings.EMBEDDING_DIMENSION
+        if native_dimension and dimension != native_dimension and not model.startswith("text-embedding-3"):
+            raise ValueError(f"Embedding model {model} only supports {native_dimension} dimensions, not {dimension}")
+        super().__init__(model, dimension, native_dimension)
+        self.gateway = gateway or llm_gateway
+    
+    def is_configured(self) -> bool:
+        return bool(self.gateway.api_key)
+    
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        params: Dict[str, Any] = {}
+        if self.native_dimension and self.dimension != self.native_dimension:
+            params["dimensions"] = self.dimension
+        
+        response = await self.gateway.embeddings(input=texts, model=self.model, **params)
+        
+        # Results are ordered by input index
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+@lru_cache(maxsize=100000)
+def _hash_feature(feature: str, dimension: int) -> Tuple[int, float]:
+    """Map a feature to a (column, sign) pair with a stable hash."""
+    value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return value % dimension, 1.0 if (value >> 63) & 1 else -1.0
+
+
+class LocalHashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic CPU embeddings using signed feature hashing.
+    
+    Word unigrams and bigrams are hashed into a fixed number of columns with a
+    random sign, term counts are log-scaled and the vector is L2-normalized.
+    Texts that share words get similar vectors, which is enough to exercise
+    retrieval, caching and indexing end to end without network access or API
+    quota. The vectors carry no real semantics and must not be mixed with
+    vectors from another provider.
+    """
+    name = "local"
+    
+    def __init__(self, dimension: Optional[int] = None):
+        super().__init__("local-hashing-v1", dimension or settings.EMBEDDING_DIMENSION)
+    
+    def embed_text(self, text: str) -> List[float]:
+        """
+        Embed a single text.
+        
+        Args:
+            text: The text to embed
+        
+        Returns:
+            The unit-length embedding vector (all zeros for a text without words)
+        """
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        features = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+        
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature in features:
+            column, sign = _hash_feature(feature, self.dimension)
+            vector[column] += sign
+        
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+    
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_text(text) for text in texts]
+
+
+def create_embedding_provider(
+    name: Optional[str] = None,
+    model: Optional[str] = None,
+    dimension: Optional[int] = None
+) -> EmbeddingProvider:
+    """
+    Create an embedding provider from the settings.
+    
+    Args:
+        name: Provider name (defaults to EMBEDDING_PROVIDER)
+        model: Model name for API providers (defaults to EMBEDDING_MODEL)
+        dimension: Vector dimension (defaults to EMBEDDING_DIMENSION, the dimension of the stored vectors)
+    
+    Returns:
+        The embedding provider
+    """
+    name = name or settings.EMBEDDING_PROVIDER
+    dimension = dimension or settings.EMBEDDING_DIMENSION
+    if name == "openai":
+        return OpenAIEmbeddingProvider(model or settings.EMBEDDING_MODEL, dimension)
+    if name == "local":
+        return LocalHashingEmbeddingProvider(dimension)
+    raise ValueError(f"Unknown embedding provider: {name} (expected one of {', '.join(EMBEDDING_PROVIDERS)})")
+
+
+# Create the global embedding provider
+embedding_provider = create_embedding_provider()
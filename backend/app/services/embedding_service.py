@@ -2,19 +2,67 @@ import logging
 import json
 import numpy as np
 from typing import List, Dict, Any, Optional, Union
-from openai import AsyncOpenAI
 
 from app.core.config import settings
+from app.core.tokenizer import count_tokens, truncate_to_tokens
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_cache import embedding_cache
+from app.services.embedding_providers import embedding_provider
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+# Version of the configured embedding model, used to key cached vectors and recorded with stored ones
+EMBEDDING_MODEL = embedding_provider.model_version
+
+
+def fit_to_input_limit(text: str) -> str:
+    """
+    Truncate a text to the embedding model's token limit.
+    
+    Args:
+        text: The text to embed
+    
+    Returns:
+        The text, truncated to EMBEDDING_MAX_INPUT_TOKENS tokens if it is longer
+    """
+    token_count = count_tokens(text)
+    if token_count <= settings.EMBEDDING_MAX_INPUT_TOKENS:
+        return text
+    
+    logger.warning(
+        f"Text too long ({token_count} tokens), truncating to {settings.EMBEDDING_MAX_INPUT_TOKENS} tokens"
+    )
+    return truncate_to_tokens(text, settings.EMBEDDING_MAX_INPUT_TOKENS)
+
+
+async def _request_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Request embeddings for distinct texts in one provider call and cache the results.
+    
+    Args:
+        texts: List of texts to generate embeddings for
+    
+    Returns:
+        List of embedding vectors aligned with texts
+    """
+    embeddings = await embedding_provider.embed(texts)
+    await embedding_cache.set_many(EMBEDDING_MODEL, texts, embeddings)
+    
+    return embeddings
+
+
+# Coalesces concurrent generate_embedding calls into batched requests
+embedding_batcher = EmbeddingBatcher(
+    _request_embeddings,
+    window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+    max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+    max_batch_tokens=settings.EMBEDDING_BATCH_MAX_TOKENS
+)
 
 
 async def generate_embedding(text: str) -> Optional[List[float]]:
     """
-    Generate an embedding vector for the given text using OpenAI's embedding API.
+    Generate an embedding vector for the given text with the configured embedding provider.
     
     Args:
         text: The text to generate an embedding for
@@ -22,28 +70,25 @@ async def generate_embedding(text: str) -> Optional[List[float]]:
     Returns:
         A list of floats representing the embedding vector, or None if generation fails
     """
-    if not settings.OPENAI_API_KEY:
-        logger.warning("OpenAI API key not set. Cannot generate embeddings.")
+    if not embedding_provider.is_configured():
+        logger.warning(f"Embedding provider {embedding_provider.name} is not configured. Cannot generate embeddings.")
         return None
     
     try:
-        # Truncate text if it's too long (OpenAI has token limits)
-        # A simple truncation strategy - in production you might want something more sophisticated
-        max_chars = 8000  # Approximate character limit for embedding models
-        if len(text) > max_chars:
-            logger.warning(f"Text too long ({len(text)} chars), truncating to {max_chars} chars")
-            text = text[:max_chars]
+        # Long texts should be split with the chunking service; this only guards the model's input limit
+        text = fit_to_input_limit(text)
         
-        # Call OpenAI API to generate embedding
-        response = await openai_client.embeddings.create(
-            model="text-embedding-ada-002",  # Default embedding model
-            input=text
-        )
+        # Serve repeated texts from the embedding cache
+        cached = await embedding_cache.get(EMBEDDING_MODEL, text)
+        if cached is not None:
+            return cached
         
-        # Extract the embedding from the response
-        embedding = response.data[0].embedding
+        # Share a batched API call with other concurrent callers
+        if settings.EMBEDDING_BATCHING_ENABLED:
+            return await embedding_batcher.submit(text)
         
-        return embedding
+        # Call the embedding provider to generate the embedding
+        return (await _request_embeddings([text]))[0]
     
     except Exception as e:
         logger.error(f"Error generating embedding: {str(e)}")
@@ -60,29 +105,29 @@ async def generate_embeddings_batch(texts: List[str]) -> List[Optional[List[floa
     Returns:
         List of embedding vectors (or None for failed generations)
     """
-    if not settings.OPENAI_API_KEY:
-        logger.warning("OpenAI API key not set. Cannot generate embeddings.")
+    if not embedding_provider.is_configured():
+        logger.warning(f"Embedding provider {embedding_provider.name} is not configured. Cannot generate embeddings.")
         return [None] * len(texts)
     
     try:
-        # Truncate texts if they're too long
-        max_chars = 8000
-        processed_texts = []
-        for text in texts:
-            if len(text) > max_chars:
-                logger.warning(f"Text too long ({len(text)} chars), truncating to {max_chars} chars")
-                processed_texts.append(text[:max_chars])
-            else:
-                processed_texts.append(text)
+        # Guard the model's input limit (long texts should be chunked before embedding)
+        processed_texts = [fit_to_input_limit(text) for text in texts]
         
-        # Call OpenAI API to generate embeddings for the batch
-        response = await openai_client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=processed_texts
-        )
+        # Only send texts that are not already cached, once per distinct text
+        embeddings = await embedding_cache.get_many(EMBEDDING_MODEL, processed_texts)
+        missing_texts = list(dict.fromkeys(
+            text for text, embedding in zip(processed_texts, embeddings) if embedding is None
+        ))
         
-        # Extract embeddings from the response
-        embeddings = [item.embedding for item in response.data]
+        if missing_texts:
+            # Call the embedding provider to generate embeddings for the batch
+            generated = await _request_embeddings(missing_texts)
+            
+            generated_by_text = dict(zip(missing_texts, generated))
+            embeddings = [
+                embedding if embedding is not None else generated_by_text[text]
+                for text, embedding in zip(processed_texts, embeddings)
+            ]
         
         return embeddings
     
@@ -119,15 +164,15 @@ def calculate_similarity(embedding1: List[float], embedding2: List[float]) -> fl
     return float(similarity)
 
 
-async def generate_business_context_embedding(business_context: Dict[str, Any]) -> Optional[List[float]]:
+def build_business_context_text(business_context: Dict[str, Any]) -> str:
     """
-    Generate an embedding for a business context object.
+    Build the text that is embedded for a business context.
     
     Args:
         business_context: Business context dictionary
     
     Returns:
-        Embedding vector for the business context
+        Text combining the profile, keywords and insights of the business context
     """
     # Extract relevant text from the business context
     text_parts = []
@@ -157,7 +202,18 @@ async def generate_business_context_embedding(business_context: Dict[str, Any])
         text_parts.append(f"{key}: {value}")
     
     # Combine all text parts
-    combined_text = "\n".join(text_parts)
+    return "\n".join(text_parts)
+
+
+async def generate_business_context_embedding(business_context: Dict[str, Any]) -> Optional[List[float]]:
+    """
+    Generate an embedding for a business context object.
+    
+    Args:
+        business_context: Business context dictionary
     
+    Returns:
+        Embedding vector for the business context
+    """
     # Generate and return the embedding
-    return await generate_embedding(combined_text)
+    return await generate_embedding(build_business_context_text(business_context))
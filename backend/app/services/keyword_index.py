@@ -0,0 +1,229 @@
+import heapq
+import logging
+import math
+import re
+from collections import Counter
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Iterable
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Words too common to carry meaning in a keyword search
+STOP_WORDS = frozenset({
+    "a", "an", "the", "and", "or", "but", "if", "because", "as", "what",
+    "when", "where", "how", "who", "which", "this", "that", "these", "those",
+    "is", "are", "was", "were", "be", "been", "being", "have", "has", "had",
+    "do", "does", "did", "can", "could", "will", "would", "should", "shall",
+    "may", "might", "must", "to", "for", "with", "about", "against", "between",
+    "into", "through", "during", "before", "after", "above", "below", "from",
+    "up", "down", "in", "out", "on", "off", "over", "under", "again", "further",
+    "then", "once", "here", "there", "all", "any", "both", "each", "few", "more",
+    "most", "other", "some", "such", "no", "nor", "not", "only", "own", "same",
+    "so", "than", "too", "very", "just", "now"
+})
+
+# Term frequency multipliers per source field (fields not listed count once)
+FIELD_WEIGHTS = {
+    "keywords": 2.0,
+    "profile": 1.5,
+}
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase search terms, dropping stop words.
+    
+    Args:
+        text: The text to tokenize
+    
+    Returns:
+        List of terms, in order of appearance
+    """
+    return [
+        token for token in _TOKEN_PATTERN.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+class KeywordIndex:
+    """
+    Inverted index with BM25 scoring.
+    
+    Each document is a list of (source_field, text) pairs; terms from fields
+    listed in FIELD_WEIGHTS count more. Documents can be added, replaced and
+    removed incrementally, and a query only touches the postings of its terms.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._terms: Dict[str, Dict[str, float]] = {}
+        self._lengths: Dict[str, float] = {}
+        self._versions: Dict[str, Any] = {}
+        self._total_length = 0.0
+    
+    def __len__(self) -> int:
+        return len(self._lengths)
+    
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._lengths
+    
+    @property
+    def ids(self) -> List[str]:
+        return list(self._lengths)
+    
+    def version(self, doc_id: str) -> Any:
+        """Get the version recorded when a document was added, or None."""
+        return self._versions.get(doc_id)
+    
+    def add(self, doc_id: str, fields: Sequence[Tuple[str, str]], version: Any = None) -> None:
+        """
+        Add a document to the index, replacing any existing document with the same ID.
+        
+        Args:
+            doc_id: Unique document identifier
+            fields: (source_field, text) pairs making up the document
+            version: Optional version marker (e.g. updated_at) used to detect stale documents
+        """
+        self.remove(doc_id)
+        
+        terms: Counter = Counter()
+        for source_field, text in fields:
+            weight = FIELD_WEIGHTS.get(source_field, 1.0)
+            for term in tokenize(text):
+                terms[term] += weight
+        
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+        length = sum(terms.values())
+        self._terms[doc_id] = dict(terms)
+        self._lengths[doc_id] = length
+        self._versions[doc_id] = version
+        self._total_length += length
+    
+    def remove(self, doc_id: str) -> bool:
+        """
+        Remove a document from the index.
+        
+        Args:
+            doc_id: The document identifier
+        
+        Returns:
+            True if the document was present, False otherwise
+        """
+        terms = self._terms.pop(doc_id, None)
+        if terms is None:
+            return False
+        
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        self._versions.pop(doc_id, None)
+        return True
+    
+    def scores(self, terms: Iterable[str], min_matches: int = 1) -> Dict[str, float]:
+        """
+        Compute the BM25 score of every document containing the query terms.
+        
+        Args:
+            terms: Query terms (tokenized the same way as documents)
+            min_matches: Minimum number of distinct query terms a document must contain
+        
+        Returns:
+            Dictionary of doc_id to BM25 score (documents without a match are omitted)
+        """
+        if not self._lengths:
+            return {}
+        
+        count = len(self._lengths)
+        average_length = self._total_length / count or 1.0
+        scores: Dict[str, float] = {}
+        matches: Dict[str, int] = {}
+        
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                length_norm = 1 - self.b + self.b * self._lengths[doc_id] / average_length
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                matches[doc_id] = matches.get(doc_id, 0) + 1
+        
+        if min_matches > 1:
+            return {doc_id: score for doc_id, score in scores.items() if matches[doc_id] >= min_matches}
+        return scores
+    
+    def search(
+        self,
+        terms: Iterable[str],
+        top_k: int = 3,
+        min_matches: int = 1
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the documents that best match the query terms.
+        
+        Args:
+            terms: Query terms (tokenized the same way as documents)
+            top_k: Number of top results to return
+            min_matches: Minimum number of distinct query terms a document must contain
+        
+        Returns:
+            List of (doc_id, bm25_score) tuples, sorted by score
+        """
+        if top_k <= 0:
+            return []
+        return heapq.nlargest(top_k, self.scores(terms, min_matches).items(), key=lambda item: item[1])
+
+
+class KeywordIndexRegistry:
+    """
+    Holds one KeywordIndex per scope (e.g. per user or per business).
+    
+    Bounded like VectorIndexRegistry: the least recently used index is
+    dropped beyond max_scopes and an index unused for idle_seconds expires;
+    a dropped index is rebuilt on its next use.
+    """
+    def __init__(self, max_scopes: int = 1000, idle_seconds: Optional[float] = None):
+        self._indexes = LRUCache(max_entries=max_scopes, ttl_seconds=idle_seconds)
+    
+    def get(self, scope: str) -> KeywordIndex:
+        """Get the index for a scope, creating it if needed."""
+        index = self._indexes.get(scope)
+        if index is None:
+            index = KeywordIndex()
+        # Storing again restarts the idle timeout
+        self._indexes.set(scope, index)
+        return index
+    
+    def drop(self, scope: str) -> None:
+        """Drop the index for a scope."""
+        self._indexes.delete(scope)
+    
+    def discard(self, doc_id: str) -> None:
+        """Remove a document from every index that contains it."""
+        for _, index in self._indexes.items():
+            index.remove(doc_id)
+    
+    def refresh(self, doc_id: str, fields: Sequence[Tuple[str, str]], version: Any = None) -> None:
+        """Replace a document in every index that already contains it."""
+        for _, index in self._indexes.items():
+            if doc_id in index:
+                index.add(doc_id, fields, version)
+    
+    def scopes(self) -> Iterable[str]:
+        return [scope for scope, _ in self._indexes.items()]
+
+
+# Create a global registry of business context keyword indexes
+keyword_indexes = KeywordIndexRegistry(
+    max_scopes=settings.INDEX_REGISTRY_MAX_SCOPES,
+    idle_seconds=settings.INDEX_REGISTRY_IDLE_SECONDS
+)
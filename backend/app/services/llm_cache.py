@@ -0,0 +1,201 @@
+import hashlib
+import json
+import logging
+import time
+from typing import List, Dict, Any, Optional
+
+from openai.types.chat import ChatCompletion
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.redis import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds to skip the Redis tier after it fails, so an unreachable Redis
+# does not add a connect timeout to every LLM call
+REDIS_RETRY_AFTER_SECONDS = 30.0
+
+
+def make_llm_cache_key(model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+    """
+    Build the cache key of a chat completion request.
+    
+    Args:
+        model: The model called
+        messages: The chat messages
+        params: The other request parameters (temperature, functions, function_call, ...)
+    
+    Returns:
+        A cache key derived from the SHA-256 of the canonical JSON of the request
+    """
+    request = {"model": model, "messages": messages, "params": params}
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return f"llm:{model}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+class LLMResponseCache:
+    """
+    Exact-match cache of chat completions: an in-process LRU in front of Redis.
+    
+    Only worth using for requests whose answer is (close to) deterministic,
+    such as low-temperature extraction calls: a hit returns the earlier
+    completion for a byte-identical request without calling the provider.
+    Responses are stored as JSON; entries larger than max_entry_bytes are not
+    cached. Redis errors never fail the caller; the Redis tier is skipped for
+    a short while after an error.
+    """
+    def __init__(
+        self,
+        max_entries: int = 2000,
+        max_entry_bytes: int = 65536,
+        ttl_seconds: Optional[int] = None,
+        max_temperature: float = 0.3,
+        use_redis: bool = True,
+        enabled: bool = True
+    ):
+        self.enabled = enabled
+        self.use_redis = use_redis
+        self.ttl_seconds = ttl_seconds
+        self.max_entry_bytes = max_entry_bytes
+        self.max_temperature = max_temperature
+        self.local = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.skipped = 0
+        self.redis_errors = 0
+        self.saved_tokens = 0
+        self._redis_disabled_until = 0.0
+    
+    def _redis(self):
+        if not self.use_redis or time.monotonic() < self._redis_disabled_until:
+            return None
+        return get_redis_client()
+    
+    def _redis_failed(self, e: Exception) -> None:
+        self.redis_errors += 1
+        self._redis_disabled_until = time.monotonic() + REDIS_RETRY_AFTER_SECONDS
+        logger.warning(f"LLM cache Redis tier unavailable, using local tier only: {str(e)}")
+    
+    def should_cache(self, params: Dict[str, Any], cache: Optional[bool] = None) -> bool:
+        """
+        Decide whether a request goes through the cache.
+        
+        Args:
+            params: The request parameters
+            cache: Explicit choice of the caller (True to cache, False to bypass),
+                or None to cache requests up to max_temperature
+        
+        Returns:
+            True if the cache should be used
+        """
+        if not self.enabled or cache is False:
+            return False
+        if cache:
+            return True
+        # The API samples at temperature 1 when none is given
+        temperature = params.get("temperature")
+        return (1.0 if temperature is None else temperature) <= self.max_temperature
+    
+    async def get(self, key: str) -> Optional[ChatCompletion]:
+        """
+        Look up a cached completion.
+        
+        Args:
+            key: The cache key (see make_llm_cache_key)
+        
+        Returns:
+            The cached completion, or None on a miss
+        """
+        data = self.local.get(key)
+        if data is not None:
+            self.local_hits += 1
+        else:
+            redis = self._redis()
+            if redis is not None:
+                try:
+                    data = await redis.get(key)
+                except Exception as e:
+                    self._redis_failed(e)
+            if data is None:
+                self.misses += 1
+                return None
+            self.redis_hits += 1
+            self.local.set(key, data)
+        
+        try:
+            response = ChatCompletion.model_validate_json(data)
+        except ValueError as e:
+            logger.warning(f"Dropping unreadable cached LLM response: {str(e)}")
+            self.local.delete(key)
+            return None
+        if response.usage:
+            self.saved_tokens += response.usage.total_tokens
+        return response
+    
+    async def set(self, key: str, response: ChatCompletion) -> None:
+        """
+        Store a completion in both cache tiers.
+        
+        Args:
+            key: The cache key (see make_llm_cache_key)
+            response: The chat completion
+        """
+        try:
+            data = response.model_dump_json().encode("utf-8")
+        except Exception as e:
+            logger.warning(f"Could not serialize LLM response for caching: {str(e)}")
+            return
+        
+        if len(data) > self.max_entry_bytes:
+            self.skipped += 1
+            return
+        
+        self.local.set(key, data)
+        self.writes += 1
+        
+        redis = self._redis()
+        if redis is not None:
+            try:
+                await redis.set(key, data, ex=self.ttl_seconds)
+            except Exception as e:
+                self._redis_failed(e)
+    
+    def clear(self) -> None:
+        """Clear the local tier (Redis entries expire through their TTL)."""
+        self.local.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters and saved tokens for the cache.
+        
+        Returns:
+            Dictionary of cache statistics
+        """
+        hits = self.local_hits + self.redis_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "skipped": self.skipped,
+            "redis_errors": self.redis_errors,
+            "saved_tokens": self.saved_tokens,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            **{f"local_{k}": v for k, v in self.local.stats().items()},
+        }
+
+
+# Create a global LLM response cache instance
+llm_cache = LLMResponseCache(
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    max_entry_bytes=settings.LLM_CACHE_MAX_ENTRY_BYTES,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS or None,
+    max_temperature=settings.LLM_CACHE_MAX_TEMPERATURE,
+    use_redis=settings.LLM_CACHE_REDIS_ENABLED,
+    enabled=settings.LLM_CACHE_ENABLED
+)
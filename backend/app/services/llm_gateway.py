@@ -0,0 +1,522 @@
+"""
+Single gateway for all calls to the LLM provider.
+
+Owns one keep-alive HTTP connection pool per event loop and applies the same
+limits to every chat completion and embedding request: a global and a
+per-model concurrency cap, request and token rate limits, retries with
+jittered exponential backoff on rate limits, timeouts and 5xx errors,
+per-call timeouts, and a circuit breaker that fails fast while the provider
+is degraded so callers can use their fallbacks. Deterministic chat
+completions can be served from the LLM response cache.
+"""
+import asyncio
+import logging
+import random
+import time
+import weakref
+from typing import List, Dict, Any, Optional, Callable, Awaitable, AsyncGenerator
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from app.core.tokenizer import count_tokens
+from app.services.llm_cache import LLMResponseCache, llm_cache, make_llm_cache_key
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying (timeouts, conflicts, rate limits, server errors)
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class LLMUnavailableError(Exception):
+    """Raised without calling the provider while the circuit breaker is open."""
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Check whether a failed provider call is worth retrying.
+    
+    Args:
+        error: The exception raised by the call
+    
+    Returns:
+        True for timeouts, connection errors, rate limits and server errors
+    """
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Get the delay requested by a Retry-After header, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Estimate the prompt tokens of chat messages for the token rate limit."""
+    return count_tokens("\n".join(str(message.get("content") or "") for message in messages))
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter.
+    
+    Callers reserve tokens up front: the bucket may go negative, and each
+    caller sleeps until its own reservation is covered by the refill. This
+    keeps callers in arrival order without locks, so one bucket can be shared
+    across event loops.
+    """
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+    
+    def reserve(self, amount: float) -> float:
+        """
+        Take tokens from the bucket.
+        
+        Args:
+            amount: Number of tokens (capped at the bucket capacity)
+        
+        Returns:
+            Seconds to wait before the reservation is covered
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= min(amount, self.capacity)
+        return max(0.0, -self._tokens / self.rate)
+    
+    async def acquire(self, amount: float = 1) -> None:
+        """Wait until the requested tokens are available."""
+        wait = self.reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated provider failures.
+    
+    After failure_threshold consecutive failed calls the circuit opens and
+    calls are rejected for recovery_seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again,
+    and a trial that ends without an outcome (cancelled, or a stream closed
+    before its first chunk) is released so the next call can probe instead.
+    """
+    def __init__(self, failure_threshold: int = 5, recovery_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.failures = 0
+        self.opened_count = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.recovery_seconds:
+            return "open"
+        return "half_open"
+    
+    def allow_request(self) -> bool:
+        """Check whether a call may be made now (reserving the trial call when half-open)."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+    
+    def release_trial(self) -> None:
+        """Release the trial call without an outcome, letting the next call probe."""
+        self._trial_in_flight = False
+    
+    def record_success(self) -> None:
+        """Record that the provider answered, closing the circuit."""
+        self.failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+    
+    def record_failure(self) -> None:
+        """Record a failed call, opening the circuit once the threshold is reached."""
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"LLM circuit breaker opened after {self.failures} consecutive failures")
+                self.opened_count += 1
+            self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+
+class LLMGateway:
+    """
+    Rate-limited, retrying and circuit-broken access to the OpenAI API.
+    
+    HTTP clients and semaphores are bound to an event loop, so one set is
+    kept per loop (Celery tasks run each job in a fresh loop); rate limits
+    and the circuit breaker are shared by all loops of the process.
+    """
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_concurrency: int = 16,
+        max_concurrency_per_model: int = 8,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = 3,
+        retry_base_seconds: float = 0.5,
+        retry_max_seconds: float = 20.0,
+        timeout_seconds: float = 30.0,
+        failure_threshold: int = 5,
+        recovery_seconds: float = 30.0,
+        cache: Optional[LLMResponseCache] = None
+    ):
+        self.api_key = api_key if api_key is not None else settings.OPENAI_API_KEY
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_model = max_concurrency_per_model
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.timeout_seconds = timeout_seconds
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.circuit_breaker = CircuitBreaker(failure_threshold, recovery_seconds)
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+    
+    def _loop_state(self) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS
+                ),
+                timeout=httpx.Timeout(self.timeout_seconds, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS)
+            )
+            state = {
+                "http_client": http_client,
+                # Retries are done by the gateway, so the SDK's own retries are disabled
+                "client": AsyncOpenAI(api_key=self.api_key, http_client=http_client, max_retries=0),
+                "semaphore": asyncio.Semaphore(self.max_concurrency),
+                "model_semaphores": {},
+            }
+            self._loops[loop] = state
+        return state
+    
+    def _client(self) -> AsyncOpenAI:
+        return self._loop_state()["client"]
+    
+    def _model_semaphore(self, model: str) -> asyncio.Semaphore:
+        semaphores = self._loop_state()["model_semaphores"]
+        if model not in semaphores:
+            semaphores[model] = asyncio.Semaphore(self.max_concurrency_per_model)
+        return semaphores[model]
+    
+    def is_available(self) -> bool:
+        """Check whether the provider is configured and not known to be degraded."""
+        return bool(self.api_key) and self.circuit_breaker.state != "open"
+    
+    def _backoff_seconds(self, attempt: int, error: Exception) -> float:
+        # Full jitter spreads out callers that failed together
+        delay = random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.retry_max_seconds))
+        return delay
+    
+    def _retry_delay(self, model: str, attempt: int, error: Exception) -> Optional[float]:
+        """
+        Decide whether to retry a failed call, updating the counters and the circuit breaker.
+        
+        Args:
+            model: The model called
+            attempt: Zero-based number of the failed attempt
+            error: The exception raised by the call
+        
+        Returns:
+            Seconds to wait before the next attempt, or None if the error should be raised
+        """
+        if not is_retryable_error(error):
+            # The provider answered, so it is not degraded
+            self.circuit_breaker.record_success()
+            return None
+        if attempt == self.max_retries:
+            self.failures += 1
+            self.circuit_breaker.record_failure()
+            logger.error(f"LLM call to {model} failed after {attempt + 1} attempts: {str(error)}")
+            return None
+        
+        delay = self._backoff_seconds(attempt, error)
+        self.retries += 1
+        logger.warning(f"LLM call to {model} failed ({str(error)}), retrying in {delay:.2f}s")
+        return delay
+    
+    async def _call(
+        self,
+        model: str,
+        estimated_tokens: int,
+        request: Callable[[AsyncOpenAI], Awaitable[Any]]
+    ) -> Any:
+        """
+        Make a provider call under the gateway's limits, retrying transient failures.
+        
+        Args:
+            model: The model called (selects the per-model concurrency cap)
+            estimated_tokens: Tokens charged against the token rate limit
+            request: Makes the call with the pooled client
+        
+        Returns:
+            The provider response
+        
+        Raises:
+            LLMUnavailableError: If the circuit breaker is open
+        """
+        trial = self.circuit_breaker.state == "half_open"
+        if not self.circuit_breaker.allow_request():
+            self.rejected += 1
+            raise LLMUnavailableError("LLM provider is degraded (circuit breaker open)")
+        
+        global_semaphore = self._loop_state()["semaphore"]
+        model_semaphore = self._model_semaphore(model)
+        
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    # Wait for a model slot first so a busy model does not hold global slots
+                    async with model_semaphore, global_semaphore:
+                        await self.request_bucket.acquire(1)
+                        await self.token_bucket.acquire(estimated_tokens)
+                        self.requests += 1
+                        response = await request(self._client())
+                    self.circuit_breaker.record_success()
+                    return response
+                
+                except Exception as e:
+                    delay = self._retry_delay(model, attempt, e)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+        finally:
+            if trial:
+                # A cancelled trial must not keep the circuit half-open forever
+                self.circuit_breaker.release_trial()
+    
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        cache: Optional[bool] = None,
+        **params: Any
+    ) -> Any:
+        """
+        Create a chat completion.
+        
+        Args:
+            messages: The chat messages
+            model: The model (defaults to OPENAI_MODEL)
+            timeout: Per-call timeout in seconds (defaults to LLM_TIMEOUT_SECONDS)
+            cache: True to reuse a cached completion of an identical request,
+                False to bypass the cache, None to cache low-temperature requests
+                (up to LLM_CACHE_MAX_TEMPERATURE)
+            **params: Other chat completion parameters (temperature, functions, ...)
+        
+        Returns:
+            The chat completion response
+        """
+        model = model or settings.OPENAI_MODEL
+        
+        cache_key = None
+        if self.cache is not None and self.cache.should_cache(params, cache):
+            cache_key = make_llm_cache_key(model, messages, params)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        estimated_tokens = _estimate_prompt_tokens(messages) + (params.get("max_tokens") or 0)
+        response = await self._call(
+            model,
+            estimated_tokens,
+            lambda client: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=timeout or self.timeout_seconds,
+                **params
+            )
+        )
+        
+        if cache_key is not None:
+            await self.cache.set(cache_key, response)
+        return response
+    
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **params: Any
+    ) -> AsyncGenerator[Any, None]:
+        """
+        Stream a chat completion chunk by chunk.
+        
+        The concurrency slots are held until the stream is exhausted or
+        closed. Failures before the first chunk are retried like other calls;
+        once chunks have been yielded a failure is raised to the caller, since
+        a partially delivered stream cannot be replayed.
+        
+        Args:
+            messages: The chat messages
+            model: The model (defaults to OPENAI_MODEL)
+            timeout: Per-call timeout in seconds (defaults to LLM_TIMEOUT_SECONDS)
+            **params: Other chat completion parameters (temperature, functions, ...)
+        
+        Yields:
+            The chat completion chunks
+        
+        Raises:
+            LLMUnavailableError: If the circuit breaker is open
+        """
+        model = model or settings.OPENAI_MODEL
+        estimated_tokens = _estimate_prompt_tokens(messages) + (params.get("max_tokens") or 0)
+        
+        trial = self.circuit_breaker.state == "half_open"
+        if not self.circuit_breaker.allow_request():
+            self.rejected += 1
+            raise LLMUnavailableError("LLM provider is degraded (circuit breaker open)")
+        
+        global_semaphore = self._loop_state()["semaphore"]
+        model_semaphore = self._model_semaphore(model)
+        
+        try:
+            for attempt in range(self.max_retries + 1):
+                received = False
+                try:
+                    async with model_semaphore, global_semaphore:
+                        await self.request_bucket.acquire(1)
+                        await self.token_bucket.acquire(estimated_tokens)
+                        self.requests += 1
+                        stream = await self._client().chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            stream=True,
+                            timeout=timeout or self.timeout_seconds,
+                            **params
+                        )
+                        try:
+                            async for chunk in stream:
+                                if not received:
+                                    received = True
+                                    self.circuit_breaker.record_success()
+                                yield chunk
+                        finally:
+                            # Release the connection when the caller stops early
+                            await stream.close()
+                    if not received:
+                        self.circuit_breaker.record_success()
+                    return
+                
+                except Exception as e:
+                    delay = None if received else self._retry_delay(model, attempt, e)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+        finally:
+            if trial:
+                # A cancelled trial (or a stream closed before its first chunk)
+                # must not keep the circuit half-open forever
+                self.circuit_breaker.release_trial()
+    
+    async def embeddings(
+        self,
+        input: List[str],
+        model: str,
+        timeout: Optional[float] = None,
+        **params: Any
+    ) -> Any:
+        """
+        Create embeddings for a batch of texts.
+        
+        Args:
+            input: The texts to embed
+            model: The embedding model
+            timeout: Per-call timeout in seconds (defaults to LLM_TIMEOUT_SECONDS)
+            **params: Other embedding parameters (e.g. dimensions)
+        
+        Returns:
+            The embeddings response
+        """
+        estimated_tokens = sum(count_tokens(text) for text in input)
+        return await self._call(
+            model,
+            estimated_tokens,
+            lambda client: client.embeddings.create(
+                model=model,
+                input=input,
+                timeout=timeout or self.timeout_seconds,
+                **params
+            )
+        )
+    
+    async def close(self) -> None:
+        """Close the connection pool bound to the running event loop, if any."""
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            try:
+                await state["http_client"].aclose()
+            except Exception as e:
+                logger.error(f"Error closing LLM gateway HTTP client: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get call counters and the circuit breaker state."""
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "circuit_state": self.circuit_breaker.state,
+            "circuit_opened": self.circuit_breaker.opened_count,
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+# Create the global LLM gateway
+llm_gateway = LLMGateway(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_concurrency_per_model=settings.LLM_MAX_CONCURRENCY_PER_MODEL,
+    requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+    max_retries=settings.LLM_MAX_RETRIES,
+    retry_base_seconds=settings.LLM_RETRY_BASE_SECONDS,
+    retry_max_seconds=settings.LLM_RETRY_MAX_SECONDS,
+    timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+    failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+    recovery_seconds=settings.LLM_CIRCUIT_RECOVERY_SECONDS,
+    cache=llm_cache
+)
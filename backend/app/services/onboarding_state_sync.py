@@ -0,0 +1,97 @@
+import logging
+from typing import Dict, Any, List, Optional
+
+from app.schemas.onboarding import OnboardingMessage, OnboardingState, MessageType
+
+logger = logging.getLogger(__name__)
+
+# Onboarding state fields sent as whole values in patches
+SCALAR_FIELDS = ("currentStep", "totalSteps", "stepTitle", "percentage")
+
+
+class OnboardingStateTracker:
+    """
+    Versioned onboarding state sync for one connection.
+    
+    The connection receives one snapshot of the state, then patches holding
+    only what changed since the previous frame: changed fields, changed
+    businessData keys, messages appended to the conversation and messages
+    replaced in place (e.g. a personalized template). Every frame carries a
+    new version and patches carry the version they apply to, so a client that
+    missed a frame asks for a resync instead of drifting.
+    """
+    def __init__(self):
+        self.version = 0
+        self._fields: Dict[str, Any] = {}
+        self._business_data: Dict[str, Any] = {}
+        self._history: List[OnboardingMessage] = []
+    
+    def _remember(self, state: OnboardingState) -> None:
+        self._fields = {field: getattr(state, field) for field in SCALAR_FIELDS}
+        self._business_data = dict(state.businessData)
+        # Messages are replaced rather than mutated, so references identify them
+        self._history = list(state.conversationHistory)
+    
+    def snapshot(self, state: OnboardingState) -> Dict[str, Any]:
+        """
+        Build a full state frame (sent on connect and on resync).
+        
+        Args:
+            state: The onboarding state
+        
+        Returns:
+            The onboarding_state frame
+        """
+        self.version += 1
+        self._remember(state)
+        return {"type": MessageType.ONBOARDING_STATE, "version": self.version, "state": state}
+    
+    def patch(self, state: OnboardingState, **extra: Any) -> Optional[Dict[str, Any]]:
+        """
+        Build a frame with the changes since the last frame.
+        
+        Args:
+            state: The onboarding state
+            **extra: Transient values added to the frame (e.g. typing=True)
+        
+        Returns:
+            The onboarding_state_patch frame, a snapshot if the conversation
+            was truncated, or None if nothing changed and there is nothing extra
+        """
+        history = state.conversationHistory
+        if len(history) < len(self._history):
+            logger.info("Onboarding conversation was truncated, sending a snapshot instead of a patch")
+            return self.snapshot(state)
+        
+        changes = {field: getattr(state, field) for field in SCALAR_FIELDS if getattr(state, field) != self._fields.get(field)}
+        business_data = {
+            key: value for key, value in state.businessData.items()
+            if key not in self._business_data or self._business_data[key] != value
+        }
+        removed_keys = [key for key in self._business_data if key not in state.businessData]
+        replaced = [message for message, sent in zip(history, self._history) if message is not sent]
+        appended = history[len(self._history):]
+        
+        if not (changes or business_data or removed_keys or replaced or appended or extra):
+            return None
+        
+        frame: Dict[str, Any] = {
+            "type": MessageType.ONBOARDING_STATE_PATCH,
+            "version": self.version + 1,
+            "base_version": self.version,
+        }
+        if changes:
+            frame["changes"] = changes
+        if business_data:
+            frame["businessData"] = business_data
+        if removed_keys:
+            frame["businessDataRemoved"] = removed_keys
+        if appended:
+            frame["appended"] = appended
+        if replaced:
+            frame["replaced"] = replaced
+        frame.update(extra)
+        
+        self.version += 1
+        self._remember(state)
+        return frame
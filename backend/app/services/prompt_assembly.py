@@ -0,0 +1,255 @@
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.tokenizer import count_tokens, encode, decode, truncate_to_tokens
+from app.services.llm_gateway import llm_gateway
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds around each message (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_SYSTEM_PROMPT = """
+You maintain a running summary of a conversation between a business owner and an assistant.
+Merge the new turns into the current summary. Keep facts about the business, decisions,
+preferences and open questions; drop greetings and repetition. Write plain prose.
+"""
+
+
+def count_message_tokens(message: Dict[str, Any]) -> int:
+    """
+    Count the tokens a chat message takes in a prompt.
+    
+    Args:
+        message: Role/content message dictionary
+    
+    Returns:
+        Number of tokens, including the per-message overhead
+    """
+    return count_tokens(str(message.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def format_transcript(messages: List[Dict[str, Any]]) -> str:
+    """Format role/content messages as a "Role: content" transcript."""
+    return "\n".join(f"{message['role'].capitalize()}: {message.get('content') or ''}" for message in messages)
+
+
+async def summarize_turns(previous_summary: str, turns: List[Dict[str, Any]], max_tokens: int) -> str:
+    """
+    Fold conversation turns into a running summary.
+    
+    Uses the LLM when it is available; otherwise keeps the newest text of the
+    summary and turns that fits in max_tokens.
+    
+    Args:
+        previous_summary: The current summary ("" if none)
+        turns: The turns to add, oldest first
+        max_tokens: Maximum length of the new summary
+    
+    Returns:
+        The updated summary
+    """
+    transcript = format_transcript(turns)
+    
+    if llm_gateway.is_available():
+        try:
+            response = await llm_gateway.chat_completion(
+                messages=[
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"}
+                ],
+                temperature=0.2,
+                max_tokens=max_tokens,
+            )
+            summary = (response.choices[0].message.content or "").strip()
+            if summary:
+                return truncate_to_tokens(summary, max_tokens)
+        except Exception as e:
+            logger.warning(f"Error summarizing conversation, keeping the latest turns instead: {str(e)}")
+    
+    tokens = encode(f"{previous_summary}\n{transcript}".strip())
+    return decode(tokens[-max_tokens:]).strip()
+
+
+class ConversationSummaryStore:
+    """
+    Rolling summaries of the older turns of conversations.
+    
+    Each summary covers a prefix of the conversation's history. Prompts use
+    the summary as it is; when older turns no longer fit in a prompt, an
+    update folding them into the summary is started in the background, so no
+    request waits for a summarization call. Updates are batched: they only
+    start once min_turns turns are waiting to be summarized, and at most one
+    runs per conversation.
+    
+    Summaries are keyed by (user ID, conversation ID): conversation IDs come
+    from clients, so a user naming another user's conversation gets a
+    summary of their own (empty) conversation rather than the other user's.
+    """
+    def __init__(self, max_conversations: int = 1000, summary_max_tokens: int = 300, min_turns: int = 4):
+        self.summary_max_tokens = summary_max_tokens
+        self.min_turns = min_turns
+        # Map of (user ID, conversation ID) to (summary, number of history messages it covers)
+        self._summaries = LRUCache(max_entries=max_conversations)
+        self._pending: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.updates = 0
+        self.failures = 0
+    
+    def get(self, user_id: str, conversation_id: str) -> Tuple[str, int]:
+        """
+        Get the summary of a conversation.
+        
+        Args:
+            user_id: ID of the user the conversation belongs to
+            conversation_id: The conversation ID
+        
+        Returns:
+            Tuple of (summary, number of history messages it covers)
+        """
+        return self._summaries.get((user_id, conversation_id)) or ("", 0)
+    
+    def schedule_update(self, user_id: str, conversation_id: str, history: List[Dict[str, Any]], upto: int) -> bool:
+        """
+        Start a background update so the summary covers history[:upto].
+        
+        Args:
+            user_id: ID of the user the conversation belongs to
+            conversation_id: The conversation ID
+            history: The conversation history, oldest first
+            upto: Number of leading history messages the summary should cover
+        
+        Returns:
+            True if an update was started
+        """
+        key = (user_id, conversation_id)
+        summary, covered = self.get(user_id, conversation_id)
+        if upto - covered < self.min_turns or key in self._pending:
+            return False
+        
+        turns = list(history[covered:upto])
+        task = asyncio.create_task(self._update(key, summary, covered + len(turns), turns))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return True
+    
+    async def _update(self, key: Tuple[str, str], summary: str, covered: int, turns: List[Dict[str, Any]]) -> None:
+        try:
+            new_summary = await summarize_turns(summary, turns, self.summary_max_tokens)
+            self._summaries.set(key, (new_summary, covered))
+            self.updates += 1
+            logger.info(f"Updated summary of conversation {key[1]} of user {key[0]} to cover {covered} messages")
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Error updating summary of conversation {key[1]} of user {key[0]}: {str(e)}")
+    
+    async def flush(self) -> None:
+        """Wait for the summary updates in progress."""
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
+    
+    def clear(self, user_id: str, conversation_id: str) -> None:
+        """Drop the summary of a conversation."""
+        self._summaries.delete((user_id, conversation_id))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get update counters for the store."""
+        return {
+            "conversations": len(self._summaries),
+            "pending": len(self._pending),
+            "updates": self.updates,
+            "failures": self.failures,
+        }
+
+
+def select_history(
+    history: List[Dict[str, Any]],
+    token_budget: int,
+    conversation_id: Optional[str] = None,
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Fit conversation history into a token budget.
+    
+    The newest turns are kept verbatim. When older turns do not fit they are
+    replaced by the conversation's rolling summary, and a background update
+    of the summary is scheduled.
+    
+    Args:
+        history: Role/content messages, oldest first
+        token_budget: Maximum tokens of the returned messages
+        conversation_id: Conversation whose summary stands in for older turns
+            (older turns are dropped without one)
+        user_id: ID of the user the conversation belongs to
+    
+    Returns:
+        The summary message (if any) followed by the newest turns that fit
+    """
+    costs = [count_message_tokens(message) for message in history]
+    if sum(costs) <= token_budget:
+        return list(history)
+    
+    summary, covered = conversation_summaries.get(user_id, conversation_id) if conversation_id else ("", 0)
+    summary_messages = []
+    if summary:
+        summary_messages = [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}]
+        token_budget -= count_message_tokens(summary_messages[0])
+    
+    # Keep the newest turns that fit
+    kept_from = len(history)
+    used = 0
+    while kept_from > 0 and used + costs[kept_from - 1] <= token_budget:
+        kept_from -= 1
+        used += costs[kept_from]
+    
+    if conversation_id:
+        conversation_summaries.schedule_update(user_id, conversation_id, history, kept_from)
+    
+    logger.debug(f"Prompt keeps {len(history) - kept_from} of {len(history)} history messages (summary covers {covered})")
+    return summary_messages + list(history[kept_from:])
+
+
+def assemble_messages(
+    system_prompt: str,
+    history: List[Dict[str, Any]],
+    token_budget: int,
+    user_message: Optional[Dict[str, Any]] = None,
+    context_block: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    reserved_tokens: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    Build the messages of a prompt within a token budget.
+    
+    The system prompt, the context block and the user message are always
+    included; the rest of the budget is filled by select_history.
+    
+    Args:
+        system_prompt: The system prompt
+        history: Earlier role/content messages, oldest first
+        token_budget: Maximum prompt tokens
+        user_message: The message being answered, appended last
+        context_block: Text added to the system prompt (e.g. retrieved business context)
+        conversation_id: Conversation whose summary stands in for older turns
+        user_id: ID of the user the conversation belongs to
+        reserved_tokens: Tokens of the budget used outside the messages (e.g. function definitions)
+    
+    Returns:
+        The prompt messages
+    """
+    system_content = f"{system_prompt}\n\n{context_block}" if context_block else system_prompt
+    head = [{"role": "system", "content": system_content}]
+    tail = [user_message] if user_message else []
+    available = token_budget - reserved_tokens - sum(count_message_tokens(message) for message in head + tail)
+    return head + select_history(history, available, conversation_id, user_id) + tail
+
+
+# Create the global conversation summary store
+conversation_summaries = ConversationSummaryStore(
+    max_conversations=settings.CONVERSATION_SUMMARY_MAX_CONVERSATIONS,
+    summary_max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+    min_turns=settings.CONVERSATION_SUMMARY_MIN_TURNS
+)
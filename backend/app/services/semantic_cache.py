@@ -0,0 +1,207 @@
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.services.vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticResponseCache:
+    """
+    Cache of generated chat responses keyed by the embedding of the query.
+    
+    Entries are scoped per business and per business context version
+    (comparable, e.g. updated_at): a lookup only matches queries answered
+    with the same version of the context, and the first lookup or store with
+    a newer version drops the business's entries. Lookups and stores with an
+    older version (a request that read the context before it changed) miss
+    and are not cached. Within a scope the nearest cached query is found with
+    a vector index, and its response is reused when the cosine similarity is
+    at least the configured threshold. Each scope keeps its most recently
+    used entries up to max_entries_per_business.
+    
+    At most max_businesses scopes are kept: the least recently used is
+    dropped beyond that, and a scope unused for idle_seconds expires.
+    """
+    def __init__(
+        self,
+        similarity_threshold: float = 0.92,
+        max_entries_per_business: int = 500,
+        ttl_seconds: Optional[float] = None,
+        enabled: bool = True,
+        max_businesses: int = 1000,
+        idle_seconds: Optional[float] = None
+    ):
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_business = max_entries_per_business
+        self.ttl_seconds = ttl_seconds
+        self._scopes = LRUCache(max_entries=max_businesses, ttl_seconds=idle_seconds)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+        self.saved_latency_ms = 0.0
+        self.saved_tokens = 0
+    
+    def _scope(self, business_id: str, version: Any, create: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Get the scope of a business, replacing it if the context version is newer.
+        
+        Returns:
+            The scope, or None if the version is older than the cached one
+            (or there is no scope for it and create is False)
+        """
+        scope = self._scopes.get(business_id)
+        if scope is not None and version < scope["version"]:
+            return None
+        if scope is not None and version != scope["version"]:
+            self.invalidate(business_id)
+            scope = None
+        if scope is None:
+            if not create:
+                return None
+            scope = {"version": version, "index": VectorIndex(), "entries": OrderedDict()}
+        # Storing again restarts the idle timeout
+        self._scopes.set(business_id, scope)
+        return scope
+    
+    def _remove(self, scope: Dict[str, Any], entry_id: str) -> None:
+        scope["entries"].pop(entry_id, None)
+        scope["index"].remove(entry_id)
+    
+    def lookup(self, business_id: str, version: Any, query_embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached response for a query similar to the given one.
+        
+        Args:
+            business_id: The business the query is answered for
+            version: Version of the business context used to answer (e.g. updated_at)
+            query_embedding: Embedding of the query
+        
+        Returns:
+            The cached entry (query, response, usage, latency_ms) with the match
+            similarity, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        
+        scope = self._scope(business_id, version, create=False)
+        results = scope["index"].search(query_embedding, 1, self.similarity_threshold) if scope else []
+        if not results:
+            self.misses += 1
+            return None
+        
+        entry_id, similarity = results[0]
+        entry = scope["entries"][entry_id]
+        if entry["expires_at"] is not None and entry["expires_at"] <= time.monotonic():
+            self._remove(scope, entry_id)
+            self.misses += 1
+            return None
+        
+        scope["entries"].move_to_end(entry_id)
+        self.hits += 1
+        self.saved_latency_ms += entry["latency_ms"]
+        self.saved_tokens += entry["usage"].get("total_tokens", 0)
+        return {**entry, "similarity": similarity}
+    
+    def store(
+        self,
+        business_id: str,
+        version: Any,
+        query: str,
+        query_embedding: List[float],
+        response: str,
+        usage: Optional[Dict[str, int]] = None,
+        latency_ms: float = 0.0
+    ) -> None:
+        """
+        Cache a generated response.
+        
+        Args:
+            business_id: The business the query was answered for
+            version: Version of the business context used to answer
+            query: The query text
+            query_embedding: Embedding of the query
+            response: The generated response
+            usage: Token usage of the generation (saved on every hit)
+            latency_ms: Generation latency (saved on every hit)
+        """
+        if not self.enabled:
+            return
+        
+        scope = self._scope(business_id, version)
+        if scope is None:
+            return
+        
+        entry_id = str(uuid.uuid4())
+        scope["index"].add(entry_id, query_embedding)
+        scope["entries"][entry_id] = {
+            "query": query,
+            "response": response,
+            "usage": usage or {},
+            "latency_ms": latency_ms,
+            "expires_at": time.monotonic() + self.ttl_seconds if self.ttl_seconds else None,
+        }
+        self.stores += 1
+        
+        while len(scope["entries"]) > self.max_entries_per_business:
+            oldest_id = next(iter(scope["entries"]))
+            self._remove(scope, oldest_id)
+    
+    def invalidate(self, business_id: str) -> bool:
+        """
+        Drop all cached responses of a business (e.g. after its context changed).
+        
+        Args:
+            business_id: The business ID
+        
+        Returns:
+            True if the business had cached responses, False otherwise
+        """
+        scope = self._scopes.get(business_id)
+        if scope is None:
+            return False
+        self._scopes.delete(business_id)
+        self.invalidations += 1
+        logger.info(f"Invalidated {len(scope['entries'])} cached responses for business: {business_id}")
+        return True
+    
+    def clear(self) -> None:
+        """Drop all cached responses."""
+        self._scopes.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get hit rate, savings and size counters for the cache."""
+        lookups = self.hits + self.misses
+        scopes = [scope for _, scope in self._scopes.items()]
+        return {
+            "enabled": self.enabled,
+            "similarity_threshold": self.similarity_threshold,
+            "businesses": len(scopes),
+            "evicted_businesses": self._scopes.evictions,
+            "entries": sum(len(scope["entries"]) for scope in scopes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "saved_latency_ms": round(self.saved_latency_ms, 1),
+            "saved_tokens": self.saved_tokens,
+        }
+
+
+# Create a global semantic response cache for workspace chat
+semantic_cache = SemanticResponseCache(
+    similarity_threshold=settings.SEMANTIC_CACHE_SIMILARITY_THRESHOLD,
+    max_entries_per_business=settings.SEMANTIC_CACHE_MAX_ENTRIES_PER_BUSINESS,
+    ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS or None,
+    enabled=settings.SEMANTIC_CACHE_ENABLED,
+    max_businesses=settings.INDEX_REGISTRY_MAX_SCOPES,
+    idle_seconds=settings.INDEX_REGISTRY_IDLE_SECONDS or None
+)
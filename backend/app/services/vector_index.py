@@ -0,0 +1,439 @@
+import logging
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Iterable, Callable, Awaitable
+
+import numpy as np
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Storage precisions for indexed vectors: float16 halves memory, int8 (with a
+# per-vector scale) quarters it; scores are then approximate. float16 scoring is
+# slower than float32 because numpy converts half floats without SIMD
+VECTOR_PRECISIONS = {
+    "float32": np.float32,
+    "float16": np.float16,
+    "int8": np.int8,
+}
+
+# Rows converted to float32 at a time when scoring quantized vectors (small blocks stay in CPU cache)
+SCORE_BLOCK_ROWS = 256
+
+
+def normalize_vector(embedding: Sequence[float]) -> np.ndarray:
+    """
+    Convert an embedding to a unit-length float32 vector.
+    
+    Args:
+        embedding: The embedding vector
+    
+    Returns:
+        The L2-normalized float32 vector (all zeros for a zero vector)
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return np.zeros_like(vector)
+    return vector / norm
+
+
+class VectorIndex:
+    """
+    In-memory cosine-similarity index over pre-normalized embeddings.
+    
+    All vectors live in one contiguous matrix so a query is scored with a single
+    matrix-vector product. Items can be added, replaced and removed
+    incrementally; removal moves the last row into the freed slot.
+    
+    With precision "float16" or "int8" the matrix is stored quantized and
+    scores are approximate; VectorIndexRegistry.search() rescores the top
+    candidates with full-precision vectors fetched from the embedding store.
+    """
+    def __init__(
+        self,
+        dimension: Optional[int] = None,
+        initial_capacity: int = 64,
+        precision: str = "float32"
+    ):
+        if precision not in VECTOR_PRECISIONS:
+            raise ValueError(f"Unknown vector precision: {precision}")
+        self.dimension = dimension
+        self.precision = precision
+        self.ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._versions: Dict[str, Any] = {}
+        self._initial_capacity = initial_capacity
+        self._dtype = VECTOR_PRECISIONS[precision]
+        self._matrix: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        if dimension is not None:
+            self._allocate(initial_capacity, dimension)
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._positions
+    
+    def version(self, item_id: str) -> Any:
+        """Get the version recorded when an item was added, or None."""
+        return self._versions.get(item_id)
+    
+    def position(self, item_id: str) -> Optional[int]:
+        """Get the row of an item in the arrays returned by scores(), or None."""
+        return self._positions.get(item_id)
+    
+    def retag(self, item_id: str, version: Any) -> bool:
+        """
+        Record a new version for an item whose vector is unchanged.
+        
+        Args:
+            item_id: The item identifier
+            version: The new version marker
+        
+        Returns:
+            True if the item was present, False otherwise
+        """
+        if item_id not in self._positions:
+            return False
+        self._versions[item_id] = version
+        return True
+    
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the stored vectors (including unused capacity)."""
+        if self._matrix is None:
+            return 0
+        return self._matrix.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+    
+    def _allocate(self, capacity: int, dimension: int) -> None:
+        matrix = np.zeros((capacity, dimension), dtype=self._dtype)
+        scales = np.ones(capacity, dtype=np.float32) if self.precision == "int8" else None
+        if self._matrix is not None:
+            matrix[:len(self.ids)] = self._matrix[:len(self.ids)]
+            if scales is not None:
+                scales[:len(self.ids)] = self._scales[:len(self.ids)]
+        self._matrix = matrix
+        self._scales = scales
+    
+    def _ensure_capacity(self, size: int, dimension: int) -> None:
+        if self._matrix is None:
+            self.dimension = dimension
+            self._allocate(max(self._initial_capacity, size), dimension)
+        elif dimension != self.dimension:
+            raise ValueError(f"Embedding dimension {dimension} does not match index dimension {self.dimension}")
+        elif size > self._matrix.shape[0]:
+            self._allocate(max(size, self._matrix.shape[0] * 2), self.dimension)
+    
+    def _store(self, position: int, vector: np.ndarray) -> None:
+        if self.precision == "int8":
+            # Symmetric scalar quantization: the largest component maps to +/-127
+            scale = float(np.abs(vector).max()) / 127 or 1.0
+            self._matrix[position] = np.round(vector / scale)
+            self._scales[position] = scale
+        else:
+            self._matrix[position] = vector
+    
+    def add(self, item_id: str, embedding: Sequence[float], version: Any = None) -> None:
+        """
+        Add an item to the index, replacing any existing vector for the same ID.
+        
+        Args:
+            item_id: Unique item identifier
+            embedding: The item's embedding vector
+            version: Optional version marker (e.g. updated_at) used to detect stale items
+        """
+        vector = normalize_vector(embedding)
+        position = self._positions.get(item_id)
+        if position is None:
+            self._ensure_capacity(len(self.ids) + 1, vector.shape[0])
+            position = len(self.ids)
+            self.ids.append(item_id)
+            self._positions[item_id] = position
+        elif vector.shape[0] != self.dimension:
+            raise ValueError(f"Embedding dimension {vector.shape[0]} does not match index dimension {self.dimension}")
+        
+        self._store(position, vector)
+        self._versions[item_id] = version
+    
+    def add_many(
+        self,
+        item_ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        versions: Optional[Sequence[Any]] = None
+    ) -> None:
+        """
+        Add several items to the index.
+        
+        Args:
+            item_ids: Item identifiers
+            embeddings: Embedding vectors aligned with item_ids
+            versions: Optional version markers aligned with item_ids
+        """
+        versions = versions if versions is not None else [None] * len(item_ids)
+        for item_id, embedding, version in zip(item_ids, embeddings, versions):
+            self.add(item_id, embedding, version)
+    
+    def remove(self, item_id: str) -> bool:
+        """
+        Remove an item from the index.
+        
+        Args:
+            item_id: The item identifier
+        
+        Returns:
+            True if the item was present, False otherwise
+        """
+        position = self._positions.pop(item_id, None)
+        if position is None:
+            return False
+        
+        self._versions.pop(item_id, None)
+        last = len(self.ids) - 1
+        if position != last:
+            moved_id = self.ids[last]
+            self._matrix[position] = self._matrix[last]
+            if self._scales is not None:
+                self._scales[position] = self._scales[last]
+            self.ids[position] = moved_id
+            self._positions[moved_id] = position
+        self.ids.pop()
+        return True
+    
+    def scores(self, query_embedding: Sequence[float]) -> np.ndarray:
+        """
+        Compute cosine similarity between the query and every indexed item.
+        
+        Args:
+            query_embedding: The query embedding vector
+        
+        Returns:
+            Array of similarity scores aligned with self.ids (approximate for quantized indexes)
+        """
+        if not self.ids:
+            return np.zeros(0, dtype=np.float32)
+        
+        query = normalize_vector(query_embedding)
+        count = len(self.ids)
+        if self.precision == "float32":
+            return self._matrix[:count] @ query
+        
+        # numpy has no fast float16/int8 matmul, so convert a block of rows at a time
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, count)
+            scores[start:end] = self._matrix[start:end].astype(np.float32) @ query
+        if self._scales is not None:
+            scores *= self._scales[:count]
+        return scores
+    
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int = 3,
+        similarity_threshold: Optional[float] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the items most similar to the query.
+        
+        Args:
+            query_embedding: The query embedding vector
+            top_k: Number of top results to return
+            similarity_threshold: Optional minimum similarity score to include in results
+        
+        Returns:
+            List of (item_id, similarity_score) tuples, sorted by similarity
+        """
+        return top_k_by_score(self.ids, self.scores(query_embedding), top_k, similarity_threshold)
+
+
+def top_k_by_score(
+    ids: Sequence[str],
+    scores: np.ndarray,
+    top_k: int,
+    min_score: Optional[float] = None
+) -> List[Tuple[str, float]]:
+    """
+    Select the highest-scoring items with a partial sort.
+    
+    Args:
+        ids: Item identifiers aligned with scores
+        scores: Array of scores
+        top_k: Number of top results to return
+        min_score: Optional minimum score to include in results
+    
+    Returns:
+        List of (item_id, score) tuples, sorted by score (descending)
+    """
+    if top_k <= 0 or len(scores) == 0:
+        return []
+    
+    if top_k < len(scores):
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+    
+    results = []
+    for position in candidates:
+        score = float(scores[position])
+        if min_score is not None and score < min_score:
+            break
+        results.append((ids[position], score))
+    return results
+
+
+def rescore(
+    query_embedding: Sequence[float],
+    candidates: Sequence[Tuple[str, float]],
+    embeddings: Sequence[Optional[Sequence[float]]],
+    top_k: int,
+    min_score: Optional[float] = None
+) -> List[Tuple[str, float]]:
+    """
+    Re-rank approximate candidates by exact cosine similarity.
+    
+    Exact and approximate scores are never ranked together: if any candidate
+    has no full-precision embedding, every candidate keeps its approximate score.
+    
+    Args:
+        query_embedding: The query embedding vector
+        candidates: (item_id, approximate_score) tuples from a quantized index
+        embeddings: Full-precision embeddings aligned with candidates (None if unavailable)
+        top_k: Number of top results to return
+        min_score: Optional minimum score to include in results
+    
+    Returns:
+        List of (item_id, score) tuples, sorted by score (descending)
+    """
+    if not candidates:
+        return []
+    
+    ids = [item_id for item_id, _ in candidates]
+    if any(embedding is None for embedding in embeddings):
+        logger.warning("Full-precision vectors missing for some candidates, keeping approximate scores")
+        scores = np.array([score for _, score in candidates], dtype=np.float32)
+        return top_k_by_score(ids, scores, top_k, min_score)
+    
+    query = normalize_vector(query_embedding)
+    scores = np.array([float(normalize_vector(embedding) @ query) for embedding in embeddings], dtype=np.float32)
+    return top_k_by_score(ids, scores, top_k, min_score)
+
+
+class VectorIndexRegistry:
+    """
+    Holds one VectorIndex per scope (e.g. per user or per business).
+    
+    At most max_scopes indexes are kept: the least recently used is dropped
+    beyond that, and an index unused for idle_seconds expires. A dropped
+    index is rebuilt on its next use (from the embedding cache).
+    
+    Quantized indexes hold only the compact vectors; search() takes
+    rescore_factor times more candidates from them and re-ranks those with
+    full-precision vectors fetched from the embedding store.
+    """
+    def __init__(
+        self,
+        precision: str = "float32",
+        rescore_factor: int = 0,
+        max_scopes: int = 1000,
+        idle_seconds: Optional[float] = None
+    ):
+        self.precision = precision
+        self.rescore_factor = rescore_factor
+        self._indexes = LRUCache(max_entries=max_scopes, ttl_seconds=idle_seconds)
+    
+    def get(self, scope: str) -> VectorIndex:
+        """Get the index for a scope, creating it if needed."""
+        index = self._indexes.get(scope)
+        if index is None:
+            index = VectorIndex(precision=self.precision)
+        # Storing again restarts the idle timeout
+        self._indexes.set(scope, index)
+        return index
+    
+    def drop(self, scope: str) -> None:
+        """Drop the index for a scope."""
+        self._indexes.delete(scope)
+    
+    async def search(
+        self,
+        index: VectorIndex,
+        query_embedding: Sequence[float],
+        top_k: int,
+        similarity_threshold: Optional[float],
+        fetch_embeddings: Callable[[List[str]], Awaitable[List[Optional[Sequence[float]]]]]
+    ) -> List[Tuple[str, float]]:
+        """
+        Search an index, rescoring quantized results with full-precision vectors.
+        
+        Args:
+            index: The index to search (one of this registry's or a throwaway float32 index)
+            query_embedding: The query embedding vector
+            top_k: Number of top results to return
+            similarity_threshold: Optional minimum similarity score, applied to exact scores
+            fetch_embeddings: Returns the full-precision embeddings of item IDs
+        
+        Returns:
+            List of (item_id, similarity_score) tuples, sorted by similarity
+        """
+        if index.precision == "float32" or not self.rescore_factor:
+            return index.search(query_embedding, top_k, similarity_threshold)
+        
+        candidates = index.search(query_embedding, top_k * self.rescore_factor)
+        embeddings = await fetch_embeddings([item_id for item_id, _ in candidates]) if candidates else []
+        return rescore(query_embedding, candidates, embeddings, top_k, similarity_threshold)
+    
+    def _all(self) -> List[VectorIndex]:
+        return [index for _, index in self._indexes.items()]
+    
+    def discard(self, item_id: str) -> None:
+        """Remove an item from every index that contains it."""
+        for index in self._all():
+            index.remove(item_id)
+    
+    def refresh(self, item_id: str, embedding: Sequence[float], version: Any = None) -> None:
+        """Replace an item's vector in every index that already contains it."""
+        for index in self._all():
+            if item_id in index:
+                index.add(item_id, embedding, version)
+    
+    def retag(self, item_id: str, version: Any) -> None:
+        """Update an item's version in every index that contains it, keeping its vector."""
+        for index in self._all():
+            index.retag(item_id, version)
+
+    def scopes(self) -> Iterable[str]:
+        return [scope for scope, _ in self._indexes.items()]
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the size of the held indexes.
+        
+        Returns:
+            Dictionary of registry statistics
+        """
+        indexes = self._all()
+        return {
+            "precision": self.precision,
+            "indexes": len(indexes),
+            "vectors": sum(len(index) for index in indexes),
+            "bytes": sum(index.nbytes for index in indexes),
+            "evictions": self._indexes.evictions,
+        }
+
+
+# Create global registries of business context and context chunk indexes
+context_indexes = VectorIndexRegistry(
+    precision=settings.VECTOR_MEMORY_PRECISION,
+    rescore_factor=settings.VECTOR_RESCORE_FACTOR,
+    max_scopes=settings.INDEX_REGISTRY_MAX_SCOPES,
+    idle_seconds=settings.INDEX_REGISTRY_IDLE_SECONDS
+)
+chunk_indexes = VectorIndexRegistry(
+    precision=settings.VECTOR_MEMORY_PRECISION,
+    rescore_factor=settings.VECTOR_RESCORE_FACTOR,
+    max_scopes=settings.INDEX_REGISTRY_MAX_SCOPES,
+    idle_seconds=settings.INDEX_REGISTRY_IDLE_SECONDS
+)
@@ -1,23 +1,76 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, Any, Optional, Set
 from fastapi import WebSocket
+from pydantic import BaseModel
+import asyncio
 import json
 import logging
 import uuid
 from datetime import datetime
 
+from app.core.config import settings
+from app.core.json import json_dumps
+
 logger = logging.getLogger(__name__)
 
+# What happens when a message is sent to a connection whose queue is full:
+# "drop" discards the message, "disconnect" closes the slow connection
+OVERFLOW_POLICIES = ("drop", "disconnect")
+
+# Close code sent to connections evicted for not keeping up ("Try Again Later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# Broadcast scopes: the connections of a user, of a conversation, or all of them
+BROADCAST_SCOPES = ("user", "conversation", "all")
+
 class ConnectionManager:
     """
     WebSocket connection manager for handling real-time messaging.
+    
+    Connections are indexed both ways (user and conversation to connections,
+    connection to user and conversations) with sets, so connecting,
+    disconnecting, joining and leaving conversations take constant time
+    regardless of the number of live connections. A connection can be in
+    any number of conversations.
+    
+    Each connection has a bounded outbound queue drained by its own writer
+    task. Sending and broadcasting only enqueue, so a slow client delays its
+    own frames but never anyone else's; when its queue is full the message is
+    dropped or the client disconnected, according to the overflow policy.
+    
+    A manager only holds the sockets of its own process. With a backplane
+    attached (see websocket_backplane), broadcasts are also relayed to the
+    managers of the other workers.
     """
-    def __init__(self):
+    def __init__(self, send_queue_size: int = 256, overflow_policy: str = "disconnect"):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy} (expected one of {', '.join(OVERFLOW_POLICIES)})")
+        self.send_queue_size = send_queue_size
+        self.overflow_policy = overflow_policy
         # Map of connection_id to WebSocket instance
         self.active_connections: Dict[str, WebSocket] = {}
-        # Map of user_id to list of connection_ids
-        self.user_connections: Dict[str, List[str]] = {}
-        # Map of conversation_id to list of connection_ids
-        self.conversation_connections: Dict[str, List[str]] = {}
+        # Map of user_id to set of connection_ids
+        self.user_connections: Dict[str, Set[str]] = {}
+        # Map of conversation_id to set of connection_ids
+        self.conversation_connections: Dict[str, Set[str]] = {}
+        # Map of connection_id to user_id
+        self.connection_users: Dict[str, str] = {}
+        # Map of connection_id to set of conversation_ids
+        self.connection_conversations: Dict[str, Set[str]] = {}
+        # Map of connection_id to its outbound queue and the task sending from it
+        self.send_queues: Dict[str, asyncio.Queue] = {}
+        self.writer_tasks: Dict[str, asyncio.Task] = {}
+        # Close handshakes of evicted slow clients (referenced so they are not garbage-collected)
+        self.close_tasks: Set[asyncio.Task] = set()
+        self.dropped_messages = 0
+        self.slow_consumer_disconnects = 0
+        self.send_errors = 0
+        # Relays broadcasts between workers when attached (see RedisBackplane.start)
+        self.backplane = None
+    
+    def _targets_changed(self):
+        """Tell the backplane that a user or conversation appeared or left this worker."""
+        if self.backplane is not None:
+            self.backplane.notify_changed()
     
     async def connect(self, websocket: WebSocket, user_id: str, conversation_id: Optional[str] = None) -> str:
         """
@@ -37,18 +90,69 @@ class ConnectionManager:
         
         # Add to user connections
         if user_id not in self.user_connections:
-            self.user_connections[user_id] = []
-        self.user_connections[user_id].append(connection_id)
+            self.user_connections[user_id] = set()
+            self._targets_changed()
+        self.user_connections[user_id].add(connection_id)
+        self.connection_users[connection_id] = user_id
+        self.connection_conversations[connection_id] = set()
+        
+        # Start the writer of the connection's outbound queue
+        queue = asyncio.Queue(maxsize=self.send_queue_size)
+        self.send_queues[connection_id] = queue
+        self.writer_tasks[connection_id] = asyncio.create_task(self._writer(connection_id, websocket, queue))
         
         # Add to conversation connections if provided
         if conversation_id:
-            if conversation_id not in self.conversation_connections:
-                self.conversation_connections[conversation_id] = []
-            self.conversation_connections[conversation_id].append(connection_id)
+            self.join_conversation(connection_id, conversation_id)
         
         logger.info(f"Client connected: {connection_id} (User: {user_id}, Conversation: {conversation_id})")
         return connection_id
     
+    def join_conversation(self, connection_id: str, conversation_id: str) -> bool:
+        """
+        Add a connection to a conversation.
+        
+        Args:
+            connection_id: The connection ID
+            conversation_id: The conversation ID to join
+        
+        Returns:
+            True if the connection joined, False if it is unknown or already in the conversation
+        """
+        conversations = self.connection_conversations.get(connection_id)
+        if conversations is None or conversation_id in conversations:
+            return False
+        
+        conversations.add(conversation_id)
+        if conversation_id not in self.conversation_connections:
+            self.conversation_connections[conversation_id] = set()
+            self._targets_changed()
+        self.conversation_connections[conversation_id].add(connection_id)
+        return True
+    
+    def leave_conversation(self, connection_id: str, conversation_id: str) -> bool:
+        """
+        Remove a connection from a conversation.
+        
+        Args:
+            connection_id: The connection ID
+            conversation_id: The conversation ID to leave
+        
+        Returns:
+            True if the connection left, False if it was not in the conversation
+        """
+        conversations = self.connection_conversations.get(connection_id)
+        if conversations is None or conversation_id not in conversations:
+            return False
+        
+        conversations.discard(conversation_id)
+        connections = self.conversation_connections[conversation_id]
+        connections.discard(connection_id)
+        if not connections:
+            del self.conversation_connections[conversation_id]
+            self._targets_changed()
+        return True
+    
     def disconnect(self, connection_id: str):
         """
         Disconnect a WebSocket client.
@@ -63,41 +167,198 @@ class ConnectionManager:
         del self.active_connections[connection_id]
         
         # Remove from user connections
-        for user_id, connections in list(self.user_connections.items()):
-            if connection_id in connections:
-                connections.remove(connection_id)
-                if not connections:
-                    del self.user_connections[user_id]
+        user_id = self.connection_users.pop(connection_id)
+        connections = self.user_connections[user_id]
+        connections.discard(connection_id)
+        if not connections:
+            del self.user_connections[user_id]
+            self._targets_changed()
         
         # Remove from conversation connections
-        for conversation_id, connections in list(self.conversation_connections.items()):
-            if connection_id in connections:
-                connections.remove(connection_id)
-                if not connections:
-                    del self.conversation_connections[conversation_id]
+        for conversation_id in list(self.connection_conversations[connection_id]):
+            self.leave_conversation(connection_id, conversation_id)
+        del self.connection_conversations[connection_id]
+        
+        # Stop the writer; frames still queued are discarded
+        queue = self.send_queues.pop(connection_id)
+        while not queue.empty():
+            queue.get_nowait()
+            queue.task_done()
+        writer = self.writer_tasks.pop(connection_id)
+        if writer is not asyncio.current_task():
+            writer.cancel()
         
         logger.info(f"Client disconnected: {connection_id}")
     
+    def get_user_id(self, connection_id: str) -> Optional[str]:
+        """Get the user of a connection (None if it is not connected)."""
+        return self.connection_users.get(connection_id)
+    
+    def get_conversations(self, connection_id: str) -> Set[str]:
+        """Get the conversations a connection is in."""
+        return set(self.connection_conversations.get(connection_id, ()))
+    
+    async def _writer(self, connection_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        """Send the queued frames of a connection in order until it disconnects."""
+        while True:
+            text = await queue.get()
+            try:
+                await websocket.send_text(text)
+            except Exception as e:
+                self.send_errors += 1
+                logger.warning(f"Error sending to connection {connection_id}, disconnecting: {str(e)}")
+                self.disconnect(connection_id)
+                return
+            finally:
+                queue.task_done()
+    
+    def _enqueue(self, text: str, connection_id: str) -> bool:
+        """
+        Queue a serialized frame for a connection without waiting.
+        
+        Args:
+            text: The frame to send
+            connection_id: The connection ID to send to
+        
+        Returns:
+            True if the frame was queued
+        """
+        queue = self.send_queues.get(connection_id)
+        if queue is None:
+            logger.warning(f"Attempted to send message to non-existent connection: {connection_id}")
+            return False
+        
+        try:
+            queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            self.dropped_messages += 1
+        
+        if self.overflow_policy == "drop":
+            logger.warning(f"Send queue of connection {connection_id} is full, dropping message")
+            return False
+        
+        logger.warning(f"Send queue of connection {connection_id} is full, disconnecting slow client")
+        self.slow_consumer_disconnects += 1
+        websocket = self.active_connections[connection_id]
+        self.disconnect(connection_id)
+        task = asyncio.create_task(self._close(websocket))
+        self.close_tasks.add(task)
+        task.add_done_callback(self.close_tasks.discard)
+        return False
+    
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Client is not keeping up")
+        except Exception:
+            # Already closed by the client
+            pass
+    
+    @staticmethod
+    def encode_message(message: Any) -> str:
+        """
+        Serialize a message into a text frame.
+        
+        Args:
+            message: A dict, list or pydantic model (sent as JSON), or any other
+                value (sent as its string form)
+        
+        Returns:
+            The frame text
+        """
+        if isinstance(message, (dict, list, BaseModel)):
+            return json_dumps(message)
+        return str(message)
+    
     async def send_personal_message(self, message: Any, connection_id: str):
         """
         Send a message to a specific connection.
         
+        The message is queued for the connection's writer; this does not wait
+        for the client to receive it.
+        
         Args:
             message: The message to send
             connection_id: The connection ID to send to
         """
-        from app.core.json import json_dumps
+        self._enqueue(self.encode_message(message), connection_id)
+    
+    def deliver_local(self, text: str, scope: str, target_id: Optional[str] = None) -> int:
+        """
+        Queue an encoded frame for the local connections of a broadcast scope.
         
-        if connection_id not in self.active_connections:
-            logger.warning(f"Attempted to send message to non-existent connection: {connection_id}")
-            return
+        Args:
+            text: The frame to send
+            scope: "user", "conversation" or "all"
+            target_id: The user or conversation ID (unused for "all")
         
-        websocket = self.active_connections[connection_id]
-        if isinstance(message, dict) or isinstance(message, list):
-            # Use custom JSON serialization for datetime objects
-            await websocket.send_text(json_dumps(message))
+        Returns:
+            Number of connections the frame was queued for
+        """
+        if scope == "user":
+            connection_ids = self.user_connections.get(target_id, ())
+        elif scope == "conversation":
+            connection_ids = self.conversation_connections.get(target_id, ())
         else:
-            await websocket.send_text(str(message))
+            connection_ids = self.active_connections
+        # Snapshot the IDs: an overflowing queue disconnects its connection mid-loop
+        return sum(self._enqueue(text, connection_id) for connection_id in list(connection_ids))
+    
+    async def _broadcast(self, message: Any, scope: str, target_id: Optional[str] = None) -> int:
+        """
+        Serialize a message once, deliver it locally and relay it to the other workers.
+        
+        Args:
+            message: The message to send
+            scope: "user", "conversation" or "all"
+            target_id: The user or conversation ID (unused for "all")
+        
+        Returns:
+            Number of local connections the message was queued for
+        """
+        text = self.encode_message(message)
+        delivered = self.deliver_local(text, scope, target_id)
+        if self.backplane is not None:
+            await self.backplane.publish(text, scope, target_id)
+        return delivered
+    
+    async def drain(self, connection_id: str):
+        """
+        Wait until the frames queued for a connection have been sent.
+        
+        Args:
+            connection_id: The connection ID
+        """
+        queue = self.send_queues.get(connection_id)
+        if queue is not None:
+            await queue.join()
+    
+    def queue_depth(self, connection_id: str) -> int:
+        """Get the number of frames waiting to be sent to a connection."""
+        queue = self.send_queues.get(connection_id)
+        return queue.qsize() if queue is not None else 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get connection counts, queue depths and drop counters.
+        
+        Returns:
+            Dictionary of connection manager statistics
+        """
+        depths = [queue.qsize() for queue in self.send_queues.values()]
+        return {
+            "connections": len(self.active_connections),
+            "users": len(self.user_connections),
+            "conversations": len(self.conversation_connections),
+            "send_queue_size": self.send_queue_size,
+            "overflow_policy": self.overflow_policy,
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "dropped_messages": self.dropped_messages,
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+            "send_errors": self.send_errors,
+            "backplane": self.backplane.stats() if self.backplane is not None else None,
+        }
     
     async def broadcast_to_user(self, message: Any, user_id: str):
         """
@@ -107,12 +368,11 @@ class ConnectionManager:
             message: The message to send
             user_id: The user ID to broadcast to
         """
-        if user_id not in self.user_connections:
+        if user_id not in self.user_connections and self.backplane is None:
             logger.warning(f"Attempted to broadcast to non-existent user: {user_id}")
             return
         
-        for connection_id in self.user_connections[user_id]:
-            await self.send_personal_message(message, connection_id)
+        await self._broadcast(message, "user", user_id)
     
     async def broadcast_to_conversation(self, message: Any, conversation_id: str):
         """
@@ -122,12 +382,11 @@ class ConnectionManager:
             message: The message to send
             conversation_id: The conversation ID to broadcast to
         """
-        if conversation_id not in self.conversation_connections:
+        if conversation_id not in self.conversation_connections and self.backplane is None:
             logger.warning(f"Attempted to broadcast to non-existent conversation: {conversation_id}")
             return
         
-        for connection_id in self.conversation_connections[conversation_id]:
-            await self.send_personal_message(message, connection_id)
+        await self._broadcast(message, "conversation", conversation_id)
     
     async def broadcast(self, message: Any):
         """
@@ -136,8 +395,10 @@ class ConnectionManager:
         Args:
             message: The message to send
         """
-        for connection_id in self.active_connections:
-            await self.send_personal_message(message, connection_id)
+        await self._broadcast(message, "all")
 
 # Create a global connection manager instance
-manager = ConnectionManager()
+manager = ConnectionManager(
+    send_queue_size=settings.WEBSOCKET_SEND_QUEUE_SIZE,
+    overflow_policy=settings.WEBSOCKET_OVERFLOW_POLICY
+)
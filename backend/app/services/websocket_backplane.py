@@ -0,0 +1,363 @@
+"""
+Redis pub/sub backplane for running the WebSocket tier on several workers.
+
+Each worker subscribes to one Redis channel per user and conversation it
+holds connections for (plus a channel for broadcasts to everyone), relays
+its broadcasts to those channels, and delivers what it receives to its own
+sockets. Frames travel already encoded, tagged with the publishing worker so
+it can skip its own messages; local recipients are served directly.
+
+Presence is kept in one sorted set per user and conversation, mapping worker
+IDs to the expiry of their last heartbeat. Workers also announce the users
+and conversations they join and leave on a presence channel (and all of them
+again on every heartbeat), so each worker holds a local view of where
+recipients are: a broadcast whose recipients are all on the publishing worker
+is not published at all, without asking Redis. A worker that dies drops out
+of presence once its heartbeat expires.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.redis import get_redis_client
+from app.services.websocket import ConnectionManager, manager
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "ws"
+
+# Channel of the join, leave and hello announcements between workers
+PRESENCE_CHANNEL = f"{CHANNEL_PREFIX}:presence"
+
+# Separates the publishing worker's ID from the frame in published messages
+ORIGIN_SEPARATOR = "|"
+
+
+def get_channel(scope: str, target_id: Optional[str] = None) -> str:
+    """Get the pub/sub channel of a broadcast scope ("user", "conversation" or "all")."""
+    if scope == "all":
+        return f"{CHANNEL_PREFIX}:all"
+    return f"{CHANNEL_PREFIX}:{scope}:{target_id}"
+
+
+def get_presence_key(scope: str, target_id: str) -> str:
+    """Get the key of the sorted set of workers holding a user or conversation."""
+    return f"{CHANNEL_PREFIX}:presence:{scope}:{target_id}"
+
+
+class RedisBackplane:
+    """
+    Relays the broadcasts of a ConnectionManager through Redis pub/sub.
+    
+    Subscriptions follow the users and conversations of the local manager:
+    the manager signals changes and a background task subscribes and
+    unsubscribes, so connecting never waits for Redis. Redis errors never
+    fail a broadcast; local recipients are always served.
+    """
+    def __init__(
+        self,
+        connection_manager: ConnectionManager,
+        redis: Optional[Any] = None,
+        presence_ttl_seconds: int = 30,
+        heartbeat_seconds: float = 10.0,
+        worker_id: Optional[str] = None
+    ):
+        self.manager = connection_manager
+        self.presence_ttl_seconds = presence_ttl_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self._redis = redis
+        self._pubsub = None
+        self._tasks = []
+        self._changed = asyncio.Event()
+        # (scope, target_id) pairs currently subscribed
+        self._subscribed: Set[Tuple[str, str]] = set()
+        # Presence announced by the other workers: (scope, target_id) -> {worker_id: expires_at}
+        self._remote: Dict[Tuple[str, str], Dict[str, float]] = {}
+        # Set when a starting worker asks for an early heartbeat
+        self._announce_requested = asyncio.Event()
+        self.published = 0
+        self.local_only = 0
+        self.received = 0
+        self.errors = 0
+    
+    @property
+    def started(self) -> bool:
+        return self._pubsub is not None
+    
+    async def start(self) -> None:
+        """
+        Subscribe to Redis and attach to the connection manager.
+        """
+        if self.started:
+            return
+        
+        if self._redis is None:
+            self._redis = get_redis_client()
+            if self._redis is None:
+                logger.error("Redis is not available. WebSocket backplane disabled.")
+                return
+        
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(get_channel("all"), PRESENCE_CHANNEL)
+        self.manager.backplane = self
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._sync_loop()),
+            asyncio.create_task(self._heartbeat_loop()),
+        ]
+        self.notify_changed()
+        # Ask the running workers to announce their presence now rather than on their next heartbeat
+        await self._announce("hello")
+        logger.info(f"WebSocket backplane started for worker {self.worker_id}")
+    
+    async def stop(self) -> None:
+        """
+        Detach from the connection manager, withdraw presence and unsubscribe.
+        """
+        if not self.started:
+            return
+        
+        self.manager.backplane = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        
+        try:
+            await self._remove_presence(self._subscribed)
+            await self._announce("leave", self._subscribed)
+            await self._pubsub.aclose()
+        except Exception as e:
+            logger.warning(f"Error stopping WebSocket backplane: {str(e)}")
+        self._pubsub = None
+        self._subscribed = set()
+        self._remote = {}
+        logger.info(f"WebSocket backplane stopped for worker {self.worker_id}")
+    
+    def notify_changed(self) -> None:
+        """Schedule a subscription update after local users or conversations changed."""
+        self._changed.set()
+    
+    def _local_targets(self) -> Set[Tuple[str, str]]:
+        return (
+            {("user", user_id) for user_id in self.manager.user_connections}
+            | {("conversation", conversation_id) for conversation_id in self.manager.conversation_connections}
+        )
+    
+    async def sync(self) -> None:
+        """
+        Subscribe to the channels of the local users and conversations and
+        unsubscribe from the ones that left, updating presence to match.
+        """
+        targets = self._local_targets()
+        added = targets - self._subscribed
+        removed = self._subscribed - targets
+        
+        if added:
+            await self._pubsub.subscribe(*[get_channel(scope, target_id) for scope, target_id in added])
+            await self._refresh_presence(added)
+            await self._announce("join", added)
+            self._subscribed |= added
+        if removed:
+            await self._pubsub.unsubscribe(*[get_channel(scope, target_id) for scope, target_id in removed])
+            await self._remove_presence(removed)
+            await self._announce("leave", removed)
+            self._subscribed -= removed
+    
+    async def _sync_loop(self) -> None:
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            try:
+                await self.sync()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error updating WebSocket backplane subscriptions: {str(e)}")
+                await asyncio.sleep(1.0)
+                self._changed.set()
+    
+    async def _refresh_presence(self, targets: Set[Tuple[str, str]]) -> None:
+        """Record this worker in the presence of targets until the TTL expires."""
+        if not targets:
+            return
+        now = time.time()
+        pipeline = self._redis.pipeline(transaction=False)
+        for scope, target_id in targets:
+            key = get_presence_key(scope, target_id)
+            # Drop workers whose heartbeat expired (e.g. killed without cleanup)
+            pipeline.zremrangebyscore(key, 0, now)
+            pipeline.zadd(key, {self.worker_id: now + self.presence_ttl_seconds})
+            pipeline.expire(key, self.presence_ttl_seconds)
+        await pipeline.execute()
+    
+    async def _remove_presence(self, targets: Set[Tuple[str, str]]) -> None:
+        if not targets:
+            return
+        pipeline = self._redis.pipeline(transaction=False)
+        for scope, target_id in targets:
+            pipeline.zrem(get_presence_key(scope, target_id), self.worker_id)
+        await pipeline.execute()
+    
+    async def _announce(self, op: str, targets: Iterable[Tuple[str, str]] = ()) -> None:
+        """Tell the other workers that this worker joined or left targets (or started, for "hello")."""
+        targets = [list(target) for target in targets]
+        if op != "hello" and not targets:
+            return
+        message = json.dumps({"op": op, "targets": targets})
+        await self._redis.publish(PRESENCE_CHANNEL, f"{self.worker_id}{ORIGIN_SEPARATOR}{message}")
+    
+    def _handle_presence(self, origin: str, text: str) -> None:
+        """Update the local view of remote presence from another worker's announcement."""
+        message = json.loads(text)
+        op = message["op"]
+        if op == "hello":
+            self._announce_requested.set()
+            return
+        
+        expires_at = time.monotonic() + self.presence_ttl_seconds
+        for scope, target_id in message["targets"]:
+            target = (scope, target_id)
+            if op == "join":
+                self._remote.setdefault(target, {})[origin] = expires_at
+            elif target in self._remote:
+                self._remote[target].pop(origin, None)
+                if not self._remote[target]:
+                    del self._remote[target]
+    
+    def _prune_remote(self) -> None:
+        """Drop the workers whose announcements expired (e.g. killed without leaving)."""
+        now = time.monotonic()
+        for target, workers in list(self._remote.items()):
+            for worker_id in [worker_id for worker_id, expires_at in workers.items() if expires_at <= now]:
+                del workers[worker_id]
+            if not workers:
+                del self._remote[target]
+    
+    def has_remote_workers(self, scope: str, target_id: str) -> bool:
+        """Check in the local presence view whether another worker holds a user or conversation."""
+        now = time.monotonic()
+        return any(expires_at > now for expires_at in self._remote.get((scope, target_id), {}).values())
+    
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._announce_requested.wait(), self.heartbeat_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._announce_requested.clear()
+            self._prune_remote()
+            try:
+                targets = set(self._subscribed)
+                await self._refresh_presence(targets)
+                await self._announce("join", targets)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Error refreshing WebSocket presence: {str(e)}")
+    
+    async def get_workers(self, scope: str, target_id: str) -> Set[str]:
+        """
+        Get the workers holding connections of a user or conversation.
+        
+        Args:
+            scope: "user" or "conversation"
+            target_id: The user or conversation ID
+        
+        Returns:
+            Set of worker IDs whose heartbeat has not expired
+        """
+        members = await self._redis.zrangebyscore(get_presence_key(scope, target_id), time.time(), "+inf")
+        return {member.decode() if isinstance(member, bytes) else member for member in members}
+    
+    async def is_user_online(self, user_id: str) -> bool:
+        """Check whether a user has a connection on any worker."""
+        if user_id in self.manager.user_connections:
+            return True
+        return bool(await self.get_workers("user", user_id))
+    
+    async def publish(self, text: str, scope: str, target_id: Optional[str] = None) -> None:
+        """
+        Relay an encoded frame to the other workers holding its recipients.
+        
+        Args:
+            text: The frame, already delivered to the local recipients
+            scope: "user", "conversation" or "all"
+            target_id: The user or conversation ID (unused for "all")
+        """
+        try:
+            if scope != "all" and not self.has_remote_workers(scope, target_id):
+                # Every recipient is on this worker
+                self.local_only += 1
+                return
+            await self._redis.publish(get_channel(scope, target_id), f"{self.worker_id}{ORIGIN_SEPARATOR}{text}")
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Error publishing to WebSocket backplane, delivered locally only: {str(e)}")
+    
+    def _handle(self, message: Dict[str, Any]) -> None:
+        """Deliver a frame published by another worker to the local recipients."""
+        channel = message["channel"]
+        data = message["data"]
+        channel = channel.decode() if isinstance(channel, bytes) else channel
+        data = data.decode("utf-8") if isinstance(data, bytes) else data
+        
+        origin, _, text = data.partition(ORIGIN_SEPARATOR)
+        if origin == self.worker_id:
+            return
+        if channel == PRESENCE_CHANNEL:
+            self._handle_presence(origin, text)
+            return
+        
+        _, scope, *target = channel.split(":", 2)
+        self.received += 1
+        self.manager.deliver_local(text, scope, target[0] if target else None)
+    
+    async def _listen(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error reading from WebSocket backplane: {str(e)}")
+                await asyncio.sleep(1.0)
+                continue
+            
+            if message is not None and message.get("type") == "message":
+                try:
+                    self._handle(message)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Error delivering WebSocket backplane message: {str(e)}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get subscription and relay counters.
+        
+        Returns:
+            Dictionary of backplane statistics
+        """
+        return {
+            "worker_id": self.worker_id,
+            "subscriptions": len(self._subscribed),
+            "remote_targets": len(self._remote),
+            "published": self.published,
+            "local_only": self.local_only,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+
+# Create the global backplane of the global connection manager (started when
+# WEBSOCKET_BACKPLANE_ENABLED is set)
+backplane = RedisBackplane(
+    manager,
+    presence_ttl_seconds=settings.WEBSOCKET_PRESENCE_TTL_SECONDS,
+    heartbeat_seconds=settings.WEBSOCKET_HEARTBEAT_SECONDS
+)
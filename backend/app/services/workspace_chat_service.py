@@ -1,8 +1,11 @@
 import logging
-import json
-from typing import List, Dict, Any, Optional, Tuple
-from datetime import datetime
+import time
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, Tuple, AsyncGenerator
+from uuid import uuid4
 
+from app.core.cache import LRUCache
+from app.core.config import settings
 from app.schemas.workspace_chat import (
     ChatMessage, 
     ChatContext, 
@@ -12,14 +15,36 @@ from app.schemas.workspace_chat import (
     CreateConversationRequest
 )
 from app.schemas.business_context import BusinessContext
-from app.services.ai_service import generate_ai_response
-from app.services.context_retrieval_service import (
-    retrieve_similar_contexts,
-    extract_keywords_from_query
-)
+from app.services.ai_service import generate_chat_completion, stream_chat_completion
+from app.services.chunking_service import chunk_business_context
+from app.services.context_retrieval_service import retrieve_similar_chunks
+from app.services.embedding_service import generate_embedding
+from app.services.prompt_assembly import assemble_messages, conversation_summaries
+from app.services.semantic_cache import semantic_cache
 
 logger = logging.getLogger(__name__)
 
+CHAT_SYSTEM_PROMPT = "You are a helpful business assistant. Provide concise, helpful responses."
+
+# Role/content history of each conversation, used to build prompts, keyed by
+# (user ID, conversation ID) since conversation IDs are supplied by clients
+# In a real implementation, we would load the messages from the database
+_conversation_histories = LRUCache(max_entries=settings.CONVERSATION_SUMMARY_MAX_CONVERSATIONS)
+
+
+def _get_history(user_id: str, conversation_id: str) -> List[Dict[str, Any]]:
+    """Get the role/content history of a user's conversation, oldest first."""
+    return _conversation_histories.get((user_id, conversation_id)) or []
+
+
+def _append_turn(user_id: str, conversation_id: str, user_content: str, assistant_content: str) -> None:
+    """Record a question and its answer in the history of a user's conversation."""
+    history = _get_history(user_id, conversation_id) + [
+        {"role": "user", "content": user_content},
+        {"role": "assistant", "content": assistant_content},
+    ]
+    _conversation_histories.set((user_id, conversation_id), history)
+
 
 async def create_conversation(
     request: CreateConversationRequest,
@@ -102,13 +127,13 @@ async def list_conversations(
     return [], 0
 
 
-async def add_message(
+async def _prepare_response(
     request: ChatMessageRequest,
     user_id: str,
-    business_contexts: List[BusinessContext] = []
-) -> ChatMessageResponse:
+    business_contexts: List[BusinessContext]
+) -> Dict[str, Any]:
     """
-    Add a message to a conversation and generate a response.
+    Retrieve the context for a message and look up a cached answer.
     
     Args:
         request: The message request
@@ -116,58 +141,133 @@ async def add_message(
         business_contexts: List of available business contexts for retrieval
     
     Returns:
-        The response message
+        Dictionary with the chat "context", the retrieved "similar_chunks"
+        (chunk, similarity), the prompt "messages" (fitted into
+        CHAT_PROMPT_TOKEN_BUDGET), the "query_embedding" used for the semantic
+        cache (None when the cache is not used) and the "cached" entry on a hit
     """
-    # Create the user message
-    user_message = ChatMessage(
-        content=request.content,
-        sender="user",
-        message_type=request.message_type,
-        metadata=request.metadata
-    )
-    
-    # Extract keywords from the user message
-    keywords = await extract_keywords_from_query(request.content)
+    history = _get_history(user_id, request.conversation_id)
+    summary, _ = conversation_summaries.get(user_id, request.conversation_id)
     
-    # Retrieve relevant business context
+    # Retrieve the business context chunks most relevant to the message
     context = ChatContext()
+    similar_chunks = []
     if business_contexts:
-        similar_contexts = await retrieve_similar_contexts(
+        chunks = [chunk for business_context in business_contexts for chunk in chunk_business_context(business_context)]
+        similar_chunks = await retrieve_similar_chunks(
             query=request.content,
-            contexts=business_contexts,
-            top_k=1,
-            similarity_threshold=0.5
-        )
-        
-        if similar_contexts:
-            context.business_context = similar_contexts[0][0]
-    
-    # Generate AI response
-    system_prompt = "You are a helpful business assistant. Provide concise, helpful responses."
-    
-    # Add business context to the system prompt if available
-    if context.business_context:
-        profile = context.business_context.profile
-        business_info = (
-            f"Business name: {profile.name}\n"
-            f"Type: {profile.type}\n"
-            f"Description: {profile.description}\n"
+            chunks=chunks,
+            top_k=4,
+            similarity_threshold=0.5,
+            scope=user_id
         )
-        if profile.products_services:
-            business_info += f"Products/Services: {', '.join(profile.products_services)}\n"
         
-        system_prompt += f"\n\nBusiness context:\n{business_info}"
+        if similar_chunks:
+            context.context_chunks = [chunk for chunk, _ in similar_chunks]
+            best_business_id = similar_chunks[0][0].business_id
+            context.business_context = next(
+                business_context for business_context in business_contexts
+                if business_context.business_id == best_business_id
+            )
     
-    # Generate the response
-    ai_response_content = await generate_ai_response(
-        messages=[{"role": "user", "content": request.content}],
-        system_prompt=system_prompt
+    # Add only the retrieved chunks (not the whole context) to the system prompt
+    context_block = None
+    if context.context_chunks:
+        business_info = "\n".join(chunk.chunk_text for chunk in context.context_chunks)
+        context_block = f"Business context:\n{business_info}"
+    
+    # Fit the earlier turns into the budget, summarizing the oldest ones
+    messages = assemble_messages(
+        CHAT_SYSTEM_PROMPT,
+        history,
+        settings.CHAT_PROMPT_TOKEN_BUDGET,
+        user_message={"role": "user", "content": request.content},
+        context_block=context_block,
+        conversation_id=request.conversation_id,
+        user_id=user_id
+    )
+    
+    # Reuse the answer to a near-identical question about the same context version.
+    # Follow-ups ("tell me more") depend on the earlier turns, so only the first
+    # message of a conversation is looked up and stored
+    query_embedding = None
+    cached = None
+    if semantic_cache.enabled and context.business_context and not history and not summary:
+        # Already embedded for chunk retrieval, so this is served from the embedding cache
+        query_embedding = await generate_embedding(request.content)
+        if query_embedding:
+            cached = semantic_cache.lookup(
+                context.business_context.business_id,
+                context.business_context.updated_at,
+                query_embedding
+            )
+    
+    if cached:
+        logger.info(f"Semantic cache hit for business {context.business_context.business_id} (similarity {cached['similarity']:.3f})")
+    
+    return {
+        "context": context,
+        "similar_chunks": similar_chunks,
+        "messages": messages,
+        "query_embedding": query_embedding,
+        "cached": cached,
+    }
+
+
+def _cache_response(prepared: Dict[str, Any], request: ChatMessageRequest, completion: Dict[str, Any], latency_ms: float) -> None:
+    """Store a generated response in the semantic cache if the query was embedded for it."""
+    if not prepared["query_embedding"]:
+        return
+    business_context = prepared["context"].business_context
+    semantic_cache.store(
+        business_context.business_id,
+        business_context.updated_at,
+        request.content,
+        prepared["query_embedding"],
+        completion["content"],
+        usage=completion["usage"],
+        latency_ms=latency_ms
     )
+
+
+async def add_message(
+    request: ChatMessageRequest,
+    user_id: str,
+    business_contexts: List[BusinessContext] = []
+) -> ChatMessageResponse:
+    """
+    Add a message to a conversation and generate a response.
+    
+    Args:
+        request: The message request
+        user_id: ID of the user sending the message
+        business_contexts: List of available business contexts for retrieval
+    
+    Returns:
+        The response message
+    """
+    prepared = await _prepare_response(request, user_id, business_contexts)
+    cached = prepared["cached"]
+    
+    if cached:
+        ai_response_content = cached["response"]
+        response_metadata = {"cached": True, "similarity": cached["similarity"]}
+    else:
+        # Generate the response
+        started = time.perf_counter()
+        completion = await generate_chat_completion(messages=prepared["messages"])
+        latency_ms = (time.perf_counter() - started) * 1000
+        ai_response_content = completion["content"]
+        response_metadata = {"cached": False, "usage": completion["usage"]}
+        _cache_response(prepared, request, completion, latency_ms)
+    
+    _append_turn(user_id, request.conversation_id, request.content, ai_response_content)
     
     # Create the assistant message
     assistant_message = ChatMessage(
         content=ai_response_content,
-        sender="assistant"
+        sender="assistant",
+        metadata=response_metadata
     )
     
     # In a real implementation, we would save the messages to the database
@@ -175,10 +275,96 @@ async def add_message(
     
     return ChatMessageResponse(
         message=assistant_message,
-        context=context
+        context=prepared["context"]
     )
 
 
+async def stream_message(
+    request: ChatMessageRequest,
+    user_id: str,
+    business_contexts: List[BusinessContext] = []
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Add a message to a conversation and stream the generated response.
+    
+    Events are yielded in this order:
+    - "retrieval": the retrieved chunks with their similarity
+    - "assistant_delta": response text as it is generated (message_id, sequence, content)
+    - "assistant_done": message_id, whether the answer was cached, token usage and latency
+    
+    Closing the generator early (the client cancelled or disconnected) aborts
+    the upstream completion; the partial response is neither cached nor added
+    to the conversation history.
+    
+    Args:
+        request: The message request
+        user_id: ID of the user sending the message
+        business_contexts: List of available business contexts for retrieval
+    
+    Yields:
+        Event dictionaries with a "type" key
+    """
+    message_id = str(uuid4())
+    started = time.perf_counter()
+    
+    prepared = await _prepare_response(request, user_id, business_contexts)
+    context = prepared["context"]
+    yield {
+        "type": "retrieval",
+        "message_id": message_id,
+        "business_id": context.business_context.business_id if context.business_context else None,
+        "chunks": [
+            {
+                "id": chunk.id,
+                "business_id": chunk.business_id,
+                "source_field": chunk.source_field,
+                "text": chunk.chunk_text,
+                "similarity": round(similarity, 4),
+            }
+            for chunk, similarity in prepared["similar_chunks"]
+        ],
+    }
+    
+    cached = prepared["cached"]
+    if cached:
+        _append_turn(user_id, request.conversation_id, request.content, cached["response"])
+        yield {"type": "assistant_delta", "message_id": message_id, "sequence": 0, "content": cached["response"]}
+        yield {
+            "type": "assistant_done",
+            "message_id": message_id,
+            "cached": True,
+            "similarity": cached["similarity"],
+            "usage": {},
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        return
+    
+    generation_started = time.perf_counter()
+    completion = None
+    sequence = 0
+    # aclosing closes the upstream completion as soon as the consumer stops early
+    async with aclosing(stream_chat_completion(messages=prepared["messages"])) as completion_events:
+        async for event in completion_events:
+            if event["type"] == "delta":
+                yield {"type": "assistant_delta", "message_id": message_id, "sequence": sequence, "content": event["content"]}
+                sequence += 1
+            else:
+                completion = event
+    
+    _cache_response(prepared, request, completion, (time.perf_counter() - generation_started) * 1000)
+    _append_turn(user_id, request.conversation_id, request.content, completion["content"])
+    
+    # In a real implementation, we would save the messages to the database
+    
+    yield {
+        "type": "assistant_done",
+        "message_id": message_id,
+        "cached": False,
+        "usage": completion["usage"],
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
 async def update_conversation_title(
     conversation_id: str,
     title: str,
@@ -216,6 +402,8 @@ async def delete_conversation(
         True if the conversation was deleted, False otherwise
     """
     # In a real implementation, we would delete the conversation from the database
-    # For now, we'll just return True
+    # For now, we'll just drop its prompt history and summary
+    _conversation_histories.delete((user_id, conversation_id))
+    conversation_summaries.clear(user_id, conversation_id)
     
     return True
@@ -1,8 +1,9 @@
 import logging
-from typing import Dict, Any, List
-import httpx
+from typing import Dict, Any, List, Optional
 from app.core.celery_app import celery_app
-from app.core.config import settings
+from app.db.vector_store import search_knowledge_items, update_knowledge_item_embedding
+from app.services.embedding_backfill import run_embedding_backfill
+from app.services.embedding_service import EMBEDDING_MODEL, generate_embedding
 from prisma import Prisma
 
 logger = logging.getLogger(__name__)
@@ -10,7 +11,7 @@ logger = logging.getLogger(__name__)
 @celery_app.task(name="app.tasks.embeddings.generate_embeddings")
 async def generate_embeddings(knowledge_item_id: str) -> Dict[str, Any]:
     """
-    Generate embeddings for a knowledge item using OpenAI's embeddings API.
+    Generate embeddings for a knowledge item with the configured embedding provider.
     
     Args:
         knowledge_item_id: ID of the knowledge item to generate embeddings for
@@ -18,9 +19,10 @@ async def generate_embeddings(knowledge_item_id: str) -> Dict[str, Any]:
     Returns:
         Dict containing status and knowledge_item_id
     """
+    # Initialize Prisma client
+    prisma = Prisma()
+    
     try:
-        # Initialize Prisma client
-        prisma = Prisma()
         await prisma.connect()
         
         # Get the knowledge item
@@ -32,37 +34,18 @@ async def generate_embeddings(knowledge_item_id: str) -> Dict[str, Any]:
             logger.error(f"Knowledge item with ID {knowledge_item_id} not found")
             return {"status": "error", "message": "Knowledge item not found"}
         
-        # Generate embeddings using OpenAI API
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.openai.com/v1/embeddings",
-                headers={
-                    "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "input": knowledge_item.content,
-                    "model": "text-embedding-ada-002"
-                }
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Error generating embeddings: {response.text}")
-                return {"status": "error", "message": "Error generating embeddings"}
-            
-            data = response.json()
-            embedding = data["data"][0]["embedding"]
-            
-            # Update the knowledge item with the embedding
-            # Note: This is a placeholder as the actual implementation would depend on
-            # how vector data is stored in your Supabase database
-            # await prisma.knowledgeitem.update(
-            #     where={"id": knowledge_item_id},
-            #     data={"embedding": embedding}
-            # )
-            
-            logger.info(f"Successfully generated embeddings for knowledge item {knowledge_item_id}")
-            return {"status": "success", "knowledge_item_id": knowledge_item_id}
+        # Generate the embedding with the configured provider (cached and batched)
+        embedding = await generate_embedding(knowledge_item.content)
+        if not embedding:
+            logger.error(f"Error generating embeddings for knowledge item {knowledge_item_id}")
+            return {"status": "error", "message": "Error generating embeddings"}
+        
+        # Update the knowledge item with the embedding (raw SQL, as the
+        # vector column is not supported by the Prisma client)
+        await update_knowledge_item_embedding(prisma, knowledge_item_id, embedding, model=EMBEDDING_MODEL)
+        
+        logger.info(f"Successfully generated embeddings for knowledge item {knowledge_item_id}")
+        return {"status": "success", "knowledge_item_id": knowledge_item_id}
     
     except Exception as e:
         logger.error(f"Error in generate_embeddings task: {str(e)}")
@@ -73,73 +56,58 @@ async def generate_embeddings(knowledge_item_id: str) -> Dict[str, Any]:
             await prisma.disconnect()
 
 @celery_app.task(name="app.tasks.embeddings.search_similar_items")
-async def search_similar_items(query: str, limit: int = 5) -> List[Dict[str, Any]]:
+async def search_similar_items(
+    query: str,
+    limit: int = 5,
+    business_id: Optional[str] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None
+) -> List[Dict[str, Any]]:
     """
     Search for knowledge items similar to the query using vector similarity.
     
     Args:
         query: The search query
         limit: Maximum number of results to return
+        business_id: Optional business ID to restrict the search to
+        ef_search: Optional HNSW ef_search override (recall/latency trade-off)
+        probes: Optional IVFFlat probes override (recall/latency trade-off)
         
     Returns:
-        List of similar knowledge items
+        List of similar knowledge items with similarity scores
     """
+    # Initialize Prisma client
+    prisma = Prisma()
+    
     try:
-        # Initialize Prisma client
-        prisma = Prisma()
         await prisma.connect()
         
-        # Generate embeddings for the query
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.openai.com/v1/embeddings",
-                headers={
-                    "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "input": query,
-                    "model": "text-embedding-ada-002"
-                }
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Error generating query embeddings: {response.text}")
-                return []
-            
-            data = response.json()
-            query_embedding = data["data"][0]["embedding"]
-            
-            # Search for similar items using vector similarity
-            # Note: This is a placeholder as the actual implementation would depend on
-            # how vector similarity search is implemented in your Supabase database
-            # similar_items = await prisma.query_raw(
-            #     """
-            #     SELECT id, title, content, source,
-            #     embedding <-> $1 as similarity
-            #     FROM knowledge_items
-            #     ORDER BY similarity ASC
-            #     LIMIT $2
-            #     """,
-            #     query_embedding,
-            #     limit
-            # )
-            
-            # For now, return a placeholder result
-            similar_items = await prisma.knowledgeitem.find_many(
-                take=limit,
-                order_by={"createdAt": "desc"}
-            )
-            
-            return [
-                {
-                    "id": item.id,
-                    "title": item.title,
-                    "content": item.content,
-                    "source": item.source
-                }
-                for item in similar_items
-            ]
+        # Generate the embedding for the query
+        query_embedding = await generate_embedding(query)
+        if not query_embedding:
+            logger.error("Error generating query embeddings")
+            return []
+        
+        # Search for similar items using the pgvector ANN index
+        similar_items = await search_knowledge_items(
+            prisma,
+            query_embedding,
+            business_id=business_id,
+            limit=limit,
+            ef_search=ef_search,
+            probes=probes
+        )
+        
+        return [
+            {
+                "id": item["id"],
+                "title": item["title"],
+                "content": item["content"],
+                "source": item["source"],
+                "similarity": float(item["similarity"])
+            }
+            for item in similar_items
+        ]
     
     except Exception as e:
         logger.error(f"Error in search_similar_items task: {str(e)}")
@@ -148,3 +116,57 @@ async def search_similar_items(query: str, limit: int = 5) -> List[Dict[str, Any
         # Disconnect Prisma client
         if prisma.is_connected():
             await prisma.disconnect()
+
+
+@celery_app.task(name="app.tasks.embeddings.backfill_embeddings")
+async def backfill_embeddings(
+    target: str = "knowledge_items",
+    only_missing: bool = True,
+    business_id: Optional[str] = None,
+    page_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    checkpoint_path: Optional[str] = None,
+    max_rows: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Generate and store embeddings for all rows of a table in bulk.
+    
+    Args:
+        target: "knowledge_items" or "context_chunks"
+        only_missing: Only embed rows without an embedding (False re-embeds everything)
+        business_id: Optional business ID to restrict the backfill to
+        page_size: Rows read per page
+        concurrency: Maximum concurrent embedding requests
+        checkpoint_path: Optional JSON file used to save and resume progress
+        max_rows: Optional maximum number of rows to process in this run
+        
+    Returns:
+        Dict containing status and backfill statistics
+    """
+    # Initialize Prisma client
+    prisma = Prisma()
+    
+    try:
+        await prisma.connect()
+        
+        stats = await run_embedding_backfill(
+            prisma,
+            target,
+            only_missing=only_missing,
+            business_id=business_id,
+            page_size=page_size,
+            concurrency=concurrency,
+            checkpoint_path=checkpoint_path,
+            max_rows=max_rows
+        )
+        
+        logger.info(f"Backfill of {target} finished: {stats}")
+        return {"status": "success", **stats}
+    
+    except Exception as e:
+        logger.error(f"Error in backfill_embeddings task: {str(e)}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        # Disconnect Prisma client
+        if prisma.is_connected():
+            await prisma.disconnect()
@@ -8,6 +8,8 @@ from app.core.config import settings
 from app.db.init_db import init_db
 from app.db.client import close_db_connection
 from app.core.auth import get_current_user
+from app.services.llm_gateway import llm_gateway
+from app.services.websocket_backplane import backplane
 
 # Configure logging
 logging.basicConfig(
@@ -73,6 +75,11 @@ async def startup_event():
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
+    if settings.WEBSOCKET_BACKPLANE_ENABLED:
+        try:
+            await backplane.start()
+        except Exception as e:
+            logger.error(f"Error starting WebSocket backplane, broadcasts stay local to this worker: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -82,6 +89,8 @@ async def shutdown_event():
         logger.info("Database connections closed successfully")
     except Exception as e:
         logger.error(f"Error closing database connections: {e}")
+    await backplane.stop()
+    await llm_gateway.close()
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
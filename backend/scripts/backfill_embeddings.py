@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Backfill or re-embed stored embeddings in bulk.
+"""
+import asyncio
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.db.client import get_prisma_client, close_db_connection
+from app.services.embedding_backfill import BACKFILL_TARGETS, run_embedding_backfill
+from app.services.embedding_providers import embedding_provider
+from app.core.config import settings
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+
+async def backfill(args):
+    """
+    Run the backfill for each requested target.
+    """
+    if not settings.validate_database_config() or not embedding_provider.is_configured():
+        logger.error("Database or embedding provider configuration is invalid. Check your environment variables.")
+        return False
+    
+    logger.info(f"Embedding with {embedding_provider.name} provider, model {embedding_provider.model_version}")
+
+    targets = BACKFILL_TARGETS if args.target == "all" else [args.target]
+    db = await get_prisma_client()
+    try:
+        for target in targets:
+            stats = await run_embedding_backfill(
+                db,
+                target,
+                only_missing=not args.reembed,
+                business_id=args.business_id,
+                page_size=args.page_size,
+                concurrency=args.concurrency,
+                checkpoint_path=args.checkpoint,
+                restart=args.restart,
+                max_rows=args.max_rows
+            )
+            logger.info(
+                f"{target}: {stats['embedded']} embedded, {stats['failed']} failed, "
+                f"{stats['rows_per_second']} rows/s, {stats['tokens_per_second']} tokens/s"
+            )
+            print(json.dumps(stats))
+    finally:
+        await close_db_connection()
+
+    return True
+
+
+def main():
+    """
+    Main function to parse arguments and run the backfill.
+    """
+    parser = argparse.ArgumentParser(description="Embedding backfill utility")
+    parser.add_argument("--target", choices=[*BACKFILL_TARGETS, "all"], default="all",
+                        help="Table to backfill (default: all)")
+    parser.add_argument("--reembed", action="store_true",
+                        help="Re-embed rows that already have an embedding (e.g. after a model change)")
+    parser.add_argument("--business-id", default=None, help="Only backfill rows of this business")
+    parser.add_argument("--page-size", type=int, default=None,
+                        help="Rows read per page (default: EMBEDDING_BACKFILL_PAGE_SIZE setting)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Concurrent embedding requests (default: EMBEDDING_BACKFILL_CONCURRENCY setting)")
+    parser.add_argument("--checkpoint", default="embedding_backfill_checkpoint.json",
+                        help="Checkpoint file used to resume an interrupted run")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first row")
+    parser.add_argument("--max-rows", type=int, default=None, help="Stop after this many rows")
+
+    args = parser.parse_args()
+
+    success = asyncio.run(backfill(args))
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
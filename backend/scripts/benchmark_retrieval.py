@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""
+Benchmark the context retrieval strategies on a synthetic corpus.
+
+Builds N business contexts (and their chunks) from a fixed vocabulary and
+embeds them with the deterministic local hashing embedding provider, so no
+network access is needed. For every corpus size each strategy is run
+against the same queries and reported with p50/p99 latency, peak traced
+memory and recall@k against brute-force cosine ground truth.
+
+Results are written as JSON so runs can be compared between releases.
+"""
+import asyncio
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path to import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.schemas.business_context import BusinessContext, BusinessProfile
+from app.services import context_retrieval_service
+from app.services.chunking_service import chunk_business_context
+from app.services.context_retrieval_service import (
+    extract_keywords_from_query,
+    retrieve_context_by_keywords,
+    retrieve_similar_chunks,
+    retrieve_similar_contexts,
+    retrieve_similar_contexts_hybrid
+)
+from app.services.embedding_providers import LocalHashingEmbeddingProvider
+from app.services.embedding_service import build_business_context_text
+from app.services.keyword_index import keyword_indexes
+from app.services.vector_index import chunk_indexes, context_indexes
+
+# Industries and the vocabulary their synthetic contexts are drawn from
+TOPICS = {
+    "Bakery": "bread pastry cake sourdough croissant oven flour baking dessert breakfast cafe catering",
+    "Software": "saas platform api cloud developer integration analytics dashboard automation subscription security app",
+    "Consulting": "strategy advisory workshop transformation audit compliance coaching leadership process operations growth",
+    "Fitness": "gym training workout membership coaching nutrition yoga strength cardio wellness classes recovery",
+    "Retail": "store fashion apparel ecommerce inventory checkout discount loyalty shoes accessories boutique brand",
+    "Healthcare": "clinic patient appointment therapy diagnosis telehealth nurse care insurance pharmacy treatment records",
+    "Logistics": "shipping freight warehouse delivery fleet tracking courier routing supply customs pallet dispatch",
+    "Education": "courses tutoring students curriculum online learning exam classroom certification teachers school lessons",
+    "Restaurant": "menu dining chef kitchen reservation takeaway cuisine dishes wine lunch dinner delivery",
+    "RealEstate": "property listings rental mortgage agent housing apartment commercial lease valuation tenants viewing",
+    "Marketing": "campaign seo social advertising content brand influencer email leads conversion funnel agency",
+    "Finance": "accounting bookkeeping tax payroll invoicing audit investment loans budgeting advisory ledger cashflow",
+}
+GENERIC_WORDS = "customers local quality service team small business online growth community market".split()
+
+
+def install_local_embeddings(provider: LocalHashingEmbeddingProvider) -> None:
+    """
+    Replace the embedding calls used by the retrieval service with the local
+    provider (bypassing the embedding cache, so every run embeds from scratch).
+    """
+    async def generate_embedding(text):
+        return provider.embed_text(text)
+
+    async def generate_embeddings_batch(texts):
+        return await provider.embed(texts)
+
+    context_retrieval_service.generate_embedding = generate_embedding
+    context_retrieval_service.generate_embeddings_batch = generate_embeddings_batch
+
+
+def make_corpus(rng: random.Random, size: int) -> list:
+    """
+    Generate business contexts spread over the topic vocabularies.
+    """
+    topics = list(TOPICS)
+    contexts = []
+    for i in range(size):
+        topic = topics[i % len(topics)]
+        words = TOPICS[topic].split()
+        description = " ".join(rng.choice(words if rng.random() < 0.7 else GENERIC_WORDS) for _ in range(30))
+        contexts.append(BusinessContext(
+            business_id=f"b_{i:06d}",
+            profile=BusinessProfile(
+                name=f"{topic} {i}",
+                type=topic,
+                description=description,
+                products_services=rng.sample(words, 3)
+            ),
+            keywords=rng.sample(words, 4),
+            insights={"positioning": " ".join(rng.sample(words + GENERIC_WORDS, 8))}
+        ))
+    return contexts
+
+
+def make_queries(rng: random.Random, count: int) -> list:
+    """
+    Generate queries that mix words of one topic with generic words.
+    """
+    queries = []
+    for _ in range(count):
+        words = TOPICS[rng.choice(list(TOPICS))].split()
+        queries.append(" ".join(rng.sample(words, 3) + rng.sample(GENERIC_WORDS, 1)))
+    return queries
+
+
+def brute_force_top_k(query: str, ids: list, texts: list, top_k: int, provider: LocalHashingEmbeddingProvider) -> set:
+    """
+    Exact cosine top-k over all texts, used as ground truth.
+    """
+    matrix = np.array([provider.embed_text(text) for text in texts], dtype=np.float64)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query_vector = np.array(provider.embed_text(query), dtype=np.float64)
+    query_vector /= max(np.linalg.norm(query_vector), 1e-12)
+    order = np.argsort(-(matrix @ query_vector), kind="stable")[:top_k]
+    return {ids[i] for i in order}
+
+
+def build_strategies(contexts: list, chunks: list, top_k: int) -> dict:
+    """
+    Map strategy names to coroutines returning the retrieved item IDs for a query.
+    """
+    async def vector(query):
+        results = await retrieve_similar_contexts(query, contexts, top_k=top_k, similarity_threshold=0.0, scope="benchmark")
+        return [context.business_id for context, _ in results]
+
+    async def keyword(query):
+        keywords = await extract_keywords_from_query(query)
+        results = await retrieve_context_by_keywords(keywords, contexts, top_k=top_k, scope="benchmark")
+        return [context.business_id for context, _ in results]
+
+    async def hybrid(query):
+        keywords = await extract_keywords_from_query(query)
+        results = await retrieve_similar_contexts_hybrid(query, keywords, contexts, top_k=top_k, scope="benchmark")
+        return [context.business_id for context, _ in results]
+
+    async def hybrid_rrf(query):
+        keywords = await extract_keywords_from_query(query)
+        results = await retrieve_similar_contexts_hybrid(
+            query, keywords, contexts, top_k=top_k, fusion="rrf", scope="benchmark"
+        )
+        return [context.business_id for context, _ in results]
+
+    async def chunk(query):
+        results = await retrieve_similar_chunks(query, chunks, top_k=top_k, similarity_threshold=0.0, scope="benchmark")
+        return [item.id for item, _ in results]
+
+    return {"vector": vector, "keyword": keyword, "hybrid": hybrid, "hybrid_rrf": hybrid_rrf, "chunks": chunk}
+
+
+async def run_size(size: int, args, provider: LocalHashingEmbeddingProvider, skipped: set) -> dict:
+    """
+    Benchmark every strategy on a corpus of the given size.
+    """
+    rng = random.Random(args.seed)
+    contexts = make_corpus(rng, size)
+    chunks = [chunk for context in contexts for chunk in chunk_business_context(context)]
+    queries = make_queries(rng, args.queries)
+
+    context_ids = [context.business_id for context in contexts]
+    context_texts = [build_business_context_text(context.model_dump()) for context in contexts]
+    chunk_ids = [chunk.id for chunk in chunks]
+    chunk_texts = [chunk.chunk_text for chunk in chunks]
+    truth = {
+        "contexts": [brute_force_top_k(query, context_ids, context_texts, args.top_k, provider) for query in queries],
+        "chunks": [brute_force_top_k(query, chunk_ids, chunk_texts, args.top_k, provider) for query in queries],
+    }
+
+    context_indexes.drop("benchmark")
+    chunk_indexes.drop("benchmark")
+    keyword_indexes.drop("benchmark")
+    results = {"size": size, "chunks": len(chunks), "strategies": {}}
+
+    for name, strategy in build_strategies(contexts, chunks, args.top_k).items():
+        if name in skipped:
+            results["strategies"][name] = {"skipped": True}
+            continue
+
+        # The first query builds any persistent index; report it separately
+        started = time.perf_counter()
+        await strategy(queries[0])
+        warmup_ms = (time.perf_counter() - started) * 1000
+
+        latencies = []
+        hits = 0
+        expected_sets = truth["chunks" if name == "chunks" else "contexts"]
+        for query, expected in zip(queries, expected_sets):
+            started = time.perf_counter()
+            found = await strategy(query)
+            latencies.append(time.perf_counter() - started)
+            hits += len(expected & set(found[:args.top_k]))
+
+        tracemalloc.start()
+        await strategy(queries[-1])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        total_seconds = sum(latencies)
+        if total_seconds > args.max_strategy_seconds:
+            skipped.add(name)
+
+        results["strategies"][name] = {
+            "warmup_ms": round(warmup_ms, 3),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+            "peak_memory_kb": round(peak / 1024, 1),
+            f"recall@{args.top_k}": round(hits / (len(queries) * min(args.top_k, len(expected_sets[0]) or 1)), 4),
+        }
+
+    results["index_bytes"] = {
+        "contexts": context_indexes.stats()["bytes"],
+        "chunks": chunk_indexes.stats()["bytes"],
+    }
+    return results
+
+
+async def benchmark(args) -> dict:
+    """
+    Run all corpus sizes and collect the results.
+    """
+    provider = LocalHashingEmbeddingProvider(dimension=args.dimension)
+    install_local_embeddings(provider)
+    skipped: set = set()
+    runs = []
+    for size in args.sizes:
+        run = await run_size(size, args, provider, skipped)
+        runs.append(run)
+        print_run(run, args.top_k)
+    return {
+        "benchmark": "context_retrieval",
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "parameters": {
+            "sizes": args.sizes,
+            "queries": args.queries,
+            "top_k": args.top_k,
+            "dimension": args.dimension,
+            "embedding_model": provider.model_version,
+            "seed": args.seed,
+        },
+        "runs": runs,
+    }
+
+
+def print_run(run: dict, top_k: int) -> None:
+    """
+    Print one corpus size as a table.
+    """
+    print(f"\nN={run['size']} contexts ({run['chunks']} chunks)", file=sys.stderr)
+    columns = ["warmup_ms", "p50_ms", "p99_ms", "peak_memory_kb", f"recall@{top_k}"]
+    print(f"{'strategy':<12}" + "".join(f"{column:>16}" for column in columns), file=sys.stderr)
+    for name, row in run["strategies"].items():
+        if row.get("skipped"):
+            print(f"{name:<12}{'skipped (too slow at a smaller N)':>32}", file=sys.stderr)
+            continue
+        print(f"{name:<12}" + "".join(f"{row[column]:>16}" for column in columns), file=sys.stderr)
+
+
+def main():
+    """
+    Parse arguments, run the benchmark and write the JSON results.
+    """
+    parser = argparse.ArgumentParser(description="Context retrieval benchmark")
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=[10, 100, 1000, 10000, 100000],
+                        help="Comma-separated corpus sizes (default: 10,100,1000,10000,100000)")
+    parser.add_argument("--queries", type=int, default=20, help="Queries per strategy and size (default: 20)")
+    parser.add_argument("--top-k", type=int, default=5, help="Results per query (default: 5)")
+    parser.add_argument("--dimension", type=int, default=256, help="Local embedding dimension (default: 256)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument("--max-strategy-seconds", type=float, default=60.0,
+                        help="Skip a strategy at larger sizes once its queries take longer than this (default: 60)")
+    parser.add_argument("--output", default=None, help="Write JSON results to this file (default: stdout)")
+
+    args = parser.parse_args()
+    results = asyncio.run(benchmark(args))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+        print(f"\nResults written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Benchmark memory, latency and recall of quantized in-memory vector indexes.
+
+Builds float32, float16 and int8 indexes over the same synthetic clustered
+embeddings and compares top-k results against exact float32 search, with and
+without rescoring the candidates on full-precision vectors. In the app those
+vectors come from the embedding store, so they are not part of the index size.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path to import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.services.vector_index import VectorIndex, VECTOR_PRECISIONS, rescore
+
+
+def make_corpus(rng, size: int, dimension: int, clusters: int) -> np.ndarray:
+    """
+    Generate clustered embeddings (real embeddings are far from uniformly spread).
+    """
+    centers = rng.normal(size=(clusters, dimension))
+    assignments = rng.integers(0, clusters, size=size)
+    return (centers[assignments] + 0.35 * rng.normal(size=(size, dimension))).astype(np.float32)
+
+
+def percentile_ms(samples, percentile: float) -> float:
+    return float(np.percentile(samples, percentile) * 1000)
+
+
+def benchmark(args) -> dict:
+    """
+    Run the benchmark and collect results per precision.
+    """
+    rng = np.random.default_rng(args.seed)
+    vectors = make_corpus(rng, args.size, args.dimension, args.clusters)
+    queries = make_corpus(rng, args.queries, args.dimension, args.clusters)
+    ids = [f"item_{i}" for i in range(args.size)]
+    positions = {item_id: i for i, item_id in enumerate(ids)}
+
+    exact = VectorIndex(dimension=args.dimension, initial_capacity=args.size)
+    exact.add_many(ids, vectors)
+    truth = [{item_id for item_id, _ in exact.search(query, args.top_k)} for query in queries]
+
+    results = {}
+    for precision in VECTOR_PRECISIONS:
+        index = VectorIndex(dimension=args.dimension, initial_capacity=args.size, precision=precision)
+        index.add_many(ids, vectors)
+
+        modes = {"approximate": False}
+        if precision != "float32":
+            modes["rescored"] = True
+
+        for mode, rescored in modes.items():
+            latencies = []
+            hits = 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                if rescored:
+                    candidates = index.search(query, args.top_k * args.rescore_factor)
+                    found = rescore(
+                        query,
+                        candidates,
+                        [vectors[positions[item_id]] for item_id, _ in candidates],
+                        args.top_k
+                    )
+                else:
+                    found = index.search(query, args.top_k)
+                latencies.append(time.perf_counter() - start)
+                hits += len(expected & {item_id for item_id, _ in found})
+
+            results[f"{precision}/{mode}"] = {
+                "index_mb": round(index.nbytes / 1024 / 1024, 2),
+                "p50_ms": round(percentile_ms(latencies, 50), 3),
+                "p99_ms": round(percentile_ms(latencies, 99), 3),
+                f"recall@{args.top_k}": round(hits / (len(queries) * args.top_k), 4),
+            }
+
+    return results
+
+
+def main():
+    """
+    Parse arguments, run the benchmark and print the results.
+    """
+    parser = argparse.ArgumentParser(description="Vector index quantization benchmark")
+    parser.add_argument("--size", type=int, default=20000, help="Number of indexed vectors (default: 20000)")
+    parser.add_argument("--dimension", type=int, default=1536, help="Embedding dimension (default: 1536)")
+    parser.add_argument("--clusters", type=int, default=50, help="Number of synthetic topic clusters (default: 50)")
+    parser.add_argument("--queries", type=int, default=100, help="Number of queries (default: 100)")
+    parser.add_argument("--top-k", type=int, default=10, help="Results per query (default: 10)")
+    parser.add_argument("--rescore-factor", type=int, default=4,
+                        help="Candidates fetched per result before rescoring (default: 4)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    args = parser.parse_args()
+    results = benchmark(args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{args.size} vectors x {args.dimension} dims, {args.queries} queries, top_k={args.top_k}")
+    columns = list(next(iter(results.values())).keys())
+    print(f"{'index':<22}" + "".join(f"{column:>14}" for column in columns))
+    for name, row in results.items():
+        print(f"{name:<22}" + "".join(f"{row[column]:>14}" for column in columns))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+Benchmark connection churn in the WebSocket connection manager.
+
+Fills the manager with N live connections spread over users and
+conversations, then measures connect, join, leave and disconnect latency
+while connections come and go (as in a reconnect storm after a deploy).
+The same churn is run against a copy of the previous list-based
+bookkeeping, whose disconnect scanned every user and conversation, at a
+smaller N for comparison.
+
+A second benchmark broadcasts an onboarding message to every member of a
+large conversation, comparing the serialize-once fan-out with encoding
+the payload per recipient using the standard library encoder.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Add parent directory to path to import app modules
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.core.json import JSON_BACKEND, CustomJSONEncoder
+from app.schemas.onboarding import MessageOption, OnboardingMessage
+from app.services.websocket import ConnectionManager
+
+
+class FakeWebSocket:
+    """WebSocket stand-in that accepts and sends without I/O."""
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        pass
+
+
+class ListConnectionManager:
+    """
+    The previous bookkeeping: lists per user and conversation, scanned on disconnect.
+    """
+    def __init__(self):
+        self.active_connections: Dict[str, FakeWebSocket] = {}
+        self.user_connections: Dict[str, List[str]] = {}
+        self.conversation_connections: Dict[str, List[str]] = {}
+        self._next_id = 0
+
+    async def connect(self, websocket, user_id: str, conversation_id: Optional[str] = None) -> str:
+        await websocket.accept()
+        self._next_id += 1
+        connection_id = f"conn_{self._next_id}"
+        self.active_connections[connection_id] = websocket
+        self.user_connections.setdefault(user_id, []).append(connection_id)
+        if conversation_id:
+            self.conversation_connections.setdefault(conversation_id, []).append(connection_id)
+        return connection_id
+
+    def join_conversation(self, connection_id: str, conversation_id: str) -> bool:
+        connections = self.conversation_connections.setdefault(conversation_id, [])
+        if connection_id in connections:
+            return False
+        connections.append(connection_id)
+        return True
+
+    def leave_conversation(self, connection_id: str, conversation_id: str) -> bool:
+        connections = self.conversation_connections.get(conversation_id, [])
+        if connection_id not in connections:
+            return False
+        connections.remove(connection_id)
+        return True
+
+    def disconnect(self, connection_id: str):
+        if connection_id not in self.active_connections:
+            return
+        del self.active_connections[connection_id]
+        for user_id, connections in list(self.user_connections.items()):
+            if connection_id in connections:
+                connections.remove(connection_id)
+                if not connections:
+                    del self.user_connections[user_id]
+        for conversation_id, connections in list(self.conversation_connections.items()):
+            if connection_id in connections:
+                connections.remove(connection_id)
+                if not connections:
+                    del self.conversation_connections[conversation_id]
+
+
+def percentile_us(samples, percentile: float) -> float:
+    return float(np.percentile(samples, percentile) * 1_000_000)
+
+
+async def run_churn(manager, args, connections: int, rng: random.Random) -> dict:
+    """
+    Fill a manager with live connections, then churn them.
+    """
+    websocket = FakeWebSocket()
+    users = max(1, connections // args.connections_per_user)
+    conversations = max(1, connections // args.connections_per_conversation)
+
+    def random_user():
+        return f"user_{rng.randrange(users)}"
+
+    def random_conversation():
+        return f"conv_{rng.randrange(conversations)}"
+
+    live = [await manager.connect(websocket, random_user(), random_conversation()) for _ in range(connections)]
+
+    timings = {"connect": [], "join": [], "leave": [], "disconnect": []}
+    started = time.perf_counter()
+    for _ in range(args.operations):
+        # Drop a random connection and replace it, as clients reconnecting do
+        position = rng.randrange(len(live))
+        connection_id = live[position]
+
+        extra = random_conversation()
+        start = time.perf_counter()
+        manager.join_conversation(connection_id, extra)
+        timings["join"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        manager.leave_conversation(connection_id, extra)
+        timings["leave"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        manager.disconnect(connection_id)
+        timings["disconnect"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        live[position] = await manager.connect(websocket, random_user(), random_conversation())
+        timings["connect"].append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+
+    result = {"connections": connections, "churn_per_second": round(args.operations / elapsed)}
+    for operation, samples in timings.items():
+        result[f"{operation}_p50_us"] = round(percentile_us(samples, 50), 2)
+        result[f"{operation}_p99_us"] = round(percentile_us(samples, 99), 2)
+    return result
+
+
+async def run_fanout(args) -> dict:
+    """
+    Time broadcasts to one conversation with many members.
+    """
+    manager = ConnectionManager(send_queue_size=args.fanout_messages + 1)
+    websocket = FakeWebSocket()
+    connection_ids = [
+        await manager.connect(websocket, f"user_{i}", "conv_fanout") for i in range(args.fanout_recipients)
+    ]
+    message = OnboardingMessage(
+        id="msg_1",
+        content="What type of business do you have?",
+        sender="assistant",
+        timestamp=datetime.utcnow(),
+        messageType="options",
+        options=[MessageOption(id="business_type", text=text, value=text.lower()) for text in
+                 ("Retail", "Service", "Manufacturing", "Technology", "Other")]
+    )
+
+    async def per_recipient():
+        # The previous path: .dict() by the caller, then one stdlib encode per recipient
+        payload = {"type": "assistant_message", "message": message.model_dump()}
+        for connection_id in connection_ids:
+            manager._enqueue(json.dumps(payload, cls=CustomJSONEncoder), connection_id)
+
+    async def serialize_once():
+        await manager.broadcast_to_conversation({"type": "assistant_message", "message": message}, "conv_fanout")
+
+    results = {}
+    for name, broadcast in (("per_recipient", per_recipient), ("serialize_once", serialize_once)):
+        latencies = []
+        for _ in range(args.fanout_messages):
+            start = time.perf_counter()
+            await broadcast()
+            latencies.append(time.perf_counter() - start)
+            # Let the writers empty the queues outside the measurement
+            await asyncio.gather(*[manager.drain(connection_id) for connection_id in connection_ids])
+        results[name] = {
+            "recipients": args.fanout_recipients,
+            "p50_ms": round(float(np.percentile(latencies, 50) * 1000), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99) * 1000), 3),
+        }
+    results["serialize_once"]["json_backend"] = JSON_BACKEND
+    return results
+
+
+async def benchmark(args) -> dict:
+    """
+    Run the churn benchmark for both managers.
+    """
+    # Keep per-connection logging out of the measurements
+    import logging
+    logging.getLogger("app.services.websocket").setLevel(logging.WARNING)
+
+    results = {
+        "indexed": await run_churn(ConnectionManager(), args, args.connections, random.Random(args.seed)),
+    }
+    if args.list_connections:
+        results["list"] = await run_churn(ListConnectionManager(), args, args.list_connections, random.Random(args.seed))
+    if args.fanout_recipients:
+        results["fanout"] = await run_fanout(args)
+    return results
+
+
+def main():
+    """
+    Parse arguments, run the benchmark and print the results.
+    """
+    parser = argparse.ArgumentParser(description="WebSocket connection manager churn benchmark")
+    parser.add_argument("--connections", type=int, default=100000, help="Live connections (default: 100000)")
+    parser.add_argument("--list-connections", type=int, default=10000,
+                        help="Live connections for the list-based baseline, 0 to skip (default: 10000)")
+    parser.add_argument("--operations", type=int, default=2000,
+                        help="Disconnect/reconnect cycles to time (default: 2000)")
+    parser.add_argument("--connections-per-user", type=int, default=2, help="Average connections per user (default: 2)")
+    parser.add_argument("--connections-per-conversation", type=int, default=4,
+                        help="Average connections per conversation (default: 4)")
+    parser.add_argument("--fanout-recipients", type=int, default=1000,
+                        help="Members of the broadcast conversation, 0 to skip (default: 1000)")
+    parser.add_argument("--fanout-messages", type=int, default=100, help="Broadcasts to time (default: 100)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    args = parser.parse_args()
+    results = asyncio.run(benchmark(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    fanout = results.pop("fanout", None)
+    columns = list(next(iter(results.values())).keys())
+    print(f"{'manager':<10}" + "".join(f"{column:>18}" for column in columns))
+    for name, row in results.items():
+        print(f"{name:<10}" + "".join(f"{row[column]:>18}" for column in columns))
+
+    if fanout:
+        print(f"\nBroadcast to {args.fanout_recipients} recipients (JSON backend: {JSON_BACKEND})")
+        for name, row in fanout.items():
+            print(f"{name:<16}{row['p50_ms']:>12} ms p50{row['p99_ms']:>12} ms p99")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
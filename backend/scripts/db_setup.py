@@ -13,7 +13,12 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from app.db.init_db import init_db, generate_prisma_client
-from app.db.migrations import run_prisma_migration, apply_pending_migrations, reset_database
+from app.db.migrations import (
+    run_prisma_migration,
+    apply_pending_migrations,
+    reset_database,
+    apply_vector_index_migration
+)
 from app.core.config import settings
 
 # Configure logging
@@ -67,6 +72,17 @@ async def setup_database(args):
             return False
         logger.info("Pending migrations applied successfully")
 
+    # Create or switch pgvector ANN indexes
+    if args.vector_indexes or args.all:
+        if not await apply_vector_index_migration(
+            args.vector_index_method,
+            args.rebuild_vector_indexes,
+            args.vector_index_quantization
+        ):
+            logger.error("Failed to apply vector index migration")
+            return False
+        logger.info("Vector indexes applied successfully")
+
     # Initialize database
     if args.init or args.all:
         if not await init_db():
@@ -89,11 +105,18 @@ def main():
     parser.add_argument("--init", action="store_true", help="Initialize database")
     parser.add_argument("--reset", action="store_true", help="Reset database (DEVELOPMENT ONLY)")
     parser.add_argument("--name", default="initial", help="Migration name (default: initial)")
+    parser.add_argument("--vector-indexes", action="store_true", help="Create pgvector ANN indexes")
+    parser.add_argument("--vector-index-method", choices=["hnsw", "ivfflat"], default=None,
+                        help="Vector index method (default: VECTOR_INDEX_METHOD setting)")
+    parser.add_argument("--vector-index-quantization", choices=["none", "halfvec"], default=None,
+                        help="Index a half-precision copy of the vectors (default: VECTOR_INDEX_QUANTIZATION setting)")
+    parser.add_argument("--rebuild-vector-indexes", action="store_true",
+                        help="Drop and recreate vector indexes (e.g. after a bulk load)")
     
     args = parser.parse_args()
     
     # If no arguments provided, show help
-    if not any([args.all, args.generate, args.migrate, args.deploy, args.init, args.reset]):
+    if not any([args.all, args.generate, args.migrate, args.deploy, args.init, args.reset, args.vector_indexes]):
         parser.print_help()
         return 1
     
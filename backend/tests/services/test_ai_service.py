@@ -0,0 +1,138 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.schemas.onboarding import OnboardingMessage, OnboardingState
+from app.services import ai_service
+from app.services.ai_service import (
+    extract_partial_json_string,
+    generate_fallback_response,
+    parse_onboarding_step_policies,
+    personalize_onboarding_message,
+    stream_onboarding_response,
+)
+
+
+def _chunk(content=None, name=None, arguments=None):
+    """Create a streamed chat completion chunk."""
+    function_call = SimpleNamespace(name=name, arguments=arguments) if name or arguments else None
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, function_call=function_call))])
+
+
+def _user_message():
+    return OnboardingMessage(id="u1", content="We run a bakery", sender="user", messageType="text")
+
+
+class FakeGateway:
+    """Gateway that streams prepared chunks, optionally failing part way."""
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+    
+    def is_available(self):
+        return True
+    
+    async def chat_completion_stream(self, **kwargs):
+        for chunk in self.chunks:
+            yield chunk
+        if self.error:
+            raise self.error
+
+
+def test_extract_partial_json_string():
+    """Test decoding a string field from cut-off JSON."""
+    assert extract_partial_json_string('{"mess', "message") == ""
+    assert extract_partial_json_string('{"message": "Caf', "message") == "Caf"
+    assert extract_partial_json_string('{"message": "Caf\\u00', "message") == "Caf"
+    assert extract_partial_json_string('{"message": "Caf\\u00e9 \\"x\\"", "options": [', "message") == 'Café "x"'
+
+
+@pytest.mark.asyncio
+async def test_stream_function_call_response(monkeypatch):
+    """Test that the message argument is streamed and the structured message comes last."""
+    arguments = json.dumps({
+        "message": "What type of business do you have?",
+        "options": [{"text": "Retail", "value": "retail"}, {"text": "Service", "value": "service"}]
+    })
+    chunks = [_chunk(name="provide_business_type_options", arguments="")]
+    chunks += [_chunk(arguments=arguments[i:i + 7]) for i in range(0, len(arguments), 7)]
+    monkeypatch.setattr(ai_service, "llm_gateway", FakeGateway(chunks))
+    monkeypatch.setattr(ai_service.settings, "OPENAI_API_KEY", "sk-test")
+    
+    events = [event async for event in stream_onboarding_response(_user_message(), OnboardingState(currentStep=2))]
+    deltas = [event for event in events if event["type"] == "delta"]
+    message = events[-1]["message"]
+    
+    assert "".join(delta["content"] for delta in deltas) == "What type of business do you have?"
+    assert [delta["sequence"] for delta in deltas] == list(range(len(deltas)))
+    assert events[-1]["type"] == "message"
+    assert message.id == deltas[0]["id"]
+    assert message.messageType == "options"
+    assert [option.value for option in message.options] == ["retail", "service"]
+
+
+@pytest.mark.asyncio
+async def test_stream_failure_ends_with_fallback_message(monkeypatch):
+    """Test that a stream failing part way still ends with a complete message."""
+    chunks = [_chunk(content="Great, "), _chunk(content="what is")]
+    monkeypatch.setattr(ai_service, "llm_gateway", FakeGateway(chunks, error=RuntimeError("connection reset")))
+    monkeypatch.setattr(ai_service.settings, "OPENAI_API_KEY", "sk-test")
+    
+    events = [event async for event in stream_onboarding_response(_user_message(), OnboardingState(currentStep=1))]
+    
+    assert [event["type"] for event in events] == ["delta", "delta", "message"]
+    assert events[-1]["message"].id == events[0]["id"]
+    assert "name of your business" in events[-1]["message"].content
+
+
+def test_parse_onboarding_step_policies():
+    """Test that valid step policies are parsed and invalid ones skipped."""
+    policies = parse_onboarding_step_policies("1:llm, 2:template_then_llm,3:fast,x:template,5:template,")
+    assert policies == {1: "llm", 2: "template_then_llm", 5: "template"}
+
+
+@pytest.mark.asyncio
+async def test_personalized_message_keeps_template_id(monkeypatch):
+    """Test that a personalized message of the same kind replaces the template under its id."""
+    template = await generate_fallback_response(_user_message(), OnboardingState(currentStep=2))
+    
+    async def mock_generate_ai_response(user_message, conversation_history, current_step, conversation_id=None):
+        return ai_service.create_message_from_function_call("provide_business_type_options", {
+            "message": "What kind of bakery is it?",
+            "options": [{"text": "Retail bakery", "value": "retail"}, {"text": "Wholesale", "value": "manufacturing"}]
+        })
+    
+    monkeypatch.setattr(ai_service, "generate_ai_response", mock_generate_ai_response)
+    monkeypatch.setattr(ai_service.settings, "OPENAI_API_KEY", "sk-test")
+    
+    message = await personalize_onboarding_message(template, _user_message(), [], 2)
+    assert message.id == template.id
+    assert message.content == "What kind of bakery is it?"
+    assert [option.text for option in message.options] == ["Retail bakery", "Wholesale"]
+
+
+@pytest.mark.asyncio
+async def test_personalization_keeps_template_structure_or_gives_up(monkeypatch):
+    """Test that a plain text reply only rewords the template and a failure yields no patch."""
+    template = await generate_fallback_response(_user_message(), OnboardingState(currentStep=3))
+    replies = [
+        ai_service.create_message_from_function_call("unknown", {}).model_copy(update={"content": "Tell me about the bakery:"}),
+        RuntimeError("provider down"),
+    ]
+    
+    async def mock_generate_ai_response(user_message, conversation_history, current_step, conversation_id=None):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+    
+    monkeypatch.setattr(ai_service, "generate_ai_response", mock_generate_ai_response)
+    monkeypatch.setattr(ai_service.settings, "OPENAI_API_KEY", "sk-test")
+    
+    message = await personalize_onboarding_message(template, _user_message(), [], 3)
+    assert message.content == "Tell me about the bakery:"
+    assert message.messageType == "form"
+    assert message.formInputs == template.formInputs
+    
+    assert await personalize_onboarding_message(template, _user_message(), [], 3) is None
@@ -0,0 +1,56 @@
+import pytest
+
+from app.core.cache import LRUCache
+from app.schemas.business_context import BusinessContext, BusinessProfile
+from app.services import business_context_service
+from app.services.business_context_service import refresh_business_context_indexes
+from app.services.vector_index import context_indexes
+
+
+@pytest.fixture
+def embedding_calls(monkeypatch):
+    """Record context embedding and chunk indexing calls."""
+    calls = {"context": 0, "chunks": 0}
+    
+    async def mock_generate_business_context_embedding(context):
+        calls["context"] += 1
+        return [1.0, 0.0]
+    
+    async def mock_index_business_context_chunks(context):
+        calls["chunks"] += 1
+        return []
+    
+    monkeypatch.setattr(
+        business_context_service, "async_generate_business_context_embedding", mock_generate_business_context_embedding
+    )
+    monkeypatch.setattr(business_context_service, "index_business_context_chunks", mock_index_business_context_chunks)
+    monkeypatch.setattr(business_context_service, "_embedded_text_hashes", LRUCache())
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_refresh_skips_unchanged_embedded_fields(embedding_calls):
+    """Test that the context is only re-embedded when embedded fields change."""
+    context = BusinessContext(
+        business_id="b_refresh",
+        profile=BusinessProfile(name="Sweet Treats", type="Bakery")
+    )
+    context_indexes.get("u_refresh").add("b_refresh", [1.0, 0.0], version="old")
+    
+    assert await refresh_business_context_indexes(context)
+    assert embedding_calls["context"] == 1
+    
+    # employees is not part of the embedded text
+    context.profile.employees = 12
+    context.updated_at = context.updated_at.replace(year=2030)
+    assert await refresh_business_context_indexes(context)
+    assert embedding_calls["context"] == 1
+    assert context_indexes.get("u_refresh").version("b_refresh") == context.updated_at.isoformat()
+    
+    context.profile.description = "Artisan sourdough and pastries"
+    assert await refresh_business_context_indexes(context)
+    assert embedding_calls["context"] == 2
+    
+    # Chunk indexing runs every time; it does its own change detection
+    assert embedding_calls["chunks"] == 3
+    context_indexes.drop("u_refresh")
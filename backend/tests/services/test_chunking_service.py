@@ -0,0 +1,178 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.tokenizer import encode
+from app.schemas.business_context import BusinessContext, BusinessProfile
+from app.services import chunking_service, context_retrieval_service
+from app.services.chunking_service import (
+    chunk_business_context,
+    chunk_text,
+    embed_chunks,
+    forget_business_context_chunks,
+    index_business_context_chunks
+)
+from app.services.context_retrieval_service import retrieve_similar_chunks
+
+
+@pytest.fixture
+def context():
+    """Create a business context with a long description."""
+    return BusinessContext(
+        business_id="b_bakery",
+        profile=BusinessProfile(
+            name="Sweet Treats",
+            type="Bakery",
+            description=" ".join(f"We bake fresh bread number {i} every morning." for i in range(60)),
+            products_services=["Bread", "Cakes"]
+        ),
+        keywords=["bakery", "bread"],
+        insights={"market_position": "Local favourite"}
+    )
+
+
+def test_chunk_text_respects_token_limit_and_overlap():
+    """Test that chunks stay within the token limit and consecutive chunks overlap."""
+    text = " ".join(f"word{i}" for i in range(100))
+    
+    chunks = chunk_text(text, max_tokens=20, overlap_tokens=5)
+    
+    assert len(chunks) > 1
+    assert all(len(encode(chunk)) <= 20 for chunk in chunks)
+    assert chunks[0].startswith("word0")
+    assert chunks[-1].endswith("word99")
+    # The tail of each chunk is repeated at the head of the next one
+    assert chunks[0].split()[-1] in chunks[1].split()[:5]
+
+
+def test_chunk_text_short_and_blank_text():
+    """Test that short text is one chunk and blank text yields none."""
+    assert chunk_text("A small bakery.", max_tokens=20, overlap_tokens=5) == ["A small bakery."]
+    assert chunk_text("   ", max_tokens=20, overlap_tokens=5) == []
+    
+    with pytest.raises(ValueError):
+        chunk_text("text", max_tokens=10, overlap_tokens=10)
+
+
+def test_chunk_business_context_records_provenance(context):
+    """Test that chunks carry their source field, position and a stable ID."""
+    chunks = chunk_business_context(context, max_tokens=50, overlap_tokens=10)
+    
+    sources = [chunk.source_field for chunk in chunks]
+    assert sources[0] == "profile"
+    assert "profile.products_services" in sources
+    assert "keywords" in sources
+    assert "insights.market_position" in sources
+    
+    description_chunks = [chunk for chunk in chunks if chunk.source_field == "profile.description"]
+    assert len(description_chunks) > 1
+    assert [chunk.chunk_index for chunk in description_chunks] == list(range(len(description_chunks)))
+    assert all(chunk.business_id == "b_bakery" for chunk in chunks)
+    assert all(0 < chunk.token_count <= 50 for chunk in chunks)
+    
+    # Re-chunking unchanged content produces the same IDs
+    again = chunk_business_context(context, max_tokens=50, overlap_tokens=10)
+    assert [chunk.id for chunk in again] == [chunk.id for chunk in chunks]
+
+
+@pytest.mark.asyncio
+async def test_embed_chunks_uses_one_batch(monkeypatch, context):
+    """Test that chunks are embedded in a single batched call."""
+    batches = []
+    
+    async def mock_generate_embeddings_batch(texts):
+        batches.append(texts)
+        return [[1.0, 0.0] for _ in texts]
+    
+    monkeypatch.setattr(chunking_service, "generate_embeddings_batch", mock_generate_embeddings_batch)
+    
+    chunks = chunk_business_context(context, max_tokens=50, overlap_tokens=10)
+    embeddings = await embed_chunks(chunks)
+    
+    assert len(batches) == 1
+    assert len(embeddings) == len(chunks)
+
+
+@pytest.mark.asyncio
+async def test_retrieve_similar_chunks(monkeypatch, context):
+    """Test that retrieval returns the best-matching chunks and reuses a scoped index."""
+    batches = []
+    
+    def embed(text):
+        return [1.0, 0.0] if "insights" in text.lower() or "favourite" in text.lower() else [0.0, 1.0]
+    
+    async def mock_generate_embedding(text):
+        return embed(text)
+    
+    async def mock_generate_embeddings_batch(texts):
+        batches.append(texts)
+        return [embed(text) for text in texts]
+    
+    monkeypatch.setattr(context_retrieval_service, "generate_embedding", mock_generate_embedding)
+    monkeypatch.setattr(context_retrieval_service, "generate_embeddings_batch", mock_generate_embeddings_batch)
+    
+    chunks = chunk_business_context(context, max_tokens=50, overlap_tokens=10)
+    results = await retrieve_similar_chunks(
+        "Who is the local favourite?", chunks, top_k=2, similarity_threshold=0.9, scope="u_chunks"
+    )
+    
+    assert [chunk.source_field for chunk, _ in results] == ["insights.market_position"]
+    
+    await retrieve_similar_chunks("favourite", chunks, top_k=2, scope="u_chunks")
+    assert len(batches) == 1
+
+
+@pytest.fixture
+def chunk_store(monkeypatch):
+    """Replace the database layer with an in-memory record of chunk writes."""
+    calls = []
+    
+    async def get_prisma_client():
+        return None
+    
+    async def replace_business_context_chunks(db, business_id, chunks, embeddings, model=None):
+        calls.append(("replace", [chunk.id for chunk in chunks], []))
+        return len(chunks)
+    
+    async def apply_business_context_chunk_changes(db, business_id, added_chunks, embeddings, removed_chunk_ids, model=None):
+        calls.append(("apply", [chunk.id for chunk in added_chunks], list(removed_chunk_ids)))
+        return len(added_chunks) + len(removed_chunk_ids)
+    
+    monkeypatch.setitem(sys.modules, "app.db.client", SimpleNamespace(get_prisma_client=get_prisma_client))
+    monkeypatch.setitem(sys.modules, "app.db.vector_store", SimpleNamespace(
+        replace_business_context_chunks=replace_business_context_chunks,
+        apply_business_context_chunk_changes=apply_business_context_chunk_changes
+    ))
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_index_only_embeds_changed_chunks(monkeypatch, context, chunk_store):
+    """Test that re-indexing embeds only changed chunks and skips unchanged contexts."""
+    embedded = []
+    
+    async def mock_generate_embeddings_batch(texts):
+        embedded.append(texts)
+        return [[1.0, 0.0] for _ in texts]
+    
+    monkeypatch.setattr(chunking_service, "generate_embeddings_batch", mock_generate_embeddings_batch)
+    
+    chunks = await index_business_context_chunks(context)
+    assert chunk_store[0] == ("replace", [chunk.id for chunk in chunks], [])
+    
+    # Nothing changed: no embedding call and no write
+    await index_business_context_chunks(context)
+    assert len(embedded) == 1
+    assert len(chunk_store) == 1
+    
+    # Only the changed field is re-embedded and its old chunk removed
+    old_keywords = next(chunk for chunk in chunks if chunk.source_field == "keywords")
+    context.keywords = ["bakery", "pastry"]
+    await index_business_context_chunks(context)
+    
+    assert embedded[1] == ["Keywords: bakery, pastry"]
+    assert chunk_store[1][0] == "apply"
+    assert chunk_store[1][2] == [old_keywords.id]
+    
+    forget_business_context_chunks(context.business_id)
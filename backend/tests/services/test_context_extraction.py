@@ -1,5 +1,7 @@
 import pytest
+import asyncio
 import json
+from types import SimpleNamespace
 from datetime import datetime
 from typing import Dict, Any
 
@@ -10,8 +12,10 @@ from app.services.context_extraction_service import (
     extract_keywords,
     generate_business_insights,
     generate_recommendations,
-    extract_basic_context
+    extract_basic_context,
+    get_extraction_stats
 )
+from app.services import context_extraction_service
 
 
 @pytest.fixture
@@ -205,7 +209,7 @@ async def test_extract_business_context_integration(sample_onboarding_state, mon
                        lambda *args, **kwargs: mock_generate_recommendations(*args, **kwargs))
     
     # Extract context
-    context = await extract_business_context(business_id, sample_onboarding_state)
+    context = await extract_business_context(business_id, sample_onboarding_state, mode="dag")
     
     # Verify the extracted context
     assert context.business_id == business_id
@@ -218,3 +222,63 @@ async def test_extract_business_context_integration(sample_onboarding_state, mon
     
     # Print the context for debugging
     print(json.dumps(context.model_dump(), indent=2, default=str))
+
+
+@pytest.mark.asyncio
+async def test_extract_business_context_single_call(sample_onboarding_state, monkeypatch):
+    """Test that single mode extracts the whole context in one round-trip."""
+    calls = []
+    arguments = {
+        "profile": {"name": "TechSolutions Inc.", "type": "Technology", "employees": 15},
+        "keywords": ["AI", "Automation", "B2B"],
+        "insights": {"market_positioning": "Niche AI provider for small businesses", "customer_needs": ""},
+        "recommendations": ["Offer vertical-specific bundles", "Partner with accountants"]
+    }
+    
+    async def mock_chat_completion(messages, **kwargs):
+        calls.append(kwargs)
+        function_call = SimpleNamespace(name="extract_business_context", arguments=json.dumps(arguments))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(function_call=function_call))])
+    
+    monkeypatch.setattr(context_extraction_service.llm_gateway, "chat_completion", mock_chat_completion)
+    
+    context = await extract_business_context("test_business_id", sample_onboarding_state, mode="single")
+    
+    assert len(calls) == 1
+    assert calls[0]["function_call"] == {"name": "extract_business_context"}
+    assert context.profile.name == "TechSolutions Inc."
+    assert context.profile.employees == 15
+    assert context.keywords == ["AI", "Automation", "B2B"]
+    # Empty insights are dropped like in the per-stage extraction
+    assert context.insights == {"market_positioning": "Niche AI provider for small businesses"}
+    assert len(context.recommendations) == 2
+    
+    stats = get_extraction_stats()["single"]
+    assert stats["extract"]["count"] >= 1
+    assert stats["total"]["last_ms"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_dag_mode_runs_keywords_and_insights_concurrently(sample_onboarding_state, monkeypatch):
+    """Test that keywords and insights are extracted at the same time once the profile is known."""
+    running = []
+    concurrency = []
+    
+    async def mock_stage(result):
+        running.append(1)
+        concurrency.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return result
+    
+    monkeypatch.setattr(context_extraction_service, "extract_business_profile", lambda *args, **kwargs: mock_stage({"name": "TechSolutions Inc."}))
+    monkeypatch.setattr(context_extraction_service, "extract_keywords", lambda *args, **kwargs: mock_stage(["AI"]))
+    monkeypatch.setattr(context_extraction_service, "generate_business_insights", lambda *args, **kwargs: mock_stage({"customer_needs": "Automation"}))
+    monkeypatch.setattr(context_extraction_service, "generate_recommendations", lambda *args, **kwargs: mock_stage(["Hire"]))
+    
+    context = await extract_business_context("test_business_id", sample_onboarding_state, mode="dag")
+    
+    assert context.keywords == ["AI"]
+    # Profile and recommendations run alone, keywords and insights together
+    assert concurrency == [1, 1, 2, 1]
+    assert set(get_extraction_stats()["dag"]) >= {"profile", "keywords", "insights", "recommendations", "total"}
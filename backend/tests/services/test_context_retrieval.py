@@ -0,0 +1,306 @@
+import pytest
+import numpy as np
+
+from app.schemas.business_context import BusinessContext, BusinessProfile
+from app.services import context_retrieval_service
+from app.services.context_retrieval_service import (
+    retrieve_context_by_keywords,
+    retrieve_similar_contexts,
+    retrieve_similar_contexts_hybrid
+)
+from app.services.keyword_index import KeywordIndex, KeywordIndexRegistry, tokenize
+from app.services.vector_index import VectorIndex, VectorIndexRegistry, rescore
+
+
+# Fixed embeddings keyed by business type, so retrieval is deterministic without the API
+EMBEDDINGS = {
+    "Bakery": [1.0, 0.0, 0.0],
+    "Software": [0.0, 1.0, 0.0],
+    "Consulting": [0.0, 0.7, 0.7],
+}
+
+
+@pytest.fixture
+def contexts():
+    """Create sample business contexts."""
+    return [
+        BusinessContext(
+            business_id=f"b_{business_type.lower()}",
+            profile=BusinessProfile(name=f"{business_type} Co", type=business_type),
+            keywords=[business_type]
+        )
+        for business_type in EMBEDDINGS
+    ]
+
+
+@pytest.fixture
+def mock_embeddings(monkeypatch):
+    """Replace embedding generation with lookups into EMBEDDINGS."""
+    batches = []
+    
+    def embed(text):
+        for business_type, embedding in EMBEDDINGS.items():
+            if business_type.lower() in text.lower():
+                return embedding
+        return [0.0, 0.0, 1.0]
+    
+    async def mock_generate_embedding(text):
+        return embed(text)
+    
+    async def mock_generate_embeddings_batch(texts):
+        batches.append(texts)
+        return [embed(text) for text in texts]
+    
+    monkeypatch.setattr(context_retrieval_service, "generate_embedding", mock_generate_embedding)
+    monkeypatch.setattr(context_retrieval_service, "generate_embeddings_batch", mock_generate_embeddings_batch)
+    return batches
+
+
+def test_vector_index_search_and_remove():
+    """Test scoring, top-k selection and swap-remove in the vector index."""
+    index = VectorIndex()
+    index.add_many(["a", "b", "c"], [[1.0, 0.0], [0.6, 0.8], [0.0, 2.0]])
+    
+    results = index.search([1.0, 0.0], top_k=2)
+    assert [item_id for item_id, _ in results] == ["a", "b"]
+    assert results[0][1] == pytest.approx(1.0)
+    assert results[1][1] == pytest.approx(0.6)
+    
+    assert index.remove("a")
+    assert not index.remove("a")
+    assert len(index) == 2
+    assert index.search([0.0, 1.0], top_k=1)[0][0] == "c"
+    np.testing.assert_allclose(sorted(index.scores([1.0, 0.0])), [0.0, 0.6], atol=1e-6)
+
+
+def test_vector_index_rejects_mismatched_dimension():
+    """Test that vectors of a different dimension are rejected."""
+    index = VectorIndex()
+    index.add("a", [1.0, 0.0])
+    
+    with pytest.raises(ValueError):
+        index.add("b", [1.0, 0.0, 0.0])
+
+
+def test_registry_refresh_and_discard():
+    """Test that registry updates only touch indexes holding the item."""
+    registry = VectorIndexRegistry()
+    registry.get("user_1").add("a", [1.0, 0.0], version="v1")
+    registry.get("user_2").add("b", [0.0, 1.0])
+    
+    registry.refresh("a", [0.0, 1.0], version="v2")
+    assert registry.get("user_1").version("a") == "v2"
+    assert "a" not in registry.get("user_2")
+    
+    registry.discard("a")
+    assert len(registry.get("user_1")) == 0
+
+
+def test_registry_drops_least_recently_used_and_idle_scopes(monkeypatch):
+    """Test that the registry keeps a bounded number of indexes and expires idle ones."""
+    now = [1000.0]
+    monkeypatch.setattr("app.core.cache.time.monotonic", lambda: now[0])
+    registry = VectorIndexRegistry(max_scopes=2, idle_seconds=60)
+    registry.get("user_1").add("a", [1.0, 0.0])
+    registry.get("user_2").add("b", [0.0, 1.0])
+    registry.get("user_1")
+    registry.get("user_3")
+    
+    assert sorted(registry.scopes()) == ["user_1", "user_3"]
+    assert registry.stats()["evictions"] == 1
+    
+    # Using an index restarts its idle timeout
+    now[0] += 50
+    registry.get("user_1")
+    now[0] += 50
+    assert list(registry.scopes()) == ["user_1"]
+    assert len(registry.get("user_1")) == 1
+    assert len(registry.get("user_2")) == 0
+
+
+@pytest.mark.parametrize("precision, compression", [("float16", 2.0), ("int8", 3.5)])
+def test_quantized_index_approximates_scores(precision, compression):
+    """Test that quantized indexes use less memory and stay close to exact scores."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 64))
+    query = rng.normal(size=64)
+    
+    exact = VectorIndex()
+    quantized = VectorIndex(precision=precision)
+    ids = [f"v{i}" for i in range(len(vectors))]
+    exact.add_many(ids, vectors)
+    quantized.add_many(ids, vectors)
+    
+    # int8 also stores one float32 scale per vector
+    assert exact.nbytes / quantized.nbytes >= compression
+    np.testing.assert_allclose(quantized.scores(query), exact.scores(query), atol=0.02)
+    
+    quantized.remove("v0")
+    np.testing.assert_allclose(quantized.scores(query), exact.scores(query)[[199] + list(range(1, 199))], atol=0.02)
+
+
+def test_rescore_restores_exact_order():
+    """Test that rescoring with full-precision vectors fixes approximate ranking."""
+    candidates = [("a", 0.90), ("b", 0.89), ("c", 0.50)]
+    embeddings = [[0.6, 0.8], [1.0, 0.0], [0.0, 1.0]]
+    
+    results = rescore([1.0, 0.0], candidates, embeddings, top_k=2)
+    
+    assert [item_id for item_id, _ in results] == ["b", "a"]
+    assert results[0][1] == pytest.approx(1.0)
+    assert results[1][1] == pytest.approx(0.6)
+
+
+def test_rescore_keeps_approximate_scores_when_a_vector_is_missing():
+    """Test that exact and approximate scores are never ranked together."""
+    candidates = [("a", 0.90), ("b", 0.89), ("c", 0.50)]
+    
+    results = rescore([1.0, 0.0], candidates, [[0.6, 0.8], None, [0.0, 1.0]], top_k=2, min_score=0.895)
+    
+    assert results == [("a", pytest.approx(0.90))]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+async def test_registry_rescores_quantized_candidates_with_fetched_vectors(precision):
+    """Test that registry search returns exact scores and applies the threshold to them."""
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(300, 32))
+    query = rng.normal(size=32)
+    ids = [f"v{i}" for i in range(len(vectors))]
+    stored = dict(zip(ids, vectors))
+    fetched = []
+    
+    async def fetch_embeddings(item_ids):
+        fetched.append(item_ids)
+        return [stored[item_id] for item_id in item_ids]
+    
+    exact = VectorIndex()
+    registry = VectorIndexRegistry(precision=precision, rescore_factor=4)
+    index = registry.get("scope")
+    exact.add_many(ids, vectors)
+    index.add_many(ids, vectors)
+    
+    expected = exact.search(query, top_k=5)
+    results = await registry.search(index, query, 5, expected[2][1], fetch_embeddings)
+    
+    assert [item_id for item_id, _ in results] == [item_id for item_id, _ in expected[:3]]
+    np.testing.assert_allclose([score for _, score in results], [score for _, score in expected[:3]], rtol=1e-5)
+    # Only top_k * rescore_factor candidates are fetched
+    assert len(fetched) == 1 and len(fetched[0]) == 20
+    
+    # Float32 indexes are already exact and never fetch
+    await registry.search(exact, query, 5, None, fetch_embeddings)
+    assert len(fetched) == 1
+
+
+@pytest.mark.asyncio
+async def test_retrieve_similar_contexts_ranks_by_similarity(contexts, mock_embeddings):
+    """Test that vector retrieval ranks contexts and applies the threshold."""
+    results = await retrieve_similar_contexts("software products", contexts, top_k=3, similarity_threshold=0.5)
+    
+    assert [context.business_id for context, _ in results] == ["b_software", "b_consulting"]
+    assert results[0][1] == pytest.approx(1.0)
+
+
+@pytest.mark.asyncio
+async def test_scoped_index_only_embeds_changed_contexts(contexts, mock_embeddings):
+    """Test that a scoped index is reused and updated incrementally."""
+    await retrieve_similar_contexts("bakery", contexts, scope="user_incremental")
+    assert len(mock_embeddings) == 1
+    assert len(mock_embeddings[0]) == 3
+    
+    # Unchanged contexts are not embedded again
+    await retrieve_similar_contexts("bakery", contexts, scope="user_incremental")
+    assert len(mock_embeddings) == 1
+    
+    # A removed context disappears from results and a changed one is re-embedded
+    contexts[1].updated_at = contexts[1].updated_at.replace(year=2030)
+    results = await retrieve_similar_contexts(
+        "software", contexts[1:], top_k=3, similarity_threshold=0.0, scope="user_incremental"
+    )
+    assert len(mock_embeddings) == 2
+    assert len(mock_embeddings[1]) == 1
+    assert "b_bakery" not in [context.business_id for context, _ in results]
+
+
+def test_keyword_registry_keeps_bounded_number_of_scopes():
+    """Test that the keyword registry drops its least recently used index."""
+    registry = KeywordIndexRegistry(max_scopes=2)
+    registry.get("user_1").add("a", [("profile.description", "Fresh bread")])
+    registry.get("user_2")
+    registry.get("user_1")
+    registry.get("user_3")
+    
+    assert sorted(registry.scopes()) == ["user_1", "user_3"]
+    registry.discard("a")
+    assert "a" not in registry.get("user_1")
+
+
+def test_keyword_index_bm25_ranking_and_removal():
+    """Test that BM25 favours rare terms and weighted fields, and removal updates postings."""
+    index = KeywordIndex()
+    index.add("a", [("keywords", "Keywords: bread, pastry"), ("profile.description", "Fresh bread daily")])
+    index.add("b", [("profile.description", "Bread and coffee for the office")])
+    index.add("c", [("profile.description", "Cloud software for offices")])
+    
+    results = index.search(tokenize("pastry bread"), top_k=3)
+    assert [doc_id for doc_id, _ in results] == ["a", "b"]
+    assert results[0][1] > results[1][1]
+    
+    assert index.search(tokenize("pastry bread"), top_k=3, min_matches=2) == results[:1]
+    
+    assert index.remove("a")
+    assert index.search(["pastry"], top_k=3) == []
+    assert [doc_id for doc_id, _ in index.search(["bread"], top_k=3)] == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_retrieve_context_by_keywords_uses_scoped_index(contexts):
+    """Test keyword retrieval over profile fields and incremental index updates."""
+    results = await retrieve_context_by_keywords(["software"], contexts, top_k=3, scope="user_keywords")
+    assert [context.business_id for context, _ in results] == ["b_software"]
+    assert results[0][1] > 0
+    
+    # A changed context is re-indexed on the next query
+    contexts[0].keywords = ["software"]
+    contexts[0].updated_at = contexts[0].updated_at.replace(year=2030)
+    results = await retrieve_context_by_keywords(["software"], contexts, top_k=3, scope="user_keywords")
+    assert {context.business_id for context, _ in results} == {"b_software", "b_bakery"}
+    
+    assert await retrieve_context_by_keywords(["the"], contexts) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fusion", ["weighted", "rrf"])
+async def test_hybrid_retrieval_embeds_query_once(contexts, mock_embeddings, monkeypatch, fusion):
+    """Test that hybrid retrieval fuses both signals and embeds the query only once."""
+    query_calls = []
+    
+    async def counting_generate_embedding(text):
+        query_calls.append(text)
+        return [0.0, 0.7, 0.7]
+    
+    monkeypatch.setattr(context_retrieval_service, "generate_embedding", counting_generate_embedding)
+    
+    # The vector signal favours consulting; the keyword signal is software-only
+    results = await retrieve_similar_contexts_hybrid(
+        "consulting", ["software"], contexts, top_k=3, vector_weight=0.5, keyword_weight=0.5, fusion=fusion
+    )
+    
+    assert len(query_calls) == 1
+    assert len(mock_embeddings) == 1
+    assert [context.business_id for context, _ in results][:2] == ["b_software", "b_consulting"]
+    assert results[0][1] > results[1][1]
+
+
+@pytest.mark.asyncio
+async def test_hybrid_retrieval_keeps_low_similarity_contexts(contexts, mock_embeddings):
+    """Test that contexts below the vector threshold still get their vector score."""
+    results = await retrieve_similar_contexts_hybrid("bakery", [], contexts, top_k=3)
+    
+    assert [context.business_id for context, _ in results][0] == "b_bakery"
+    assert len(results) == 3
+    
+    with pytest.raises(ValueError):
+        await retrieve_similar_contexts_hybrid("bakery", [], contexts, fusion="max")
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from app.services import embedding_backfill
+from app.services.embedding_backfill import batch_by_tokens, run_embedding_backfill
+
+
+class FakeTable:
+    """In-memory table served through keyset pagination."""
+    def __init__(self, size):
+        self.rows = {f"row_{i:04d}": f"text number {i}" for i in range(size)}
+        self.embeddings = {}
+        self.pages = []
+    
+    async def fetch_page(self, db, after_id, limit, only_missing=True, business_id=None, model=None):
+        ids = sorted(
+            row_id for row_id in self.rows
+            if row_id > (after_id or "") and not (only_missing and row_id in self.embeddings)
+        )[:limit]
+        self.pages.append(after_id)
+        return [{"id": row_id, "text": self.rows[row_id]} for row_id in ids]
+    
+    async def write_embeddings(self, db, rows, model=None):
+        self.embeddings.update(dict(rows))
+        return len(rows)
+
+
+@pytest.fixture
+def table(monkeypatch):
+    """Serve the backfill from a fake table and a fake embedding provider."""
+    table = FakeTable(25)
+    requests = []
+    
+    async def mock_generate_embeddings_batch(texts):
+        requests.append(texts)
+        return [None if text == "text number 7" else [1.0, 0.0] for text in texts]
+    
+    monkeypatch.setattr(embedding_backfill, "_target_functions", lambda target: (table.fetch_page, table.write_embeddings))
+    monkeypatch.setattr(embedding_backfill, "generate_embeddings_batch", mock_generate_embeddings_batch)
+    table.requests = requests
+    return table
+
+
+def test_batch_by_tokens_respects_size_and_token_caps():
+    """Test that batches are split on both input count and token total."""
+    items = [(str(i), "text", tokens) for i, tokens in enumerate([5, 5, 5, 20, 1, 1])]
+    
+    batches = batch_by_tokens(items, max_batch_size=2, max_batch_tokens=12)
+    
+    assert [[item_id for item_id, _, _ in batch] for batch in batches] == [["0", "1"], ["2"], ["3"], ["4", "5"]]
+
+
+@pytest.mark.asyncio
+async def test_backfill_pages_batches_and_skips_failures(table):
+    """Test that all rows are paged through, written in bulk and failures reported."""
+    stats = await run_embedding_backfill(None, "knowledge_items", page_size=10, concurrency=2)
+    
+    assert stats["completed"]
+    assert stats["rows"] == 25
+    assert stats["embedded"] == 24
+    assert stats["failed"] == 1
+    assert stats["pages"] == 3
+    assert stats["tokens"] > 0
+    assert "row_0007" not in table.embeddings
+    # Keyset pagination continues after the last ID of each page
+    assert table.pages == [None, "row_0009", "row_0019"]
+
+
+@pytest.mark.asyncio
+async def test_backfill_resumes_from_checkpoint(table, tmp_path):
+    """Test that an interrupted run resumes after the last checkpointed page."""
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    
+    first = await run_embedding_backfill(
+        None, "knowledge_items", only_missing=False, page_size=10, checkpoint_path=checkpoint_path, max_rows=10
+    )
+    assert not first["completed"]
+    saved = json.loads((tmp_path / "checkpoint.json").read_text())
+    assert saved["knowledge_items:*:all"]["last_id"] == "row_0009"
+    
+    second = await run_embedding_backfill(
+        None, "knowledge_items", only_missing=False, page_size=10, checkpoint_path=checkpoint_path
+    )
+    assert second["completed"]
+    assert second["rows"] == 15
+    assert table.pages[1] == "row_0009"
@@ -0,0 +1,174 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+from app.core.cache import LRUCache
+from app.services import embedding_service
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.embedding_cache import (
+    EmbeddingCache,
+    make_cache_key,
+    pack_vector,
+    unpack_vector
+)
+from app.services.embedding_providers import (
+    LocalHashingEmbeddingProvider,
+    OpenAIEmbeddingProvider,
+    create_embedding_provider
+)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test that the LRU evicts the oldest entry once full."""
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_lru_cache_expires_entries(monkeypatch):
+    """Test that entries are dropped after their TTL."""
+    now = [1000.0]
+    monkeypatch.setattr("app.core.cache.time.monotonic", lambda: now[0])
+    
+    cache = LRUCache(max_entries=10, ttl_seconds=60)
+    cache.set("a", 1)
+    now[0] += 59
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is None
+
+
+def test_cache_key_normalizes_whitespace_and_includes_model():
+    """Test that the cache key ignores whitespace differences but not the model."""
+    assert make_cache_key("m", "hello   world\n") == make_cache_key("m", " hello world")
+    assert make_cache_key("m", "hello world") != make_cache_key("other", "hello world")
+
+
+def test_vector_packing_roundtrip():
+    """Test that vectors survive the float32 byte encoding."""
+    vector = [0.5, -0.25, 1.0]
+    data = pack_vector(vector)
+    
+    assert len(data) == 12
+    assert unpack_vector(data) == vector
+
+
+@pytest.mark.asyncio
+async def test_embedding_cache_counts_hits_and_misses():
+    """Test local-tier lookups and hit/miss counters."""
+    cache = EmbeddingCache(max_entries=10, use_redis=False)
+    
+    assert await cache.get("m", "text") is None
+    await cache.set("m", "text", [1.0, 2.0])
+    assert await cache.get("m", "text") == [1.0, 2.0]
+    
+    stats = cache.stats()
+    assert stats["local_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_batch_only_requests_misses(monkeypatch):
+    """Test that batch generation sends only uncached, distinct texts to the API."""
+    cache = EmbeddingCache(max_entries=10, use_redis=False)
+    await cache.set(embedding_service.EMBEDDING_MODEL, "cached", [1.0])
+    monkeypatch.setattr(embedding_service, "embedding_cache", cache)
+    
+    requests = []
+    
+    async def mock_create(model, input):
+        requests.append(input)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[float(len(text))]) for i, text in enumerate(input)
+        ])
+    
+    provider = OpenAIEmbeddingProvider(gateway=SimpleNamespace(api_key="sk-test", embeddings=mock_create))
+    monkeypatch.setattr(embedding_service, "embedding_provider", provider)
+    
+    embeddings = await embedding_service.generate_embeddings_batch(["cached", "abc", "abc", "ab"])
+    
+    assert requests == [["abc", "ab"]]
+    assert embeddings == [[1.0], [3.0], [3.0], [2.0]]
+    
+    # A second call is served entirely from the cache
+    assert await embedding_service.generate_embedding("ab") == [2.0]
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_submits_share_one_batch():
+    """Test that texts submitted within the window are sent as one deduplicated batch."""
+    calls = []
+    
+    async def batch_fn(texts):
+        calls.append(texts)
+        return [[float(len(text))] for text in texts]
+    
+    batcher = EmbeddingBatcher(batch_fn, window_ms=5)
+    results = await asyncio.gather(*(batcher.submit(text) for text in ["a", "bb", "a", "ccc"]))
+    
+    assert calls == [["a", "bb", "ccc"]]
+    assert results == [[1.0], [2.0], [1.0], [3.0]]
+    assert batcher.stats()["batches_sent"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_size_cap_flushes_early():
+    """Test that reaching max_batch_size sends the batch without waiting for the window."""
+    calls = []
+    
+    async def batch_fn(texts):
+        calls.append(texts)
+        return [[0.0] for _ in texts]
+    
+    batcher = EmbeddingBatcher(batch_fn, window_ms=10000, max_batch_size=2)
+    await asyncio.wait_for(asyncio.gather(batcher.submit("a"), batcher.submit("b")), timeout=1)
+    
+    assert calls == [["a", "b"]]
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_resolves_callers_with_none():
+    """Test that a failing batch request resolves every caller with None."""
+    async def batch_fn(texts):
+        raise RuntimeError("provider unavailable")
+    
+    batcher = EmbeddingBatcher(batch_fn, window_ms=1)
+    results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+    
+    assert results == [None, None]
+
+
+@pytest.mark.asyncio
+async def test_local_provider_is_deterministic_and_normalized():
+    """Test that the local provider embeds offline with stable unit-length vectors."""
+    provider = LocalHashingEmbeddingProvider(dimension=256)
+    
+    first, second, unrelated = await provider.embed([
+        "artisan sourdough bakery", "artisan sourdough bakery downtown", "freight logistics"
+    ])
+    
+    assert len(first) == 256
+    assert await provider.embed(["artisan sourdough bakery"]) == [first]
+    assert embedding_service.calculate_similarity(first, first) == pytest.approx(1.0, abs=1e-6)
+    assert embedding_service.calculate_similarity(first, second) > embedding_service.calculate_similarity(first, unrelated)
+
+
+def test_provider_model_version_includes_non_native_dimension():
+    """Test that vectors of different dimensions never share a model version."""
+    assert OpenAIEmbeddingProvider("text-embedding-ada-002").model_version == "text-embedding-ada-002"
+    assert OpenAIEmbeddingProvider("text-embedding-3-large", 1536).model_version == "text-embedding-3-large@1536"
+    assert create_embedding_provider("local", dimension=64).model_version == "local-hashing-v1@64"
+    
+    with pytest.raises(ValueError):
+        OpenAIEmbeddingProvider("text-embedding-ada-002", 512)
+    with pytest.raises(ValueError):
+        create_embedding_provider("unknown")
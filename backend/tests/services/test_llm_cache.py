@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+from openai.types.chat import ChatCompletion
+
+from app.services.llm_cache import LLMResponseCache, make_llm_cache_key
+from app.services.llm_gateway import LLMGateway
+
+
+def _completion(content: str) -> ChatCompletion:
+    return ChatCompletion.model_validate({
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-test",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 40, "completion_tokens": 10, "total_tokens": 50},
+    })
+
+
+@pytest.fixture
+def gateway():
+    """Gateway with a local-only cache whose provider calls are recorded."""
+    gateway = LLMGateway(api_key="sk-test", cache=LLMResponseCache(use_redis=False))
+    gateway.calls = []
+    
+    async def create(**kwargs):
+        gateway.calls.append(kwargs)
+        return _completion(f"answer {len(gateway.calls)}")
+    
+    gateway._client = lambda: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return gateway
+
+
+def test_cache_key_is_canonical():
+    """Test that the key ignores dict ordering but not request content."""
+    messages = [{"role": "user", "content": "hi"}]
+    key = make_llm_cache_key("gpt-test", messages, {"temperature": 0.1, "function_call": {"name": "f"}})
+    
+    assert key == make_llm_cache_key("gpt-test", messages, {"function_call": {"name": "f"}, "temperature": 0.1})
+    assert key != make_llm_cache_key("gpt-test", messages, {"temperature": 0.2, "function_call": {"name": "f"}})
+    assert key != make_llm_cache_key("gpt-other", messages, {"temperature": 0.1, "function_call": {"name": "f"}})
+
+
+@pytest.mark.asyncio
+async def test_identical_low_temperature_call_is_served_from_cache(gateway):
+    """Test that repeating a deterministic request does not call the provider."""
+    messages = [{"role": "user", "content": "extract"}]
+    
+    first = await gateway.chat_completion(messages, model="gpt-test", temperature=0.1)
+    second = await gateway.chat_completion(messages, model="gpt-test", temperature=0.1)
+    
+    assert len(gateway.calls) == 1
+    assert second.choices[0].message.content == first.choices[0].message.content
+    stats = gateway.stats()["cache"]
+    assert stats["local_hits"] == 1
+    assert stats["saved_tokens"] == 50
+
+
+@pytest.mark.asyncio
+async def test_cache_bypass_and_temperature_policy(gateway):
+    """Test that the bypass flag and sampled requests skip the cache, and callers can opt in."""
+    messages = [{"role": "user", "content": "extract"}]
+    
+    await gateway.chat_completion(messages, model="gpt-test", temperature=0.1)
+    await gateway.chat_completion(messages, model="gpt-test", temperature=0.1, cache=False)
+    assert len(gateway.calls) == 2
+    
+    await gateway.chat_completion(messages, model="gpt-test", temperature=0.7)
+    await gateway.chat_completion(messages, model="gpt-test", temperature=0.7)
+    assert len(gateway.calls) == 4
+    
+    await gateway.chat_completion(messages, model="gpt-test", temperature=0.5, cache=True)
+    await gateway.chat_completion(messages, model="gpt-test", temperature=0.5, cache=True)
+    assert len(gateway.calls) == 5
+
+
+@pytest.mark.asyncio
+async def test_oversized_responses_are_not_cached():
+    """Test that entries above max_entry_bytes are skipped."""
+    cache = LLMResponseCache(max_entry_bytes=100, use_redis=False)
+    
+    await cache.set("llm:gpt-test:big", _completion("x" * 200))
+    
+    assert await cache.get("llm:gpt-test:big") is None
+    assert cache.stats()["skipped"] == 1
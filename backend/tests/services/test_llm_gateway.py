@@ -0,0 +1,207 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app.services import llm_gateway as llm_gateway_module
+from app.services.llm_gateway import LLMGateway, LLMUnavailableError, TokenBucket
+
+
+def _status_error(status_code: int, headers=None):
+    """Create an OpenAI API error for an HTTP status code."""
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, request=request, headers=headers)
+    if status_code == 429:
+        return openai.RateLimitError("rate limited", response=response, body=None)
+    if status_code >= 500:
+        return openai.InternalServerError("server error", response=response, body=None)
+    return openai.BadRequestError("bad request", response=response, body=None)
+
+
+def _fake_client(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried():
+    """Test that rate limits and server errors are retried until the call succeeds."""
+    gateway = LLMGateway(api_key="sk-test", retry_base_seconds=0, max_retries=3)
+    outcomes = [_status_error(429), _status_error(503), "ok"]
+    
+    async def create(**kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    
+    gateway._client = lambda: _fake_client(create)
+    
+    assert await gateway.chat_completion([{"role": "user", "content": "hi"}], model="gpt-test") == "ok"
+    stats = gateway.stats()
+    assert stats["requests"] == 3
+    assert stats["retries"] == 2
+    assert stats["circuit_state"] == "closed"
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    """Test that a 400 is raised immediately and does not count against the circuit."""
+    gateway = LLMGateway(api_key="sk-test", retry_base_seconds=0, failure_threshold=1)
+    calls = []
+    
+    async def create(**kwargs):
+        calls.append(kwargs)
+        raise _status_error(400)
+    
+    gateway._client = lambda: _fake_client(create)
+    
+    with pytest.raises(openai.BadRequestError):
+        await gateway.chat_completion([{"role": "user", "content": "hi"}], model="gpt-test")
+    assert len(calls) == 1
+    assert gateway.is_available()
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_after_repeated_failures():
+    """Test that calls fail fast once the failure threshold is reached."""
+    gateway = LLMGateway(api_key="sk-test", retry_base_seconds=0, max_retries=1, failure_threshold=2)
+    calls = []
+    
+    async def create(**kwargs):
+        calls.append(kwargs)
+        raise _status_error(500)
+    
+    gateway._client = lambda: _fake_client(create)
+    
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            await gateway.chat_completion([{"role": "user", "content": "hi"}], model="gpt-test")
+    
+    assert not gateway.is_available()
+    with pytest.raises(LLMUnavailableError):
+        await gateway.chat_completion([{"role": "user", "content": "hi"}], model="gpt-test")
+    # Two calls with one retry each, nothing sent while the circuit is open
+    assert len(calls) == 4
+    assert gateway.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_trial_call_releases_half_open_circuit():
+    """Test that cancelling the half-open trial call lets the next call probe the provider."""
+    gateway = LLMGateway(api_key="sk-test", retry_base_seconds=0, max_retries=0, failure_threshold=1, recovery_seconds=0.05)
+    outcomes = [_status_error(500), "hang", "hang", "ok"]
+    
+    async def create(**kwargs):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome == "hang":
+            await asyncio.sleep(10)
+        return FakeStream([outcome]) if kwargs.get("stream") else outcome
+    
+    gateway._client = lambda: _fake_client(create)
+    messages = [{"role": "user", "content": "hi"}]
+    
+    with pytest.raises(openai.InternalServerError):
+        await gateway.chat_completion(messages, model="gpt-test")
+    await asyncio.sleep(0.06)
+    assert gateway.circuit_breaker.state == "half_open"
+    
+    # The trial call is cancelled (e.g. the client disconnected)
+    trial = asyncio.create_task(gateway.chat_completion(messages, model="gpt-test"))
+    await asyncio.sleep(0.01)
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+    
+    # So is a trial stream, before its first chunk
+    async def consume():
+        return [chunk async for chunk in gateway.chat_completion_stream(messages, model="gpt-test")]
+    
+    trial = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+    
+    assert not gateway.circuit_breaker._trial_in_flight
+    assert await gateway.chat_completion(messages, model="gpt-test") == "ok"
+    assert gateway.circuit_breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_per_model_concurrency_is_capped():
+    """Test that no more than max_concurrency_per_model calls to a model are in flight."""
+    gateway = LLMGateway(api_key="sk-test", max_concurrency=8, max_concurrency_per_model=2)
+    in_flight = []
+    peak = []
+    
+    async def create(**kwargs):
+        in_flight.append(1)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+        return "ok"
+    
+    gateway._client = lambda: _fake_client(create)
+    
+    await asyncio.gather(*[
+        gateway.chat_completion([{"role": "user", "content": "hi"}], model="gpt-test") for _ in range(6)
+    ])
+    assert max(peak) == 2
+
+
+def test_token_bucket_reservations_wait_for_refill(monkeypatch):
+    """Test that reservations beyond the capacity wait for the refill rate."""
+    # Freeze the clock so no refill happens between reservations
+    monkeypatch.setattr(llm_gateway_module.time, "monotonic", lambda: 1000.0)
+    bucket = TokenBucket(per_minute=60, capacity=2)
+    
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(1) == 0.0
+    # One token per second: the third and fourth callers queue up behind each other
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(1) == pytest.approx(2.0)
+    assert TokenBucket(per_minute=0).reserve(1000) == 0.0
+
+
+class FakeStream:
+    """Async iterator standing in for an OpenAI completion stream."""
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.closed = False
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        if not self.chunks:
+            raise StopAsyncIteration
+        return self.chunks.pop(0)
+    
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_stream_is_retried_before_first_chunk():
+    """Test that a stream that fails to open is retried and closed after use."""
+    gateway = LLMGateway(api_key="sk-test", retry_base_seconds=0)
+    streams = []
+    
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        if not streams:
+            streams.append(None)
+            raise _status_error(429)
+        streams.append(FakeStream(["a", "b"]))
+        return streams[-1]
+    
+    gateway._client = lambda: _fake_client(create)
+    
+    chunks = [chunk async for chunk in gateway.chat_completion_stream([{"role": "user", "content": "hi"}], model="gpt-test")]
+    assert chunks == ["a", "b"]
+    assert streams[-1].closed
+    assert gateway.stats()["retries"] == 1
@@ -0,0 +1,93 @@
+import json
+from datetime import datetime
+
+from app.core.json import json_dumps
+from app.schemas.onboarding import MessageType, OnboardingMessage, OnboardingState
+from app.services.onboarding_state_sync import OnboardingStateTracker
+
+
+def make_message(n: int, sender: str = "assistant") -> OnboardingMessage:
+    return OnboardingMessage(id=f"m{n}", content=f"Message {n}", sender=sender, timestamp=datetime(2024, 1, 1))
+
+
+def make_state() -> OnboardingState:
+    return OnboardingState(
+        currentStep=1,
+        totalSteps=5,
+        stepTitle="Business Information",
+        percentage=0,
+        businessData={},
+        conversationHistory=[make_message(0)]
+    )
+
+
+def test_patch_holds_only_changes_since_last_frame():
+    """Test that a patch carries changed fields, changed business data and appended messages."""
+    tracker = OnboardingStateTracker()
+    state = make_state()
+    
+    snapshot = tracker.snapshot(state)
+    assert snapshot["type"] == MessageType.ONBOARDING_STATE
+    assert snapshot["version"] == 1
+    
+    state.conversationHistory.append(make_message(1, "user"))
+    state.conversationHistory.append(make_message(2))
+    state.currentStep = 2
+    state.percentage = 20
+    state.businessData["business_name"] = "Acme"
+    patch = tracker.patch(state, typing=False)
+    
+    assert patch["type"] == MessageType.ONBOARDING_STATE_PATCH
+    assert (patch["base_version"], patch["version"]) == (1, 2)
+    assert patch["changes"] == {"currentStep": 2, "percentage": 20}
+    assert patch["businessData"] == {"business_name": "Acme"}
+    assert [message.id for message in patch["appended"]] == ["m1", "m2"]
+    assert patch["typing"] is False
+    assert "replaced" not in patch
+    
+    state.businessData.pop("business_name")
+    assert tracker.patch(state)["businessDataRemoved"] == ["business_name"]
+    assert tracker.patch(state) is None
+    assert tracker.version == 3
+
+
+def test_patch_reports_replaced_messages_and_truncation():
+    """Test that replaced messages are patched and a shorter history triggers a snapshot."""
+    tracker = OnboardingStateTracker()
+    state = make_state()
+    state.conversationHistory.append(make_message(1))
+    tracker.snapshot(state)
+    
+    personalized = make_message(1)
+    personalized.content = "Personalized"
+    state.conversationHistory[-1] = personalized
+    patch = tracker.patch(state)
+    
+    assert patch["replaced"] == [personalized]
+    assert "appended" not in patch
+    
+    state.conversationHistory = state.conversationHistory[:1]
+    frame = tracker.patch(state)
+    assert frame["type"] == MessageType.ONBOARDING_STATE
+    assert frame["version"] == 3
+
+
+def test_patch_size_does_not_grow_with_conversation():
+    """Test that per-turn patches stay the same size while full-state frames grow."""
+    tracker = OnboardingStateTracker()
+    state = make_state()
+    tracker.snapshot(state)
+    
+    patch_sizes = []
+    state_sizes = []
+    for turn in range(1, 51):
+        state.conversationHistory.append(make_message(2 * turn, "user"))
+        state.conversationHistory.append(make_message(2 * turn + 1))
+        patch_sizes.append(len(json_dumps(tracker.patch(state))))
+        state_sizes.append(len(json_dumps({"type": MessageType.ONBOARDING_STATE, "state": state})))
+    
+    assert max(patch_sizes) - min(patch_sizes) < 20
+    assert state_sizes[-1] > 20 * patch_sizes[-1]
+    assert json.loads(json_dumps(tracker.patch(state, typing=True))) == {
+        "type": "onboarding_state_patch", "version": 52, "base_version": 51, "typing": True
+    }
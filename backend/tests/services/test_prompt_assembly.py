@@ -0,0 +1,76 @@
+import pytest
+
+from app.services import prompt_assembly
+from app.services.prompt_assembly import (
+    ConversationSummaryStore,
+    assemble_messages,
+    count_message_tokens,
+)
+
+
+def _history(turns: int):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message number {i} " + "word " * 20}
+        for i in range(turns)
+    ]
+
+
+def test_history_that_fits_is_kept_whole():
+    """Test that a short conversation is sent without a summary."""
+    history = _history(4)
+    user_message = {"role": "user", "content": "and now?"}
+    
+    messages = assemble_messages("You are helpful.", history, 4000, user_message=user_message, conversation_id="fits")
+    
+    assert messages[0] == {"role": "system", "content": "You are helpful."}
+    assert messages[1:-1] == history
+    assert messages[-1] == user_message
+
+
+def test_budget_keeps_newest_turns():
+    """Test that the oldest turns are dropped to stay within the token budget."""
+    history = _history(20)
+    budget = 200
+    
+    messages = assemble_messages("You are helpful.", history, budget, context_block="Business context:\nbakery")
+    
+    assert "Business context:\nbakery" in messages[0]["content"]
+    assert sum(count_message_tokens(message) for message in messages) <= budget
+    assert messages[-1] == history[-1]
+    assert messages[1:] == history[-(len(messages) - 1):]
+
+
+@pytest.mark.asyncio
+async def test_summary_replaces_older_turns(monkeypatch):
+    """Test that older turns are summarized in the background and used by later prompts."""
+    store = ConversationSummaryStore(summary_max_tokens=50, min_turns=2)
+    monkeypatch.setattr(prompt_assembly, "conversation_summaries", store)
+    summarized = []
+    
+    async def mock_summarize_turns(previous_summary, turns, max_tokens):
+        summarized.append(len(turns))
+        return "The user runs a bakery in Lagos."
+    
+    monkeypatch.setattr(prompt_assembly, "summarize_turns", mock_summarize_turns)
+    history = _history(20)
+    
+    # The first prompt is built without waiting for the summary
+    first = assemble_messages("You are helpful.", history, 300, conversation_id="c1", user_id="u1")
+    assert not any("Summary of the earlier conversation" in message["content"] for message in first)
+    await store.flush()
+    
+    assert summarized
+    summary, covered = store.get("u1", "c1")
+    assert summary == "The user runs a bakery in Lagos."
+    assert covered == summarized[0]
+    
+    second = assemble_messages("You are helpful.", history, 300, conversation_id="c1", user_id="u1")
+    assert second[1]["role"] == "system"
+    assert "bakery in Lagos" in second[1]["content"]
+    assert second[-1] == history[-1]
+    assert sum(count_message_tokens(message) for message in second) <= 300
+    
+    # Another user naming the same conversation does not get the summary
+    other = assemble_messages("You are helpful.", history[-2:], 300, conversation_id="c1", user_id="u2")
+    assert not any("bakery in Lagos" in message["content"] for message in other)
+    assert store.get("u2", "c1") == ("", 0)
@@ -0,0 +1,113 @@
+import pytest
+
+from app.schemas.business_context import BusinessContext, BusinessProfile
+from app.schemas.workspace_chat import ChatMessageRequest
+from app.services import workspace_chat_service
+from app.services.semantic_cache import SemanticResponseCache
+
+
+def test_lookup_returns_response_above_threshold():
+    """Test that only queries similar enough to a cached one are hits."""
+    cache = SemanticResponseCache(similarity_threshold=0.9)
+    cache.store("b1", "v1", "best sellers?", [1.0, 0.0, 0.0], "Sourdough", usage={"total_tokens": 120}, latency_ms=800.0)
+    
+    hit = cache.lookup("b1", "v1", [0.99, 0.05, 0.0])
+    assert hit["response"] == "Sourdough"
+    assert hit["similarity"] > 0.9
+    
+    assert cache.lookup("b1", "v1", [0.5, 0.5, 0.0]) is None
+    # Entries are scoped per business
+    assert cache.lookup("b2", "v1", [1.0, 0.0, 0.0]) is None
+    
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["saved_tokens"] == 120
+    assert stats["saved_latency_ms"] == 800.0
+
+
+def test_context_version_change_invalidates_entries():
+    """Test that a newer business context version drops the cached responses."""
+    cache = SemanticResponseCache(similarity_threshold=0.9)
+    cache.store("b1", "v1", "best sellers?", [1.0, 0.0], "Sourdough")
+    cache.store("b1", "v2", "best sellers?", [1.0, 0.0], "Croissants")
+    
+    # A request that read the older context misses and does not replace the newer scope
+    assert cache.lookup("b1", "v1", [1.0, 0.0]) is None
+    cache.store("b1", "v1", "best sellers?", [1.0, 0.0], "Sourdough")
+    assert cache.lookup("b1", "v2", [1.0, 0.0])["response"] == "Croissants"
+    assert cache.stats()["invalidations"] == 1
+    
+    assert cache.lookup("b1", "v3", [1.0, 0.0]) is None
+    assert cache.stats()["invalidations"] == 2
+    
+    cache.store("b1", "v3", "best sellers?", [1.0, 0.0], "Sourdough")
+    assert cache.invalidate("b1")
+    assert cache.stats()["entries"] == 0
+
+
+def test_business_scopes_are_bounded():
+    """Test that only the most recently used max_businesses scopes are kept."""
+    cache = SemanticResponseCache(similarity_threshold=0.9, max_businesses=2)
+    cache.store("b1", "v1", "best sellers?", [1.0, 0.0], "Sourdough")
+    cache.store("b2", "v1", "best sellers?", [1.0, 0.0], "Espresso")
+    assert cache.lookup("b1", "v1", [1.0, 0.0])["response"] == "Sourdough"
+    
+    cache.store("b3", "v1", "best sellers?", [1.0, 0.0], "Bagels")
+    
+    assert cache.lookup("b2", "v1", [1.0, 0.0]) is None
+    assert cache.lookup("b1", "v1", [1.0, 0.0])["response"] == "Sourdough"
+    stats = cache.stats()
+    assert stats["businesses"] == 2
+    assert stats["evicted_businesses"] == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    """Test that each business keeps at most max_entries_per_business entries."""
+    cache = SemanticResponseCache(similarity_threshold=0.9, max_entries_per_business=2)
+    cache.store("b1", "v1", "a", [1.0, 0.0, 0.0], "A")
+    cache.store("b1", "v1", "b", [0.0, 1.0, 0.0], "B")
+    assert cache.lookup("b1", "v1", [1.0, 0.0, 0.0])["response"] == "A"
+    
+    cache.store("b1", "v1", "c", [0.0, 0.0, 1.0], "C")
+    assert cache.lookup("b1", "v1", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("b1", "v1", [1.0, 0.0, 0.0])["response"] == "A"
+    assert cache.stats()["entries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_add_message_reuses_cached_response(monkeypatch):
+    """Test that a near-identical question is answered without another completion."""
+    context = BusinessContext(
+        business_id="b_chat",
+        profile=BusinessProfile(name="Sweet Treats", type="Bakery", description="Artisan sourdough")
+    )
+    completions = []
+    embeddings = {"what are my best selling products": [1.0, 0.0], "top sellers?": [0.98, 0.1]}
+    
+    async def mock_retrieve_similar_chunks(query, chunks, top_k, similarity_threshold, scope):
+        return [(chunks[0], 0.8)]
+    
+    async def mock_generate_embedding(text):
+        return embeddings[text]
+    
+    async def mock_generate_chat_completion(messages, system_prompt=None):
+        completions.append(messages)
+        return {"content": "Sourdough loaves", "usage": {"total_tokens": 150}}
+    
+    monkeypatch.setattr(workspace_chat_service, "retrieve_similar_chunks", mock_retrieve_similar_chunks)
+    monkeypatch.setattr(workspace_chat_service, "generate_embedding", mock_generate_embedding)
+    monkeypatch.setattr(workspace_chat_service, "generate_chat_completion", mock_generate_chat_completion)
+    monkeypatch.setattr(workspace_chat_service, "semantic_cache", SemanticResponseCache(similarity_threshold=0.9))
+    
+    first = await workspace_chat_service.add_message(
+        ChatMessageRequest(content="what are my best selling products", conversation_id="c1"), "u1", [context]
+    )
+    second = await workspace_chat_service.add_message(
+        ChatMessageRequest(content="top sellers?", conversation_id="c2"), "u1", [context]
+    )
+    
+    assert len(completions) == 1
+    assert first.message.metadata["cached"] is False
+    assert second.message.metadata["cached"] is True
+    assert second.message.content == "Sourdough loaves"
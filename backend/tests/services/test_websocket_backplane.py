@@ -0,0 +1,219 @@
+import asyncio
+
+import pytest
+
+from app.services.websocket import ConnectionManager
+from app.services.websocket_backplane import RedisBackplane
+
+
+class FakeWebSocket:
+    """WebSocket stand-in that records the frames sent to it."""
+    def __init__(self):
+        self.sent = []
+    
+    async def accept(self):
+        pass
+    
+    async def send_text(self, text):
+        self.sent.append(text)
+
+
+class FakePipeline:
+    """Queues sorted set commands and applies them on execute."""
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+    
+    def zadd(self, key, mapping):
+        self.commands.append(lambda: self.redis.sorted_sets.setdefault(key, {}).update(mapping))
+    
+    def zrem(self, key, *members):
+        self.commands.append(lambda: [self.redis.sorted_sets.get(key, {}).pop(member, None) for member in members])
+    
+    def zremrangebyscore(self, key, low, high):
+        def remove():
+            members = self.redis.sorted_sets.get(key, {})
+            for member in [member for member, score in members.items() if low <= score <= high]:
+                del members[member]
+        self.commands.append(remove)
+    
+    def expire(self, key, seconds):
+        pass
+    
+    async def execute(self):
+        return [command() for command in self.commands]
+
+
+class FakePubSub:
+    """Subscription of one worker to the fake Redis."""
+    def __init__(self, redis):
+        self.redis = redis
+        self.channels = set()
+        self.messages = asyncio.Queue()
+    
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+    
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+    
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        # asyncio.timeout, unlike wait_for, never swallows a cancellation that races a message
+        try:
+            async with asyncio.timeout(timeout):
+                return await self.messages.get()
+        except TimeoutError:
+            return None
+    
+    async def aclose(self):
+        self.redis.subscribers.remove(self)
+
+
+class FakeRedis:
+    """In-memory stand-in for the Redis commands the backplane uses, shared by several workers."""
+    def __init__(self):
+        self.sorted_sets = {}
+        self.subscribers = []
+        self.published = []
+        self.reads = 0
+    
+    def pubsub(self):
+        subscriber = FakePubSub(self)
+        self.subscribers.append(subscriber)
+        return subscriber
+    
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+    
+    async def zrangebyscore(self, key, low, high):
+        self.reads += 1
+        return [member.encode() for member, score in self.sorted_sets.get(key, {}).items() if score >= low]
+    
+    async def publish(self, channel, data):
+        self.published.append(channel)
+        receivers = [subscriber for subscriber in self.subscribers if channel in subscriber.channels]
+        for subscriber in receivers:
+            subscriber.messages.put_nowait({"type": "message", "channel": channel.encode(), "data": data.encode()})
+        return len(receivers)
+
+
+async def _settle(*managers):
+    """Let the backplane listeners and the connection writers run."""
+    await asyncio.sleep(0.05)
+    for manager in managers:
+        for connection_id in list(manager.active_connections):
+            await manager.drain(connection_id)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_connections_on_other_workers():
+    """Test that a conversation broadcast is relayed to the members held by another worker."""
+    redis = FakeRedis()
+    first, second = ConnectionManager(), ConnectionManager()
+    first_backplane = RedisBackplane(first, redis=redis, worker_id="w1")
+    second_backplane = RedisBackplane(second, redis=redis, worker_id="w2")
+    await first_backplane.start()
+    await second_backplane.start()
+    
+    local, remote = FakeWebSocket(), FakeWebSocket()
+    await first.connect(local, "u1", "c1")
+    remote_id = await second.connect(remote, "u2", "c1")
+    await first_backplane.sync()
+    await second_backplane.sync()
+    # Let the join announcements reach the other worker
+    await _settle(first, second)
+    
+    await first.broadcast_to_conversation({"type": "ping"}, "c1")
+    await second.broadcast_to_user({"type": "direct"}, "u1")
+    await _settle(first, second)
+    
+    assert local.sent == ['{"type":"ping"}', '{"type":"direct"}']
+    assert remote.sent == ['{"type":"ping"}']
+    assert first_backplane.stats()["received"] == 1
+    assert second_backplane.stats()["received"] == 1
+    
+    # Presence follows the connections
+    assert await first_backplane.is_user_online("u2")
+    second.disconnect(remote_id)
+    await second_backplane.sync()
+    assert not await first_backplane.is_user_online("u2")
+    await _settle(first, second)
+    assert not first_backplane.has_remote_workers("user", "u2")
+    
+    await first_backplane.stop()
+    await second_backplane.stop()
+    assert first.backplane is None
+    assert redis.subscribers == []
+    for connection_id in list(first.active_connections):
+        first.disconnect(connection_id)
+
+
+@pytest.mark.asyncio
+async def test_local_only_broadcast_is_not_published():
+    """Test that a broadcast whose recipients are all local skips Redis."""
+    redis = FakeRedis()
+    first, second = ConnectionManager(), ConnectionManager()
+    first_backplane = RedisBackplane(first, redis=redis, worker_id="w1")
+    second_backplane = RedisBackplane(second, redis=redis, worker_id="w2")
+    await first_backplane.start()
+    await second_backplane.start()
+    
+    websocket = FakeWebSocket()
+    await first.connect(websocket, "u1", "c1")
+    await second.connect(FakeWebSocket(), "u2", "c2")
+    await first_backplane.sync()
+    await second_backplane.sync()
+    # Let the join announcements reach the other worker
+    await _settle(first, second)
+    
+    await first.broadcast_to_conversation({"type": "ping"}, "c1")
+    await first.broadcast({"type": "maintenance"})
+    await _settle(first, second)
+    
+    assert websocket.sent == ['{"type":"ping"}', '{"type":"maintenance"}']
+    assert [channel for channel in redis.published if channel != "ws:presence"] == ["ws:all"]
+    assert first_backplane.stats()["local_only"] == 1
+    # The local-only decision comes from the presence view, not a Redis read
+    assert redis.reads == 0
+    # The worker skips its own broadcast when it comes back from Redis
+    assert first_backplane.stats()["received"] == 0
+    assert second_backplane.stats()["received"] == 1
+    
+    await first_backplane.stop()
+    await second_backplane.stop()
+    for manager in (first, second):
+        for connection_id in list(manager.active_connections):
+            manager.disconnect(connection_id)
+
+
+@pytest.mark.asyncio
+async def test_started_worker_learns_presence_of_running_workers():
+    """Test that a worker started later publishes to recipients already held by others."""
+    redis = FakeRedis()
+    first, second = ConnectionManager(), ConnectionManager()
+    first_backplane = RedisBackplane(first, redis=redis, worker_id="w1")
+    second_backplane = RedisBackplane(second, redis=redis, worker_id="w2", heartbeat_seconds=60)
+    await first_backplane.start()
+    
+    websocket = FakeWebSocket()
+    await first.connect(websocket, "u1", "c1")
+    await first_backplane.sync()
+    
+    # w2 missed the join announcement; its hello makes w1 announce again
+    await second_backplane.start()
+    await _settle(first, second)
+    assert second_backplane.has_remote_workers("conversation", "c1")
+    
+    await second.broadcast_to_conversation({"type": "ping"}, "c1")
+    await _settle(first, second)
+    assert websocket.sent == ['{"type":"ping"}']
+    
+    # Leaving is announced too
+    for connection_id in list(first.active_connections):
+        first.disconnect(connection_id)
+    await first_backplane.sync()
+    await _settle(first, second)
+    assert not second_backplane.has_remote_workers("conversation", "c1")
+    
+    await first_backplane.stop()
+    await second_backplane.stop()
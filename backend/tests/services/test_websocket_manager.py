@@ -0,0 +1,181 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from uuid import UUID
+
+import pytest
+
+from app.core import json as core_json
+from app.schemas.onboarding import OnboardingMessage
+from app.services import websocket as websocket_module
+from app.services.websocket import ConnectionManager
+
+
+class FakeWebSocket:
+    """WebSocket stand-in that records the frames sent to it."""
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+        self.close_code = None
+    
+    async def accept(self):
+        pass
+    
+    async def send_text(self, text):
+        await asyncio.sleep(self.delay)
+        self.sent.append(text)
+    
+    async def close(self, code=1000, reason=None):
+        self.close_code = code
+
+
+@pytest.mark.asyncio
+async def test_disconnect_removes_connection_from_every_index():
+    """Test that a disconnect clears the user, conversation and reverse indexes."""
+    manager = ConnectionManager()
+    first = await manager.connect(FakeWebSocket(), "u1", "c1")
+    second = await manager.connect(FakeWebSocket(), "u1", "c1")
+    
+    assert manager.join_conversation(first, "c2")
+    assert manager.get_conversations(first) == {"c1", "c2"}
+    
+    manager.disconnect(first)
+    
+    assert manager.user_connections == {"u1": {second}}
+    assert manager.conversation_connections == {"c1": {second}}
+    assert first not in manager.connection_users
+    assert first not in manager.connection_conversations
+    
+    manager.disconnect(second)
+    manager.disconnect(second)
+    assert manager.user_connections == {}
+    assert manager.conversation_connections == {}
+    assert manager.active_connections == {}
+
+
+@pytest.mark.asyncio
+async def test_join_and_leave_conversations():
+    """Test joining several conversations and broadcasting to each."""
+    manager = ConnectionManager()
+    websocket = FakeWebSocket()
+    connection_id = await manager.connect(websocket, "u1")
+    
+    assert manager.join_conversation(connection_id, "c1")
+    assert not manager.join_conversation(connection_id, "c1")
+    assert manager.join_conversation(connection_id, "c2")
+    assert not manager.join_conversation("unknown", "c1")
+    
+    await manager.broadcast_to_conversation({"n": 1}, "c1")
+    await manager.broadcast_to_conversation({"n": 2}, "c2")
+    await manager.drain(connection_id)
+    assert websocket.sent == ['{"n":1}', '{"n":2}']
+    
+    assert manager.leave_conversation(connection_id, "c1")
+    assert not manager.leave_conversation(connection_id, "c1")
+    assert "c1" not in manager.conversation_connections
+    assert manager.get_conversations(connection_id) == {"c2"}
+    assert manager.get_user_id(connection_id) == "u1"
+    manager.disconnect(connection_id)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_delay_others():
+    """Test that a broadcast returns at once and fast clients are served before a slow one."""
+    manager = ConnectionManager()
+    slow = FakeWebSocket(delay=0.5)
+    fast = FakeWebSocket()
+    slow_id = await manager.connect(slow, "u1", "c1")
+    fast_id = await manager.connect(fast, "u2", "c1")
+    
+    started = asyncio.get_running_loop().time()
+    await manager.broadcast_to_conversation({"type": "ping"}, "c1")
+    await manager.drain(fast_id)
+    
+    assert asyncio.get_running_loop().time() - started < 0.25
+    assert fast.sent == ['{"type":"ping"}']
+    assert slow.sent == []
+    assert manager.queue_depth(slow_id) == 0
+    manager.disconnect(slow_id)
+    manager.disconnect(fast_id)
+
+
+@pytest.mark.asyncio
+async def test_overflow_policies():
+    """Test that a full queue drops messages or disconnects the client, by policy."""
+    dropping = ConnectionManager(send_queue_size=2, overflow_policy="drop")
+    websocket = FakeWebSocket(delay=10)
+    connection_id = await dropping.connect(websocket, "u1")
+    for n in range(5):
+        await dropping.send_personal_message({"n": n}, connection_id)
+    
+    stats = dropping.stats()
+    assert stats["max_queue_depth"] == 2
+    assert stats["dropped_messages"] == 3
+    assert connection_id in dropping.active_connections
+    dropping.disconnect(connection_id)
+    
+    evicting = ConnectionManager(send_queue_size=2, overflow_policy="disconnect")
+    websocket = FakeWebSocket(delay=10)
+    connection_id = await evicting.connect(websocket, "u1", "c1")
+    for n in range(5):
+        await evicting.send_personal_message({"n": n}, connection_id)
+    # The close handshake runs in a task the manager keeps a reference to
+    assert len(evicting.close_tasks) == 1
+    await asyncio.gather(*evicting.close_tasks)
+    await asyncio.sleep(0)
+    
+    assert evicting.close_tasks == set()
+    assert connection_id not in evicting.active_connections
+    assert evicting.conversation_connections == {}
+    assert evicting.stats()["slow_consumer_disconnects"] == 1
+    assert websocket.close_code == 1013
+
+
+@pytest.mark.asyncio
+async def test_broadcast_serializes_once(monkeypatch):
+    """Test that a broadcast encodes the payload once for all recipients."""
+    manager = ConnectionManager()
+    sockets = [FakeWebSocket() for _ in range(5)]
+    connection_ids = [await manager.connect(websocket, f"u{i}", "c1") for i, websocket in enumerate(sockets)]
+    encoded = []
+    
+    def counting_json_dumps(obj):
+        encoded.append(obj)
+        return core_json.json_dumps(obj)
+    
+    monkeypatch.setattr(websocket_module, "json_dumps", counting_json_dumps)
+    
+    message = OnboardingMessage(id="m1", content="Hi", sender="assistant", timestamp=datetime(2024, 1, 2, 3, 4, 5))
+    await manager.broadcast_to_conversation({"type": "assistant_message", "message": message}, "c1")
+    for connection_id in connection_ids:
+        await manager.drain(connection_id)
+        manager.disconnect(connection_id)
+    
+    assert len(encoded) == 1
+    frames = {websocket.sent[0] for websocket in sockets}
+    assert len(frames) == 1
+    assert json.loads(frames.pop())["message"]["timestamp"] == "2024-01-02T03:04:05"
+
+
+@pytest.mark.parametrize("backend", ["default", "json"])
+def test_json_backends_encode_alike(monkeypatch, backend):
+    """Test that both encoder backends handle datetimes, UUIDs and pydantic models."""
+    if backend == "json":
+        monkeypatch.setattr(core_json, "orjson", None)
+    message = OnboardingMessage(id="m1", content="Café", sender="assistant", timestamp=datetime(2024, 1, 2, 3, 4, 5, 600))
+    payload = {"message": message, "id": UUID(int=1), "at": datetime(2024, 1, 2), "tags": {"a"}}
+    
+    decoded = json.loads(core_json.json_dumps(payload))
+    
+    assert decoded["message"] == json.loads(message.model_dump_json())
+    assert decoded["message"]["content"] == "Café"
+    assert decoded["id"] == "00000000-0000-0000-0000-000000000001"
+    assert decoded["at"] == "2024-01-02T00:00:00"
+    assert decoded["tags"] == ["a"]
+    assert json.loads(core_json.json_dumps(message)) == decoded["message"]
+    
+    # Timezone-aware datetimes inside models encode alike at any depth
+    aware = OnboardingMessage(id="m2", content="Hi", sender="assistant", timestamp=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    nested = json.loads(core_json.json_dumps({"message": aware}))["message"]
+    assert nested == json.loads(core_json.json_dumps(aware))
+    assert nested["timestamp"] == "2024-01-01T00:00:00Z"
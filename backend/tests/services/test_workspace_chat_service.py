@@ -0,0 +1,116 @@
+import pytest
+
+from app.core.cache import LRUCache
+from app.schemas.business_context import BusinessContext, BusinessProfile
+from app.schemas.workspace_chat import ChatMessageRequest
+from app.services import workspace_chat_service
+from app.services.semantic_cache import SemanticResponseCache
+
+
+@pytest.fixture
+def chat_context(monkeypatch):
+    """Patch retrieval and embeddings and return a business context to chat about."""
+    context = BusinessContext(
+        business_id="b_stream",
+        profile=BusinessProfile(name="Sweet Treats", type="Bakery", description="Artisan sourdough")
+    )
+    
+    async def mock_retrieve_similar_chunks(query, chunks, top_k, similarity_threshold, scope):
+        return [(chunks[0], 0.8)]
+    
+    async def mock_generate_embedding(text):
+        return [1.0, 0.0]
+    
+    monkeypatch.setattr(workspace_chat_service, "retrieve_similar_chunks", mock_retrieve_similar_chunks)
+    monkeypatch.setattr(workspace_chat_service, "generate_embedding", mock_generate_embedding)
+    monkeypatch.setattr(workspace_chat_service, "semantic_cache", SemanticResponseCache(similarity_threshold=0.9))
+    monkeypatch.setattr(workspace_chat_service, "_conversation_histories", LRUCache())
+    return context
+
+
+@pytest.mark.asyncio
+async def test_stream_message_event_order(monkeypatch, chat_context):
+    """Test that retrieval comes first, then deltas, then the usage of the response."""
+    async def mock_stream_chat_completion(messages, system_prompt=None):
+        yield {"type": "delta", "content": "Focus on "}
+        yield {"type": "delta", "content": "weekend markets."}
+        yield {"type": "done", "content": "Focus on weekend markets.", "usage": {"total_tokens": 90}}
+    
+    monkeypatch.setattr(workspace_chat_service, "stream_chat_completion", mock_stream_chat_completion)
+    request = ChatMessageRequest(content="how do I grow sales", conversation_id="c1")
+    
+    events = [event async for event in workspace_chat_service.stream_message(request, "u1", [chat_context])]
+    
+    assert [event["type"] for event in events] == ["retrieval", "assistant_delta", "assistant_delta", "assistant_done"]
+    assert events[0]["business_id"] == "b_stream"
+    assert events[0]["chunks"][0]["similarity"] == 0.8
+    assert [event["sequence"] for event in events[1:3]] == [0, 1]
+    assert len({event["message_id"] for event in events}) == 1
+    assert events[-1]["usage"] == {"total_tokens": 90}
+    assert workspace_chat_service.semantic_cache.stats()["stores"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_stream_closes_upstream_and_is_not_cached(monkeypatch, chat_context):
+    """Test that closing the stream early aborts generation without caching the partial answer."""
+    upstream = {"closed": False}
+    
+    async def mock_stream_chat_completion(messages, system_prompt=None):
+        try:
+            yield {"type": "delta", "content": "Focus on "}
+            yield {"type": "delta", "content": "weekend markets."}
+            yield {"type": "done", "content": "Focus on weekend markets.", "usage": {"total_tokens": 90}}
+        finally:
+            upstream["closed"] = True
+    
+    monkeypatch.setattr(workspace_chat_service, "stream_chat_completion", mock_stream_chat_completion)
+    request = ChatMessageRequest(content="how do I grow sales", conversation_id="c1")
+    
+    events = workspace_chat_service.stream_message(request, "u1", [chat_context])
+    async for event in events:
+        if event["type"] == "assistant_delta":
+            break
+    await events.aclose()
+    
+    assert upstream["closed"]
+    assert workspace_chat_service.semantic_cache.stats()["stores"] == 0
+
+
+@pytest.mark.asyncio
+async def test_follow_ups_do_not_share_cached_answers(monkeypatch, chat_context):
+    """Test that conversations with different history neither share nor store answers."""
+    prompts = []
+    
+    async def mock_stream_chat_completion(messages, system_prompt=None):
+        prompts.append(messages)
+        answer = f"Answer {len(prompts)}"
+        yield {"type": "done", "content": answer, "usage": {"total_tokens": 10}}
+    
+    async def mock_generate_embedding(text):
+        # Every follow-up embeds the same, so only the history tells them apart
+        return {"which products sell best": [1.0, 0.0], "how do I price bread": [0.0, 1.0]}.get(text, [0.6, 0.8])
+    
+    monkeypatch.setattr(workspace_chat_service, "stream_chat_completion", mock_stream_chat_completion)
+    monkeypatch.setattr(workspace_chat_service, "generate_embedding", mock_generate_embedding)
+    
+    async def ask(user_id, conversation_id, content):
+        request = ChatMessageRequest(content=content, conversation_id=conversation_id)
+        events = [event async for event in workspace_chat_service.stream_message(request, user_id, [chat_context])]
+        return events[-1]
+    
+    await ask("u1", "c1", "which products sell best")
+    await ask("u2", "c2", "how do I price bread")
+    assert workspace_chat_service.semantic_cache.stats()["stores"] == 2
+    
+    # The same follow-up in both conversations is answered from each one's history
+    first = await ask("u1", "c1", "tell me more")
+    second = await ask("u2", "c2", "tell me more")
+    
+    assert not first["cached"] and not second["cached"]
+    assert workspace_chat_service.semantic_cache.stats()["stores"] == 2
+    assert "which products sell best" in str(prompts[2])
+    assert "how do I price bread" in str(prompts[3])
+    
+    # Another user naming the conversation does not see its history
+    await ask("u2", "c1", "what did I ask before?")
+    assert "which products sell best" not in str(prompts[4])